@@ -0,0 +1,94 @@
+# coding=utf-8
+"""
+Time the constructors of the contexts which still read their directives with regular expressions
+
+    python -m benchmarks.constructors --repeat 5 --output constructors.json
+    python -m benchmarks.constructors --compare constructors.json
+"""
+import argparse
+import json
+import platform
+import sys
+
+from benchmarks.generators import make_upstreams_conf
+from benchmarks.stages import compare, git_commit, timed
+from services_spec_generator.nginx_conf_parser.events_context import EventContext
+from services_spec_generator.nginx_conf_parser.main_context import MainContext
+from services_spec_generator.nginx_conf_parser.stream_context import StreamContext
+from services_spec_generator.nginx_conf_parser.upstream_context import UpstreamContext
+from services_spec_generator.nginx_conf_parser.utils import extract_context
+
+MAIN_CONF = """
+user www-data www-data;
+worker_processes 4;
+worker_rlimit_nofile 65535;
+pid /run/nginx.pid;
+error_log /var/log/nginx/error.log warn;
+env TZ;
+thread_pool default threads=32 max_queue=65536;
+"""
+
+EVENTS_CONF = """
+events {
+    worker_connections 4096;
+    multi_accept on;
+    use epoll;
+    accept_mutex off;
+}
+"""
+
+UPSTREAM_CONF = """
+    # git: https://gitlab.yourltd.com/team/backend
+    zone backend 64k;
+    hash $request_uri consistent;
+    keepalive 16;
+    server 10.0.0.1:8000 weight=5 max_fails=3 fail_timeout=30s;
+    server 10.0.0.2:8000 max_conns=100;
+    server backup.yourltd.com:8000 backup;
+    sticky cookie srv_id expires=1h domain=.example.com path=/;
+"""
+
+
+def run_constructors(contexts=1000, repeat=3):
+    """Return the timings of building ``contexts`` contexts of every kind, keyed by context"""
+    stream_conf = 'stream {{\n{0}}}\n'.format(make_upstreams_conf(10, 100))
+    events_block = extract_context(EVENTS_CONF, 'events')
+
+    constructors = [
+        ('upstream_context', lambda: UpstreamContext('backend', UPSTREAM_CONF)),
+        ('main_context', lambda: MainContext().load(MAIN_CONF)),
+        ('events_context', lambda: EventContext(events_block)),
+        ('stream_context', lambda: StreamContext().load(stream_conf)),
+    ]
+
+    results = {}
+    for name, constructor in constructors:
+        results[name] = timed(lambda: [constructor() for _ in range(contexts)], repeat)
+        results[name]['contexts'] = contexts
+    return results
+
+
+def main():
+    ap = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter)
+    ap.add_argument('--contexts', type=int, default=1000, help='contexts built per run')
+    ap.add_argument('--repeat', type=int, default=3)
+    ap.add_argument('--output', default=None, help='JSON file to write the results to, stdout by default')
+    ap.add_argument('--compare', default=None, help='JSON file of a previous run to compare the results with')
+    args = ap.parse_args()
+
+    result = dict(commit=git_commit(), python=platform.python_version(), params=dict(contexts=args.contexts),
+                  stages=run_constructors(args.contexts, args.repeat))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(result, output, indent=2)
+    else:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as previous:
+            compare(json.load(previous), result)
+
+
+if __name__ == '__main__':
+    main()
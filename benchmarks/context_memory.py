@@ -0,0 +1,56 @@
+# coding=utf-8
+"""
+Memory retained by the server and location contexts of a synthetic configuration
+
+    python -m benchmarks.context_memory --servers 1000 --locations 10
+"""
+import argparse
+import gc
+import json
+import tracemalloc
+
+from benchmarks.generators import make_servers_conf
+from services_spec_generator.nginx_conf_parser.location_context import LocationContext
+from services_spec_generator.nginx_conf_parser.server_context import ServerContext
+from services_spec_generator.nginx_conf_parser.tokenizer import parse
+
+
+def retained(factory):
+    """Return the result of factory and the bytes allocated by it which are still alive"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = factory()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def measure(servers, locations):
+    server_nodes = parse(make_servers_conf(servers, locations)).children
+    location_nodes = [_ for node in server_nodes for _ in node.children if _.name == 'location']
+
+    _, location_bytes = retained(lambda: [LocationContext(_) for _ in location_nodes])
+    _, server_bytes = retained(lambda: [ServerContext(_) for _ in server_nodes])
+
+    return dict(
+        servers=servers,
+        locations=len(location_nodes),
+        bytes_per_location=round(location_bytes / len(location_nodes)),
+        # a server context holds its locations, count them out
+        bytes_per_server=round((server_bytes - location_bytes) / servers),
+    )
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--servers', type=int, default=1000)
+    ap.add_argument('--locations', type=int, default=10, help='locations per server')
+    args = ap.parse_args()
+
+    print(json.dumps(measure(args.servers, args.locations), indent=2))
+
+
+if __name__ == '__main__':
+    main()
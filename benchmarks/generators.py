@@ -0,0 +1,103 @@
+# coding=utf-8
+"""
+Synthetic nginx confs and bind zones shaped like the puppet tree the services table is built from
+"""
+import os
+import random
+
+
+def make_host_name(index):
+    return '{0}-app{1}'.format(('d', 'work', 'stage', 'prod')[index % 4], index)
+
+
+def make_ip(index):
+    return '10.{0}.{1}.{2}'.format(index // 65536 % 256, index // 256 % 256, index % 256)
+
+
+def make_servers_conf(servers, locations, upstreams=10, first_server=0, include=None):
+    """Return ``servers`` server blocks of ``locations`` locations proxied to ``upstreams`` upstreams"""
+    lines = []
+    for server in range(first_server, first_server + servers):
+        lines.append('server {')
+        lines.append('    listen {0};'.format(80 if server % 2 else 443))
+        lines.append('    server_name s{0}.example.com www.s{0}.example.com;'.format(server))
+        lines.append('    client_max_body_size 10m;')
+        lines.append('    keepalive_timeout 65 20;')
+        lines.append('    error_page 500 502 503 504 /50x.html;')
+        lines.append('    resolver 10.0.0.53 valid=30s;')
+        for location in range(locations):
+            lines.append('    location /l{0} {{'.format(location))
+            lines.append('        client_body_temp_path /var/cache/nginx/body 1 2;')
+            lines.append('        open_file_cache max=1000 inactive=20s;')
+            lines.append('        auth_jwt "closed site" token=$cookie_auth;')
+            if include:
+                lines.append('        include {0};'.format(include))
+            else:
+                lines.append('        proxy_set_header Host $host;')
+            lines.append('        proxy_pass http://backend{0};'.format((server + location) % upstreams))
+            lines.append('    }')
+        lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+
+def make_upstreams_conf(upstreams, zone_hosts, servers_per_upstream=3, seed=0):
+    """Return ``upstreams`` upstream blocks, their servers are hosts of the zone or plain addresses"""
+    rnd = random.Random(seed)
+    lines = []
+    for upstream in range(upstreams):
+        lines.append('upstream backend{0} {{'.format(upstream))
+        lines.append('    keepalive 16;')
+        for port in range(servers_per_upstream):
+            host = rnd.randrange(zone_hosts)
+            address = make_ip(host) if rnd.random() < 0.2 else make_host_name(host) + '.yourltd.com'
+            lines.append('    server {0}:{1} max_fails=3;'.format(address, 8000 + port))
+        lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+
+def make_bind_zone(hosts):
+    lines = ['$TTL 86400',
+             '@       IN      SOA     ns1.yourltd.com. admin.yourltd.com. (',
+             '                        2020010101 3600 600 86400 3600 )',
+             '        IN      NS      ns1']
+    for host in range(hosts):
+        lines.append('{0:<24}IN      A       {1}'.format(make_host_name(host), make_ip(host)))
+    return '\n'.join(lines) + '\n'
+
+
+def write_host(directory, upstreams=100, servers=200, locations=10, servers_per_file=10, zone_hosts=1000,
+               include_depth=2):
+    """
+    Write a host directory (conf.d/backends.conf, sites-available/*.conf, snippets/*.conf) and its bind zone,
+    locations include a chain of include_depth snippets.
+    Returns the upstreams conf path, the sites-available mask and the zone path
+    """
+    for name in ('conf.d', 'sites-available', 'snippets'):
+        os.makedirs(os.path.join(directory, name), exist_ok=True)
+
+    upstreams_path = os.path.join(directory, 'conf.d', 'backends.conf')
+    _write(upstreams_path, make_upstreams_conf(upstreams, zone_hosts))
+
+    include = None
+    for depth in range(include_depth):
+        snippet_path = os.path.join(directory, 'snippets', 'proxy{0}.conf'.format(depth))
+        content = 'proxy_set_header X-Depth-{0} $host;\n'.format(depth)
+        if include:
+            content += 'include {0};\n'.format(include)
+        _write(snippet_path, content)
+        include = snippet_path
+
+    for first_server in range(0, servers, servers_per_file):
+        _write(os.path.join(directory, 'sites-available', 'site{0}.conf'.format(first_server)),
+               make_servers_conf(min(servers_per_file, servers - first_server), locations, upstreams, first_server,
+                                 include))
+
+    zone_path = os.path.join(directory, 'yourltd.com')
+    _write(zone_path, make_bind_zone(zone_hosts))
+
+    return upstreams_path, os.path.join(directory, 'sites-available', '*.conf'), zone_path
+
+
+def _write(path, content):
+    with open(path, 'w', encoding='utf-8') as _file:
+        _file.write(content)
@@ -0,0 +1,130 @@
+# coding=utf-8
+"""
+Load test a local query service on a synthetic host: clients send requests over kept alive connections
+
+    python -m benchmarks.query_service --clients 50 --requests 200 --output query_service.json
+    python -m benchmarks.query_service --url http://127.0.0.1:8080 --clients 50
+"""
+import argparse
+import asyncio
+import json
+import platform
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+from benchmarks.generators import make_host_name, write_host
+from benchmarks.stages import git_commit
+from services_spec_generator.parse_conf import IncrementalParser
+from services_spec_generator.query_service import QueryService
+
+
+def make_targets(servers, upstreams, zone_hosts, count):
+    """Return count request targets spread over every kind of query"""
+    targets = []
+    for index in range(count):
+        kind = index % 4
+        if kind == 0:
+            targets.append('/rows?domain=s{0}.example.com'.format(index % servers))
+        elif kind == 1:
+            targets.append('/rows?upstream=backend{0}'.format(index % upstreams))
+        elif kind == 2:
+            targets.append('/rows?host={0}'.format(make_host_name(index % zone_hosts)))
+        else:
+            targets.append('/route?host=www.s{0}.example.com&path=/l1/x&port={1}'.format(
+                index % servers, 80 if index % servers % 2 else 443))
+    return targets
+
+
+async def _client(host, port, targets, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for target in targets:
+            start = time.perf_counter()
+            writer.write('GET {0} HTTP/1.1\r\nHost: {1}\r\n\r\n'.format(target, host).encode('ascii'))
+            await reader.readline()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':', 1)[1])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+
+async def load(host, port, targets, clients):
+    """Return the latency of every request sent by clients connections taking the targets in turn"""
+    latencies = []
+    await asyncio.gather(*[_client(host, port, targets[_::clients], latencies) for _ in range(clients)])
+    return latencies
+
+
+def summary(latencies, seconds):
+    latencies = sorted(latencies)
+    return dict(requests=len(latencies), seconds=seconds,
+                requests_per_second=len(latencies) / seconds if seconds else None,
+                p50=latencies[len(latencies) // 2], p99=latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)])
+
+
+def run_query_service(directory, clients=10, requests=100, url=None, **params):
+    """
+    Generate a host into directory, serve it on a free local port and return the load test summary;
+    with url the running service at url is tested instead
+    """
+    params = dict(dict(upstreams=100, servers=200, locations=10, zone_hosts=1000), **params)
+    targets = make_targets(params['servers'], params['upstreams'], params['zone_hosts'], clients * requests)
+
+    async def run():
+        if url is not None:
+            address = urlsplit(url)
+            host, port, server = address.hostname, address.port or 80, None
+        else:
+            upstreams_path, sites_mask, zone_path = write_host(directory, **params)
+            service = QueryService(IncrementalParser(upstreams_path, sites_mask, zone_path))
+            server = await service.start('127.0.0.1', 0)
+            host, port = server.sockets[0].getsockname()[:2]
+        try:
+            start = time.perf_counter()
+            latencies = await load(host, port, targets, clients)
+            return summary(latencies, time.perf_counter() - start)
+        finally:
+            if server is not None:
+                server.close()
+                await server.wait_closed()
+
+    return asyncio.run(run())
+
+
+def main():
+    ap = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter)
+    ap.add_argument('--clients', type=int, default=10, help='concurrent connections')
+    ap.add_argument('--requests', type=int, default=100, help='requests per connection')
+    ap.add_argument('--url', default=None, help='url of a running service, a synthetic host is served by default')
+    ap.add_argument('--upstreams', type=int, default=100)
+    ap.add_argument('--servers', type=int, default=200)
+    ap.add_argument('--locations', type=int, default=10, help='locations per server')
+    ap.add_argument('--zone_hosts', type=int, default=1000)
+    ap.add_argument('--output', default=None, help='JSON file to write the results to, stdout by default')
+    args = ap.parse_args()
+
+    params = dict(upstreams=args.upstreams, servers=args.servers, locations=args.locations, zone_hosts=args.zone_hosts)
+    with tempfile.TemporaryDirectory() as directory:
+        load_test = run_query_service(directory, args.clients, args.requests, args.url, **params)
+
+    result = dict(commit=git_commit(), python=platform.python_version(),
+                  params=dict(params, clients=args.clients, requests=args.requests, url=args.url), load=load_test)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(result, output, indent=2)
+    else:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+# coding=utf-8
+"""
+Time every stage of building the services table on a synthetic host, results are written as JSON
+
+    python -m benchmarks.stages --servers 500 --locations 10 --output bench.json
+    python -m benchmarks.stages --compare bench.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.generators import write_host
+from services_spec_generator import parse_conf
+from services_spec_generator.nginx_conf_parser.http_context import HttpContext
+from services_spec_generator.nginx_conf_parser.location_context import LocationContext
+from services_spec_generator.nginx_conf_parser.server_context import ServerContext
+from services_spec_generator.nginx_config_merge import NginxMergedDumper
+from services_spec_generator.reports import make_reports
+
+
+def timed(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return dict(best=min(times), mean=sum(times) / len(times), runs=repeat)
+
+
+def run_stages(directory, repeat=3, **params):
+    """Generate a host into directory and return the timings of every stage, keyed by stage name"""
+    upstreams_path, sites_mask, zone_path = write_host(directory, **params)
+    nginx_conf_path = os.path.join(directory, 'nginx.conf')
+    with open(nginx_conf_path, 'w', encoding='utf-8') as nginx_conf:
+        nginx_conf.write('http {{\n    include {0};\n    include {1};\n}}\n'.format(upstreams_path, sites_mask))
+
+    http_tree = parse_conf.make_http_tree(upstreams_path, sites_mask)
+    server_nodes = [_ for _ in http_tree.children if _.name == 'server']
+    location_nodes = [_ for node in server_nodes for _ in node.children if _.name == 'location']
+    table = parse_conf.parse_server(upstreams_path, sites_mask, zone_path)
+
+    stages = [
+        ('nginx_merged_dumper', lambda: NginxMergedDumper(nginx_conf_path).as_string()),
+        ('include_resolver', lambda: parse_conf.make_http_tree(upstreams_path, sites_mask)),
+        ('http_context', lambda: HttpContext(http_tree)),
+        ('server_context', lambda: [ServerContext(_) for _ in server_nodes]),
+        ('location_context', lambda: [LocationContext(_) for _ in location_nodes]),
+        ('get_hosts_ips', lambda: parse_conf.get_hosts_ips(zone_path)),
+        ('parse_server', lambda: parse_conf.parse_server(upstreams_path, sites_mask, zone_path)),
+        ('console_print', lambda: parse_conf.ConsolePrint.print_table(table)),
+        ('csv_print', lambda: parse_conf.FileCSVPrint.print_table(table)),
+        ('html_print', lambda: parse_conf.HtmlPrint.print_table(table)),
+        ('reports', lambda: make_reports(table)),
+        ('stream_print', lambda: parse_conf.print_services_rows(
+            parse_conf.parse_server_rows(upstreams_path, sites_mask, zone_path), ('csv', 'json_lines'))),
+    ]
+
+    results = {}
+    cwd = os.getcwd()
+    # the printers write to the working directory and to stdout
+    os.chdir(directory)
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            for name, func in stages:
+                results[name] = timed(func, repeat)
+    finally:
+        os.chdir(cwd)
+
+    results['parse_server']['rows'] = len(table.rows)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous, current):
+    """Print the best time of every stage next to the previous run"""
+    print('{0:<22}{1:>12}{2:>12}{3:>9}'.format('stage', 'previous', 'current', 'ratio'))
+    for name, timing in current['stages'].items():
+        before = previous['stages'].get(name)
+        if before is None:
+            print('{0:<22}{1:>12}{2:>12.4f}'.format(name, '-', timing['best']))
+        else:
+            print('{0:<22}{1:>12.4f}{2:>12.4f}{3:>9.2f}'.format(name, before['best'], timing['best'],
+                                                                timing['best'] / before['best']))
+
+
+def main():
+    ap = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter)
+    ap.add_argument('--upstreams', type=int, default=100)
+    ap.add_argument('--servers', type=int, default=200)
+    ap.add_argument('--locations', type=int, default=10, help='locations per server')
+    ap.add_argument('--servers_per_file', type=int, default=10)
+    ap.add_argument('--include_depth', type=int, default=2, help='nested includes of every location')
+    ap.add_argument('--zone_hosts', type=int, default=10000)
+    ap.add_argument('--repeat', type=int, default=3)
+    ap.add_argument('--output', default=None, help='JSON file to write the results to, stdout by default')
+    ap.add_argument('--compare', default=None, help='JSON file of a previous run to compare the results with')
+    args = ap.parse_args()
+
+    params = dict(upstreams=args.upstreams, servers=args.servers, locations=args.locations,
+                  servers_per_file=args.servers_per_file, include_depth=args.include_depth,
+                  zone_hosts=args.zone_hosts)
+    with tempfile.TemporaryDirectory() as directory:
+        stages = run_stages(directory, args.repeat, **params)
+
+    result = dict(commit=git_commit(), python=platform.python_version(), params=params, stages=stages)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(result, output, indent=2)
+    else:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as previous:
+            compare(json.load(previous), result)
+
+
+if __name__ == '__main__':
+    main()
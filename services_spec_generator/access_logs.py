@@ -0,0 +1,303 @@
+# coding=utf-8
+"""
+Correlate nginx access logs with the parsed confs: every request is mapped to the server, location, upstream
+and service which handled it, and the requests and bytes sent are summed per service row
+
+    correlate-access-logs --upstreams_conf_file_path=... --sites_available_conf_files_path=... \\
+        --bind_zones_file_location=... --access_logs '/var/log/nginx/access.log*'
+"""
+import argparse
+import csv
+import glob
+import gzip
+import mmap
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from services_spec_generator import parse_conf
+from services_spec_generator.nginx_conf_parser.http_context import HttpContext
+from services_spec_generator.nginx_conf_parser.location_matcher import LocationMatcher, normalize_uri
+from services_spec_generator.nginx_conf_parser.server_name_index import ServerNameIndex
+
+# the combined log format, optionally followed by a quoted $host as many log formats add it, the groups are
+# the request path without arguments, the bytes sent and the host; nginx writes a quote in a field as \x22.
+# A line in any other format matches the second branch and has empty groups
+LOG_LINE = re.compile(
+    rb'^(?:\S+ \S+ \S+ \[[^\]\n]*\] "[A-Z]+ ([^ "?\n]+)[^"\n]*" \d{3} (\d+|-)'
+    rb'(?: "[^"\n]*" "[^"\n]*"(?: "([^"\n]*)")?)?[^\n]*|[^\n]+)',
+    re.MULTILINE)
+
+TRAFFIC_HEADER = ['domain', 'service_name', 'service_git_url', 'upstream', 'location', 'requests', 'bytes']
+
+CHUNK_SIZE = 64 * 1024 * 1024
+COUNT_WINDOW = 1024 * 1024
+# distinct (host, path) pairs kept with their keys, the cache is emptied when it is full
+KEYS_CACHE_SIZE = 1 << 16
+
+
+class AccessLogCorrelator:
+    """
+    Maps requests to the key of the service rows which handled them:
+    (domain, service_name, service_git_url, upstream, location).
+
+    The server is found by the Host header as nginx does and its primary name is the domain, as in $server_name.
+    A combined log does not tell the backend a request went to, so the key stops at the upstream.
+    The fields past the last one the request reached are None, e.g. a location which is not proxied
+    has no upstream and a request no server listens for has no domain.
+    """
+    def __init__(self, server_index, upstream_index, port=80, address=None, default_host=''):
+        self.server_index = server_index
+        self.upstream_index = upstream_index
+        self.port = port
+        self.address = address
+        self.default_host = default_host
+        self._matchers = {}
+        self._keys = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_matchers'] = {}
+        state['_keys'] = {}
+        return state
+
+    @staticmethod
+    def from_http(http_context, map_ips, map_host, **kwargs):
+        """Return the correlator of the http context, the upstreams are resolved before it is sent to workers"""
+        upstream_index = parse_conf.UpstreamIndex.from_upstreams(http_context.upstreams, map_ips, map_host)
+        parse_conf.fetch_git_projects_details(_.git_project for _ in http_context.upstreams)
+        for name in upstream_index.upstreams_map:
+            upstream_index.backends(name)
+        return AccessLogCorrelator(ServerNameIndex.from_http(http_context), upstream_index, **kwargs)
+
+    def key(self, host, target):
+        """Return the key of a request to the target with the Host header"""
+        if target.startswith(('http://', 'https://')):
+            # the host of an absolute request line wins over the header
+            host = target.split('://', 1)[1].split('/', 1)[0]
+        elif not host or host == '-':
+            host = self.default_host
+
+        server = self.server_index.resolve(host, self.port, self.address)
+        if server is None:
+            return None, None, None, None, None
+        domain = server.server_name[0] if isinstance(server.server_name, list) else server.server_name
+
+        matcher = self._matchers.get(server)
+        if matcher is None:
+            matcher = self._matchers[server] = LocationMatcher.from_server(server)
+        location = matcher.match(normalize_uri(target))
+        if location is None:
+            return domain, None, None, None, None
+        if location.proxy_pass is None or location.proxy_pass_upstream is None:
+            return domain, None, None, None, location.path
+
+        if location.proxy_pass_upstream not in self.upstream_index.upstreams_map:
+            # proxied to an address directly, there is no service behind it
+            return domain, None, None, location.proxy_pass_upstream, location.path
+
+        backends = self.upstream_index.backends(location.proxy_pass_upstream)
+        service_name, service_git_url = backends[0][:2] if backends else (None, None)
+        return domain, service_name, service_git_url, location.proxy_pass_upstream, location.path
+
+    def count(self, data, traffic, pos=0, endpos=None):
+        """
+        Add the requests and bytes of the log lines in data[pos:endpos] to traffic, key -> [requests, bytes].
+        Returns the number of lines and of lines skipped as not in the log format
+        """
+        endpos = len(data) if endpos is None else endpos
+        lines = skipped = 0
+        while pos < endpos:
+            # the lines of a window are matched at once, the matches of a whole chunk would take too much memory
+            window_end = data.find(b'\n', min(pos + COUNT_WINDOW, endpos) - 1, endpos) + 1 or endpos
+            window_lines, window_skipped = self._count_window(data, traffic, pos, window_end)
+            lines += window_lines
+            skipped += window_skipped
+            pos = window_end
+        return lines, skipped
+
+    def _count_window(self, data, traffic, pos, endpos):
+        keys = self._keys
+        skipped = 0
+        matches = LOG_LINE.findall(data, pos, endpos)
+        for path, sent, host in matches:
+            if not path:
+                skipped += 1
+                continue
+            key = keys.get((host, path))
+            if key is None:
+                if len(keys) >= KEYS_CACHE_SIZE:
+                    keys.clear()
+                key = keys[host, path] = self.key(host.decode('utf-8', 'replace'),
+                                                  path.decode('utf-8', 'replace'))
+            totals = traffic.get(key)
+            if totals is None:
+                totals = traffic[key] = [0, 0]
+            totals[0] += 1
+            if sent != b'-':
+                totals[1] += int(sent)
+        return len(matches), skipped
+
+
+def split_chunks(paths, chunk_size=CHUNK_SIZE):
+    """
+    Yield the (path, start, end) chunks of the log files, plain files are split at the first line end
+    after every chunk_size bytes, a gzipped file is one chunk with no end
+    """
+    for path in paths:
+        if path.endswith('.gz'):
+            yield path, 0, None
+            continue
+        size = os.path.getsize(path)
+        if size == 0:
+            continue
+        with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            start = 0
+            while start < size:
+                end = data.find(b'\n', min(start + chunk_size, size) - 1) + 1 or size
+                yield path, start, end
+                start = end
+
+
+def count_chunk(correlator, path, start, end, chunk_size=CHUNK_SIZE):
+    """Return the traffic, lines and skipped lines of a chunk, plain files are read through mmap without copies"""
+    traffic = {}
+    lines = skipped = 0
+    if end is None:
+        with gzip.open(path, 'rb') as file:
+            rest = b''
+            while True:
+                block = file.read(chunk_size)
+                if not block:
+                    break
+                block = rest + block
+                cut = block.rfind(b'\n') + 1
+                rest = block[cut:]
+                block_lines, block_skipped = correlator.count(block, traffic, 0, cut)
+                lines += block_lines
+                skipped += block_skipped
+            rest_lines, rest_skipped = correlator.count(rest, traffic)
+        return traffic, lines + rest_lines, skipped + rest_skipped
+
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        lines, skipped = correlator.count(data, traffic, start, end)
+    return traffic, lines, skipped
+
+
+def merge_traffic(traffic, other):
+    for key, (requests, sent) in other.items():
+        totals = traffic.get(key)
+        if totals is None:
+            traffic[key] = [requests, sent]
+        else:
+            totals[0] += requests
+            totals[1] += sent
+    return traffic
+
+
+# correlator of an access log worker process, sent once per process instead of once per chunk
+_worker_correlator = None
+
+
+def _init_access_log_worker(correlator):
+    global _worker_correlator
+    _worker_correlator = correlator
+
+
+def _count_worker_chunk(path, start, end, chunk_size):
+    return count_chunk(_worker_correlator, path, start, end, chunk_size)
+
+
+def correlate_access_logs(correlator, paths, max_workers=None, chunk_size=CHUNK_SIZE):
+    """
+    Return the traffic of the log files, key -> [requests, bytes], with the number of lines and skipped lines.
+    The chunks are counted in a process pool and merged as they are done, one worker counts in this process
+    """
+    chunks = list(split_chunks(paths, chunk_size))
+    traffic = {}
+    lines = skipped = 0
+    if max_workers == 1 or len(chunks) <= 1:
+        results = (count_chunk(correlator, path, start, end, chunk_size) for path, start, end in chunks)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_access_log_worker,
+                                       initargs=(correlator,))
+        results = executor.map(_count_worker_chunk, *zip(*chunks), [chunk_size] * len(chunks))
+    try:
+        for chunk_traffic, chunk_lines, chunk_skipped in results:
+            merge_traffic(traffic, chunk_traffic)
+            lines += chunk_lines
+            skipped += chunk_skipped
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return traffic, lines, skipped
+
+
+def write_traffic(traffic, file_name='services_traffic.csv'):
+    """Write the traffic of every key to a csv file, the busiest first"""
+    with open(file_name, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.writer(file, lineterminator='\n')
+        writer.writerow(TRAFFIC_HEADER)
+        for key, (requests, sent) in sorted(traffic.items(), key=lambda _: (-_[1][0], [str(__) for __ in _[0]])):
+            writer.writerow(list(key) + [requests, sent])
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter)
+
+    ap.add_argument('--upstreams_conf_file_path', required=True,
+                    help='Upstreams conf file; Examples:\n'
+                         "  --upstreams_conf_file_path='./puppet/modules/profile/files/nginx/host_d-ngx1.yourltd.com/conf.d/backends.conf'"
+                    )
+    ap.add_argument('--sites_available_conf_files_path', required=True,
+                    help='Examples:\n'
+                         "  --sites_available_conf_files_path='./puppet/modules/profile/files/nginx/host_d-ngx1.yourltd.com/sites-available/*.conf'"
+                    )
+    ap.add_argument('--bind_zones_file_location', required=True,
+                    help='Examples:\n'
+                         "  --bind_zones_file_location='./puppet/modules/profile/files/bind9/zones/yourltd.com'"
+                    )
+    ap.add_argument('--access_logs', nargs='+', required=True,
+                    help='Globs of access logs in the combined format, *.gz files are read gzipped; Examples:\n'
+                         "  --access_logs '/var/log/nginx/access.log*'"
+                    )
+    ap.add_argument('--port', type=int, default=80,
+                    help='Port the logged requests were sent to; Default: %(default)s'
+                    )
+    ap.add_argument('--address', default=None,
+                    help='Address the logged requests were sent to, any address by default'
+                    )
+    ap.add_argument('--default_host', default='',
+                    help='Host of the requests logged without one, e.g. the domain of a per-server access log'
+                    )
+    ap.add_argument('--max_workers', type=int, default=None,
+                    help='Number of worker processes; Default: number of processors'
+                    )
+    ap.add_argument('--chunk_size', type=int, default=CHUNK_SIZE,
+                    help='Bytes of a plain log counted by one worker at a time; Default: %(default)s'
+                    )
+    ap.add_argument('--output_file', default='services_traffic.csv',
+                    help='Default: %(default)s'
+                    )
+
+    args = ap.parse_args()
+
+    return args
+
+
+def main():
+    args = parse_args()
+    http_tree = parse_conf.make_http_tree(args.upstreams_conf_file_path, args.sites_available_conf_files_path)
+    map_ips, map_host = parse_conf.get_hosts_ips(args.bind_zones_file_location)
+    correlator = AccessLogCorrelator.from_http(HttpContext(http_tree), map_ips, map_host, port=args.port,
+                                               address=args.address, default_host=args.default_host)
+
+    paths = sorted({path for pattern in args.access_logs for path in glob.glob(pattern) if os.path.isfile(path)})
+    traffic, lines, skipped = correlate_access_logs(correlator, paths, args.max_workers, args.chunk_size)
+    write_traffic(traffic, args.output_file)
+    print(f'{lines} lines, {skipped} skipped, {len(traffic)} rows written to {args.output_file}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+# coding=utf-8
+import os
+import pickle
+import re
+from array import array
+from collections.abc import Mapping
+
+# a quoted string, a comment, a parenthesis or a bare word
+_ZONE_TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|;[^\n]*|[()]|[^\s;()"]+')
+# owner [ttl] [class] type rdata on a single line, the bulk of a zone file
+_SIMPLE_RECORD = re.compile(r'([^\s;()"$][^\s;()"]*)[ \t]+((?:(?:\d\w*|IN|CH|HS|CS)[ \t]+){0,2})'
+                            r'([A-Za-z][A-Za-z0-9]*)[ \t]+([^\s;()"]+)\s*(?:;[^\n]*)?$')
+_TTL = re.compile(r'\d+[smhdwSMHDW]?(?:\d+[smhdwSMHDW])*$')
+_CLASSES = {'IN', 'CH', 'HS', 'CS'}
+
+
+def read_zone_records(path, origin=None):
+    """Yield ``(owner, type, rdata)`` for every record of a bind zone file, one line at a time.
+
+    ``$ORIGIN`` and ``$INCLUDE`` are followed, records split over several lines by parentheses are
+    joined and a blank owner repeats the previous one. Names are returned fully qualified when an
+    origin is known, as written otherwise.
+    """
+    with open(path, 'r', encoding='utf-8') as zone_file:
+        yield from _read_records(zone_file, os.path.dirname(path), origin)
+
+
+def _read_records(lines, directory, origin):
+    owner = None
+    tokens = []
+    depth = 0
+    blank_owner = False
+
+    for line in lines:
+        if not tokens:
+            simple = _SIMPLE_RECORD.match(line)
+            if simple is not None:
+                owner, _, record_type, rdata = simple.groups()
+                owner = _absolute(owner, origin)
+                record_type = record_type.upper()
+                yield owner, record_type, [_absolute(rdata, origin) if record_type == 'CNAME' else rdata]
+                continue
+            blank_owner = line[:1] in (' ', '\t')
+
+        for token in _ZONE_TOKEN.findall(line):
+            if token[0] == ';':
+                break
+            if token == '(':
+                depth += 1
+            elif token == ')':
+                depth -= 1
+            else:
+                tokens.append(token)
+
+        if depth > 0 or not tokens:
+            continue
+
+        if tokens[0][0] == '$':
+            directive = tokens[0].upper()
+            if directive == '$ORIGIN':
+                origin = _absolute(tokens[1], origin)
+            elif directive == '$INCLUDE':
+                include_path = os.path.join(directory, tokens[1])
+                include_origin = _absolute(tokens[2], origin) if len(tokens) > 2 else origin
+                yield from read_zone_records(include_path, include_origin)
+            tokens = []
+            continue
+
+        if not blank_owner:
+            owner = _absolute(tokens[0], origin)
+            fields = tokens[1:]
+        else:
+            fields = tokens
+        tokens = []
+
+        # [ttl] [class] type rdata, ttl and class may come in any order
+        skipped = 0
+        while skipped < 2 and len(fields) > 1 and (fields[0].upper() in _CLASSES or _TTL.match(fields[0])):
+            fields = fields[1:]
+            skipped += 1
+
+        if owner is not None and fields:
+            record_type = fields[0].upper()
+            rdata = fields[1:]
+            if record_type == 'CNAME' and rdata:
+                rdata = [_absolute(rdata[0], origin)]
+            yield owner, record_type, rdata
+
+
+def _absolute(name, origin):
+    if name == '@':
+        return origin or name
+    if name.endswith('.') or not origin:
+        return name
+    return '{0}.{1}'.format(name, origin)
+
+
+def _relative(name, origin):
+    if origin and name.endswith('.' + origin):
+        return name[:-len(origin) - 1]
+    return name[:-1] if name.endswith('.') else name
+
+
+class HostIndex:
+    """Index of the A records of a zone, looked up by host name or by address.
+
+    Hosts and addresses are interned, each stored and numbered once; the address of a host is an
+    entry of the ``_host_ip`` array and the hosts of an address a slice of ``_ip_hosts`` between two
+    ``_ip_offsets``. CNAME aliases resolve to the address of their target, addresses only list the
+    A record owners.
+    """
+    __slots__ = ('_hosts', '_host_ids', '_ips', '_ip_ids', '_host_ip', '_ip_offsets', '_ip_hosts')
+
+    def __init__(self, addresses, aliases=None):
+        hosts, host_ids, ips, ip_ids = [], {}, [], {}
+        host_ip = []
+        owners = []
+        for host, ip in addresses:
+            host_id = host_ids.get(host)
+            if host_id is None:
+                host_id = host_ids[host] = len(hosts)
+                hosts.append(host)
+                host_ip.append(-1)
+            ip_id = ip_ids.get(ip)
+            if ip_id is None:
+                ip_id = ip_ids[ip] = len(ips)
+                ips.append(ip)
+                owners.append([])
+
+            previous_ip_id = host_ip[host_id]
+            host_ip[host_id] = ip_id
+            if previous_ip_id < 0 or previous_ip_id != ip_id and host_id not in owners[ip_id]:
+                owners[ip_id].append(host_id)
+
+        for alias, target in (aliases or {}).items():
+            # follow the chain, a loop is given up once it visited every alias
+            for _ in range(len(aliases)):
+                if target not in aliases:
+                    break
+                target = aliases[target]
+            target_id = host_ids.get(target)
+            if target_id is not None and host_ip[target_id] >= 0 and alias not in host_ids:
+                host_ids[alias] = len(hosts)
+                hosts.append(alias)
+                host_ip.append(host_ip[target_id])
+
+        self._hosts, self._host_ids, self._ips, self._ip_ids = hosts, host_ids, ips, ip_ids
+        self._host_ip = array('l', host_ip)
+        self._ip_offsets = array('l', [0])
+        self._ip_hosts = array('l')
+        for ip_hosts in owners:
+            self._ip_hosts.extend(ip_hosts)
+            self._ip_offsets.append(len(self._ip_hosts))
+
+    def __reduce_ex__(self, protocol):
+        # the arrays are handed to pickle as buffers, out of band with a buffer_callback, see snapshot
+        arrays = (self._host_ip, self._ip_offsets, self._ip_hosts)
+        if protocol >= 5:
+            arrays = tuple(pickle.PickleBuffer(_) for _ in arrays)
+        else:
+            arrays = tuple(_.tobytes() for _ in arrays)
+        return _restore_host_index, (self._hosts, self._ips) + arrays
+
+    @classmethod
+    def from_zone_file(cls, path, origin=None):
+        """Build the index of a zone file, names are kept relative to ``origin``.
+
+        The origin defaults to the file name, as bind zone files are usually named after their zone.
+        """
+        origin = (origin or os.path.basename(path)).rstrip('.') + '.'
+        suffix = '.' + origin
+        addresses = []
+        aliases = {}
+        for owner, record_type, rdata in read_zone_records(path, origin):
+            if record_type == 'A' and rdata:
+                addresses.append((owner[:-len(suffix)] if owner.endswith(suffix) else _relative(owner, origin),
+                                  rdata[0]))
+            elif record_type == 'CNAME' and rdata:
+                aliases[_relative(owner, origin)] = _relative(rdata[0], origin)
+        return cls(addresses, aliases)
+
+    def ip(self, host):
+        """Return the address of the host, raises KeyError for an unknown host"""
+        ip_id = self._host_ip[self._host_ids[host]]
+        if ip_id < 0:
+            raise KeyError(host)
+        return self._ips[ip_id]
+
+    def hosts(self, ip):
+        """Return the A record owners of the address, raises KeyError for an unknown address"""
+        ip_id = self._ip_ids[ip]
+        return [self._hosts[_] for _ in self._ip_hosts[self._ip_offsets[ip_id]:self._ip_offsets[ip_id + 1]]]
+
+    @property
+    def by_ip(self):
+        return _HostsByIp(self)
+
+    @property
+    def by_host(self):
+        return _IpByHost(self)
+
+
+def _restore_host_index(hosts, ips, host_ip, ip_offsets, ip_hosts):
+    # the arrays are used where they are, a mapped snapshot is not copied
+    index = HostIndex.__new__(HostIndex)
+    index._hosts, index._ips = hosts, ips
+    index._host_ids = {host: host_id for host_id, host in enumerate(hosts)}
+    index._ip_ids = {ip: ip_id for ip_id, ip in enumerate(ips)}
+    index._host_ip, index._ip_offsets, index._ip_hosts = (memoryview(_).cast('B').cast('l')
+                                                          for _ in (host_ip, ip_offsets, ip_hosts))
+    return index
+
+
+class _HostsByIp(Mapping):
+    def __init__(self, index):
+        self.index = index
+
+    def __getitem__(self, ip):
+        return self.index.hosts(ip)
+
+    def __iter__(self):
+        return iter(self.index._ips)
+
+    def __len__(self):
+        return len(self.index._ips)
+
+
+class _IpByHost(Mapping):
+    def __init__(self, index):
+        self.index = index
+
+    def __getitem__(self, host):
+        return self.index.ip(host)
+
+    def __iter__(self):
+        return (host for host in self.index._hosts if host in self)
+
+    def __len__(self):
+        return sum(1 for _ in self)
@@ -0,0 +1,284 @@
+# coding=utf-8
+"""
+Structural diff of two parsed http contexts, e.g. the deployed confs and a puppet checkout:
+the servers, locations, upstreams and upstream members added, removed and changed, and the services table rows
+the change adds and removes
+
+    diff-services-table --old_upstreams_conf_file_path=... --old_sites_available_conf_files_path=... \\
+        --new_upstreams_conf_file_path=... --new_sites_available_conf_files_path=... --bind_zones_file_location=...
+"""
+import argparse
+import hashlib
+import json
+import sys
+from collections import Counter
+
+from services_spec_generator import parse_conf
+from services_spec_generator.nginx_conf_parser.http_context import HttpContext
+from services_spec_generator.nginx_conf_parser.location_matcher import split_location_path
+from services_spec_generator.output_files import atomic_open
+
+
+def _frozen(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_frozen(_) for _ in value)
+    if isinstance(value, dict):
+        return tuple((key, _frozen(item)) for key, item in value.items())
+    return value
+
+
+def _raw_state(context):
+    # the arguments as written, parsed values are left out so that accessing a directive changes no digest
+    raw = context._raw
+    if not raw:
+        return ()
+    directives = type(context)._directives
+    return tuple((name, tuple(map(tuple, args)) if directives[name][2] else tuple(args)) for name, args in raw.items())
+
+
+def _digest(state):
+    # a content digest: unlike hash() a collision would not hide a change
+    return hashlib.blake2b(repr(state).encode('utf-8'), digest_size=16).digest()
+
+
+def location_key(location):
+    return split_location_path(location.path)
+
+
+def server_key(server):
+    listen = tuple(sorted(_['value'] for _ in server.listen))
+    names = tuple(server.server_name) if isinstance(server.server_name, list) else (server.server_name,)
+    return listen, names
+
+
+def location_digest(location):
+    limit_except = tuple((method, _raw_state(context)) for method, context in (location.limit_except or {}).items())
+    return _digest((location.path, _raw_state(location), limit_except, _frozen(location.types)))
+
+
+def server_digest(server, location_digests):
+    """Return the digest of the server, the digests of its locations are hashed in instead of the locations"""
+    return _digest((_raw_state(server), _frozen(server.types), tuple(location_digests)))
+
+
+def upstream_digest(upstream):
+    return _digest(_frozen(sorted(vars(upstream).items())))
+
+
+def _pair(old_items, new_items, key):
+    """
+    Yield (key, old, new) for the items of both lists, matched by key; an item only in one list has None
+    for the other. Items of the same key are matched in their order
+    """
+    new_by_key = {}
+    for item in new_items:
+        new_by_key.setdefault(key(item), []).append(item)
+    for item in old_items:
+        item_key = key(item)
+        matched = new_by_key.get(item_key)
+        yield item_key, item, matched.pop(0) if matched else None
+    for item_key, items in new_by_key.items():
+        for item in items:
+            yield item_key, None, item
+
+
+def diff_directives(old, new):
+    """Return {directive: [old value, new value]} of the directives written differently and parsing differently"""
+    old_raw, new_raw = old._raw or {}, new._raw or {}
+    changed = {}
+    for name in type(old)._directives:
+        if old_raw.get(name) != new_raw.get(name):
+            old_value, new_value = getattr(old, name), getattr(new, name)
+            if old_value != new_value:
+                changed[name] = [old_value, new_value]
+    return changed
+
+
+def _key_dict(key, kind):
+    if kind == 'server':
+        return dict(listen=list(key[0]), server_name=list(key[1]))
+    if kind == 'location':
+        return dict(modifier=key[0], path=key[1])
+    return dict(name=key)
+
+
+class ConfDiff:
+    """
+    Changes between two http contexts. Servers are matched by (listen, server_name), their locations by
+    (modifier, path) and upstreams by name, their members by address.
+
+    Every server and location is reduced to a blake2b digest of its written directives and of the digests of its
+    locations, a subtree of equal digests is skipped in one comparison; only the directives of changed
+    subtrees are parsed and compared.
+    """
+    def __init__(self, old, new):
+        self.old = old
+        self.new = new
+        self.servers = dict(added=[], removed=[], changed=[])
+        self.upstreams = dict(added=[], removed=[], changed=[])
+        # the servers of the old and new confs whose rows may differ
+        self._changed_servers = ([], [])
+        self._diff_upstreams()
+        self._diff_servers()
+
+    def _diff_upstreams(self):
+        for name, old, new in _pair(self.old.upstreams, self.new.upstreams, lambda _: _.name):
+            if old is None:
+                self.upstreams['added'].append(dict(name=name, members=[_['address'] for _ in new.servers]))
+            elif new is None:
+                self.upstreams['removed'].append(dict(name=name, members=[_['address'] for _ in old.servers]))
+            elif upstream_digest(old) != upstream_digest(new):
+                self.upstreams['changed'].append(self._upstream_changes(name, old, new))
+
+    @staticmethod
+    def _upstream_changes(name, old, new):
+        members = dict(added=[], removed=[], changed=[])
+        for address, old_member, new_member in _pair(old.servers, new.servers, lambda _: _['address']):
+            if old_member is None:
+                members['added'].append(new_member)
+            elif new_member is None:
+                members['removed'].append(old_member)
+            elif old_member != new_member:
+                members['changed'].append(dict(address=address, parameters=[old_member['parameters'],
+                                                                           new_member['parameters']]))
+        old_vars, new_vars = vars(old), vars(new)
+        attributes = {key: [old_vars.get(key), new_vars.get(key)] for key in sorted(old_vars.keys() | new_vars.keys())
+                      if key != 'servers' and old_vars.get(key) != new_vars.get(key)}
+        return dict(name=name, members=members, attributes=attributes)
+
+    def _diff_servers(self):
+        for key, old, new in _pair(self.old.servers, self.new.servers, server_key):
+            if old is None:
+                self.servers['added'].append(_key_dict(key, 'server'))
+                self._changed_servers[1].append(new)
+            elif new is None:
+                self.servers['removed'].append(_key_dict(key, 'server'))
+                self._changed_servers[0].append(old)
+            else:
+                old_digests = [location_digest(_) for _ in old.location]
+                new_digests = [location_digest(_) for _ in new.location]
+                if server_digest(old, old_digests) != server_digest(new, new_digests):
+                    changes = self._server_changes(key, old, new, old_digests, new_digests)
+                    if changes is not None:
+                        self.servers['changed'].append(changes)
+                        self._changed_servers[0].append(old)
+                        self._changed_servers[1].append(new)
+
+    @staticmethod
+    def _server_changes(key, old, new, old_digests, new_digests):
+        locations = dict(added=[], removed=[], changed=[])
+        old_locations = list(zip(old.location, old_digests))
+        new_locations = list(zip(new.location, new_digests))
+        for location, old_item, new_item in _pair(old_locations, new_locations, lambda _: location_key(_[0])):
+            if old_item is None:
+                locations['added'].append(_key_dict(location, 'location'))
+            elif new_item is None:
+                locations['removed'].append(_key_dict(location, 'location'))
+            elif old_item[1] != new_item[1]:
+                changes = ConfDiff._location_changes(old_item[0], new_item[0])
+                if changes:
+                    locations['changed'].append(dict(_key_dict(location, 'location'), **changes))
+
+        directives = diff_directives(old, new)
+        if old.types != new.types:
+            directives['types'] = [old.types, new.types]
+        if not directives and not any(locations.values()):
+            return None
+        return dict(_key_dict(key, 'server'), directives=directives, locations=locations)
+
+    @staticmethod
+    def _location_changes(old, new):
+        changes = {}
+        directives = diff_directives(old, new)
+        if old.types != new.types:
+            directives['types'] = [old.types, new.types]
+        if directives:
+            changes['directives'] = directives
+
+        old_limits, new_limits = old.limit_except or {}, new.limit_except or {}
+        limit_except = {}
+        for method in sorted(old_limits.keys() | new_limits.keys()):
+            if method not in new_limits:
+                limit_except[method] = 'removed'
+            elif method not in old_limits:
+                limit_except[method] = 'added'
+            else:
+                limit_directives = diff_directives(old_limits[method], new_limits[method])
+                if limit_directives:
+                    limit_except[method] = limit_directives
+        if limit_except:
+            changes['limit_except'] = limit_except
+        return changes
+
+    def to_dict(self):
+        """Return the changeset, JSON serializable"""
+        return dict(servers=self.servers, upstreams=self.upstreams)
+
+    def services_delta(self, map_ips, map_host):
+        """
+        Return the rows of the services table the change adds and removes, each as a list of the RowItem columns.
+        Only the rows of the changed servers and of the servers proxying to changed upstreams are made
+        """
+        changed_upstreams = {_['name'] for kind in ('added', 'removed', 'changed') for _ in self.upstreams[kind]}
+        rows = []
+        for http_context, changed_servers in zip((self.old, self.new), self._changed_servers):
+            changed = set(map(id, changed_servers))
+            servers = [_ for _ in http_context.servers if id(_) in changed or
+                       any(location.proxy_pass_upstream in changed_upstreams for location in _.location)]
+            upstream_index = parse_conf.UpstreamIndex.from_upstreams(http_context.upstreams, map_ips, map_host)
+            parse_conf.fetch_git_projects_details(_.git_project for _ in http_context.upstreams)
+            rows.append(Counter(tuple(row.to_list()) for server in servers
+                                for row in parse_conf.make_server_rows(server, upstream_index)))
+
+        old_rows, new_rows = rows
+        return dict(added=[list(_) for _ in sorted((new_rows - old_rows).elements(), key=str)],
+                    removed=[list(_) for _ in sorted((old_rows - new_rows).elements(), key=str)])
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter)
+
+    for version in ('old', 'new'):
+        ap.add_argument('--{0}_upstreams_conf_file_path'.format(version), required=True,
+                        help='Upstreams conf file of the {0} confs; Examples:\n'
+                             "  --{0}_upstreams_conf_file_path='./puppet/modules/profile/files/nginx/"
+                             "host_d-ngx1.yourltd.com/conf.d/backends.conf'".format(version)
+                        )
+        ap.add_argument('--{0}_sites_available_conf_files_path'.format(version), required=True,
+                        help='Sites conf files of the {0} confs; Examples:\n'
+                             "  --{0}_sites_available_conf_files_path='./puppet/modules/profile/files/nginx/"
+                             "host_d-ngx1.yourltd.com/sites-available/*.conf'".format(version)
+                        )
+    ap.add_argument('--bind_zones_file_location', required=True,
+                    help='Examples:\n'
+                         "  --bind_zones_file_location='./puppet/modules/profile/files/bind9/zones/yourltd.com'"
+                    )
+    ap.add_argument('--output_file', default=None,
+                    help='JSON file to write the changeset and the services delta to, stdout by default'
+                    )
+
+    args = ap.parse_args()
+
+    return args
+
+
+def main():
+    args = parse_args()
+    old = HttpContext(parse_conf.make_http_tree(args.old_upstreams_conf_file_path,
+                                                args.old_sites_available_conf_files_path))
+    new = HttpContext(parse_conf.make_http_tree(args.new_upstreams_conf_file_path,
+                                                args.new_sites_available_conf_files_path))
+    map_ips, map_host = parse_conf.get_hosts_ips(args.bind_zones_file_location)
+
+    conf_diff = ConfDiff(old, new)
+    result = dict(conf_diff.to_dict(), services=conf_diff.services_delta(map_ips, map_host))
+    if args.output_file:
+        with atomic_open(args.output_file, 'w', encoding='utf-8') as output:
+            json.dump(result, output, indent=2)
+    else:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
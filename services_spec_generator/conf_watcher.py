@@ -0,0 +1,180 @@
+# coding=utf-8
+"""
+Wait for changes of the conf and bind zone files: with inotify on linux, by polling their stats elsewhere
+"""
+import ctypes
+import ctypes.util
+import fnmatch
+import glob
+import logging
+import os
+import select
+import struct
+import sys
+import time
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+# editors and deployments replace a file by a rename as often as they write it in place
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+_EVENT = struct.Struct('iIII')
+
+logger = logging.getLogger(__name__)
+
+
+class PollingWatcher:
+    """Compares the stats of the watched files, and of the files matching the watched globs, every interval"""
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.paths = set()
+        self.patterns = set()
+        self._stats = {}
+
+    def _snapshot(self):
+        paths = set(self.paths)
+        for pattern in self.patterns:
+            paths.update(glob.glob(pattern))
+        stats = {}
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                stats[path] = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+            except OSError:
+                stats[path] = None
+        return stats
+
+    def watch(self, paths, patterns=()):
+        """Add files and globs to watch, the files already watched keep the stats they had"""
+        self.paths.update(paths)
+        self.patterns.update(patterns)
+        for path, stat in self._snapshot().items():
+            self._stats.setdefault(path, stat)
+
+    def wait(self, timeout=None):
+        """Return True once a watched file changed, False if none did in timeout seconds"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            stats = self._snapshot()
+            if stats != self._stats:
+                self._stats = stats
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(self.interval if deadline is None else
+                       max(0.0, min(self.interval, deadline - time.monotonic())))
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    Watches the directories of the files and globs, so that a file replaced by a rename or created later
+    is seen as well; events of other files of these directories are ignored.
+    The files of a directory inotify can not watch, e.g. one not created yet, are polled every poll_interval
+    """
+    def __init__(self, poll_interval=1.0):
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.paths = set()
+        self.patterns = set()
+        self._directories = {}  # watch descriptor -> directory
+        self._polling = PollingWatcher(poll_interval)
+
+    def watch(self, paths, patterns=()):
+        """Add files and globs to watch, a glob may only have wildcards in its file name"""
+        paths = [os.path.abspath(_) for _ in paths]
+        patterns = [os.path.abspath(_) for _ in patterns]
+        self.paths.update(paths)
+        self.patterns.update(patterns)
+        for directory in {os.path.dirname(_) for _ in paths + patterns} - set(self._directories.values()):
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if wd >= 0:
+                self._directories[wd] = directory
+                continue
+            errno = ctypes.get_errno()
+            logger.warning('Can not watch %s with inotify, errno %d: %s; its files are polled',
+                           directory, errno, os.strerror(errno))
+            self._polling.watch([_ for _ in paths if os.path.dirname(_) == directory],
+                                [_ for _ in patterns if os.path.dirname(_) == directory])
+
+    def _changed(self, data):
+        offset = 0
+        changed = False
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b'\0')
+            offset += _EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                # events were dropped, any file may have changed
+                changed = True
+                continue
+            directory = self._directories.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if path in self.paths or any(fnmatch.fnmatch(path, _) for _ in self.patterns):
+                changed = True
+        return changed
+
+    def wait(self, timeout=None):
+        """Return True once a watched file changed, False if none did in timeout seconds"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        polled = bool(self._polling.paths or self._polling.patterns)
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if polled:
+                remaining = self._polling.interval if remaining is None else min(remaining, self._polling.interval)
+            readable, _, _ = select.select([self.fd], [], [], remaining)
+            if readable:
+                try:
+                    data = os.read(self.fd, 64 * 1024)
+                except BlockingIOError:
+                    data = b''
+                if self._changed(data):
+                    return True
+            if polled and self._polling.wait(0):
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def make_watcher(poll_interval=1.0, polling=False):
+    """Return an inotify watcher on linux, a polling one if it is not available or polling is asked for"""
+    if not polling and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(poll_interval)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(poll_interval)
+
+
+def wait_for_changes(watcher, debounce=0.2, max_delay=1.0, timeout=None):
+    """
+    Wait for a change, then for the burst it starts to end: until nothing changed for debounce seconds,
+    but no longer than max_delay seconds after the first change.
+    Returns False if nothing changed in timeout seconds
+    """
+    if not watcher.wait(timeout):
+        return False
+    deadline = time.monotonic() + max_delay
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not watcher.wait(min(debounce, remaining)):
+            return True
@@ -0,0 +1,277 @@
+# coding=utf-8
+
+
+def parse_value(args):
+    return ' '.join(args)
+
+
+def parse_int(args):
+    return int(args[0])
+
+
+def parse_flag(args):
+    return True
+
+
+def parse_names(args):
+    return args[0] if len(args) == 1 else list(args)
+
+
+def parse_aio(args):
+    if args[0] in ('on', 'off'):
+        return args[0]
+    return dict(threads=True, pool=args[0][len('threads='):] or None)
+
+
+def parse_auth_jwt(args):
+    if args[0] == 'off':
+        return 'off'
+    token = [_[len('token='):] for _ in args[1:] if _.startswith('token=')]
+    return dict(
+        realm='"{0}"'.format(args[0].strip('"')),
+        token=token[0] if token else None
+    )
+
+
+def parse_claim_set(args):
+    return dict(variable=args[0], names=list(args[1:]))
+
+
+def parse_temp_path(args):
+    levels = list(args[1:4]) + [None] * (4 - len(args))
+    return dict(path=args[0], level1=levels[0], level2=levels[1], level3=levels[2])
+
+
+def parse_disable_symlinks(args):
+    if args[0] == 'off':
+        return 'off'
+    _from = [_[len('from='):] for _ in args[1:] if _.startswith('from=')]
+    return dict(value=args[0], _from=_from[0] if _from else None)
+
+
+def parse_error_page(args):
+    return dict(codes=' '.join(args[:-1]), uri=args[-1])
+
+
+def parse_keepalive_timeout(args):
+    return dict(timeout=args[0], header_timeout=args[1] if len(args) > 1 else None)
+
+
+def parse_buffers(args):
+    return dict(number=int(args[0]), size=args[1])
+
+
+def parse_open_file_cache(args):
+    params = dict(_.split('=', 1) for _ in args if '=' in _)
+    if 'max' not in params:
+        return 'off'
+    return dict(max=int(params['max']), inactive=params.get('inactive'))
+
+
+def parse_resolver(args):
+    params = dict(_.split('=', 1) for _ in args if '=' in _)
+    return dict(
+        address=[_ for _ in args if '=' not in _],
+        valid=params.get('valid'),
+        ipv6=params.get('ipv6')
+    )
+
+
+def parse_listen(args):
+    flags = set(args[1:])
+    params = dict(_.split('=', 1) for _ in args[1:] if '=' in _)
+    return dict(
+        value=args[0],
+        default_server='default_server' in flags,
+        ssl='ssl' in flags,
+        http2='http2' in flags,
+        spdy='spdy' in flags,
+        proxy_protocol='proxy_protocol' in flags,
+        setfib=int(params['setfib']) if 'setfib' in params else None,
+        fastopen=int(params['fastopen']) if 'fastopen' in params else None,
+        backlog=int(params['backlog']) if 'backlog' in params else None,
+        rcvbuf=params.get('rcvbuf'),
+        sndbuf=params.get('sndbuf'),
+        accept_filter=params.get('accept_filter'),
+        deferred='deferred' in flags,
+        bind='bind' in flags,
+        ipv6only=params.get('ipv6only', 'on'),
+        reuseport='reuseport' in flags,
+        so_keepalive=params.get('so_keepalive')
+    )
+
+
+def parse_types(block):
+    types = dict()
+    for node in block.children:
+        if node.children is None and node.name != '#':
+            for extension in node.args:
+                types[extension] = node.name
+    return types
+
+
+# directive name -> (parser, default, may be repeated)
+COMMON_DIRECTIVES = {
+    'absolute_redirect': (parse_value, 'off', False),
+    'accept': (parse_value, None, True),
+    'aio': (parse_aio, 'off', False),
+    'aio_write': (parse_value, 'off', False),
+    'auth_jwt': (parse_auth_jwt, 'off', False),
+    'auth_jwt_key_file': (parse_value, None, False),
+    'auth_jwt_leeway': (parse_value, '0s', False),
+    'chunked_transfer_encoding': (parse_value, 'on', False),
+    'client_body_buffer_size': (parse_value, '8k|16k', False),
+    'client_body_in_file_only': (parse_value, 'off', False),
+    'client_body_in_single_buffer': (parse_value, 'off', False),
+    'client_body_temp_path': (parse_temp_path, dict(path='client_body_temp', level1=None, level2=None, level3=None),
+                              False),
+    'client_body_timeout': (parse_value, '60s', False),
+    'client_max_body_size': (parse_value, '1m', False),
+    'default_type': (parse_value, 'text/plain', False),
+    'deny': (parse_value, None, True),
+    'directio': (parse_value, 'off', False),
+    'directio_alignment': (parse_value, '512', False),
+    'disable_symlinks': (parse_disable_symlinks, 'off', False),
+    'error_page': (parse_error_page, None, False),
+    'etag': (parse_value, 'on', False),
+    'if_modified_since': (parse_value, 'exact', False),
+    'keepalive_disable': (parse_value, 'msie6', False),
+    'keepalive_requests': (parse_int, 100, False),
+    'keepalive_timeout': (parse_keepalive_timeout, dict(timeout='75s', header_timeout=None), False),
+    'limit_rate': (parse_value, '0', False),
+    'limit_rate_after': (parse_value, '0', False),
+    'lingering_close': (parse_value, 'on', False),
+    'lingering_time': (parse_value, '30s', False),
+    'lingering_timeout': (parse_value, '5s', False),
+    'log_not_found': (parse_value, 'on', False),
+    'log_subrequest': (parse_value, 'off', False),
+    'max_ranges': (parse_int, None, False),
+    'msie_padding': (parse_value, 'on', False),
+    'msie_refresh': (parse_value, 'off', False),
+    'open_file_cache': (parse_open_file_cache, 'off', False),
+    'open_file_cache_errors': (parse_value, 'off', False),
+    'open_file_cache_min_uses': (parse_int, 1, False),
+    'open_file_cache_valid': (parse_value, '60s', False),
+    'output_buffers': (parse_buffers, dict(number=2, size='32k'), False),
+    'port_in_redirect': (parse_value, 'on', False),
+    'postpone_output': (parse_value, '1460', False),
+    'read_ahead': (parse_value, '0', False),
+    'recursive_error_pages': (parse_value, 'off', False),
+    'reset_timedout_connection': (parse_value, 'off', False),
+    'resolver': (parse_resolver, None, False),
+    'resolver_timeout': (parse_value, '30s', False),
+    'root': (parse_value, 'html', False),
+    'satisfy': (parse_value, 'all', False),
+    'send_lowat': (parse_value, '0', False),
+    'send_timeout': (parse_value, '60s', False),
+    'sendfile': (parse_value, 'off', False),
+    'sendfile_max_chunk': (parse_value, '0', False),
+    'server_name_in_redirect': (parse_value, 'off', False),
+    'server_tokens': (parse_value, 'on', False),
+    'subrequest_output_buffer_size': (parse_value, '4k|8k', False),
+    'tcp_nodelay': (parse_value, 'on', False),
+    'tcp_nopush': (parse_value, 'off', False),
+    'types_hash_bucket_size': (parse_value, '64', False),
+    'types_hash_max_size': (parse_value, '1024', False),
+}
+
+# directives allowed in http and server contexts only
+CONNECTION_DIRECTIVES = {
+    'client_header_buffer_size': (parse_value, '1k', False),
+    'client_header_timeout': (parse_value, '60s', False),
+    'connection_pool_size': (parse_value, '256|512', False),
+    'ignore_invalid_headers': (parse_value, 'on', False),
+    'large_client_header_buffers': (parse_buffers, dict(number=4, size='8k'), False),
+    'merge_slashes': (parse_value, 'on', False),
+    'request_pool_size': (parse_value, '4k', False),
+    'underscores_in_headers': (parse_value, 'off', False),
+}
+
+
+class DirectiveContext:
+    """Base of the contexts filled by ``load_directives``.
+
+    Subclasses declare a slot per directive of their ``_directives`` table. A directive is parsed on
+    first access only, from the arguments collected by ``load_directives``, and kept in its slot; a
+    directive missing from the configuration takes the default of the table. The arguments are kept
+    as the written state of the context, compared by ``conf_diff`` whatever was accessed already.
+    """
+    __slots__ = ('_raw',)
+    _directives = {}
+
+    def __getstate__(self):
+        # only the slots set are kept, the default state would look every slot up and parse the raw directives;
+        # a (None, slots) state is set by pickle itself, with no __setstate__ call per context
+        state = {}
+        for name in _slot_names(type(self)):
+            try:
+                state[name] = object.__getattribute__(self, name)
+            except AttributeError:
+                pass
+        return None, state
+
+    def __getattr__(self, name):
+        spec = type(self)._directives.get(name)
+        if spec is None:
+            raise AttributeError("'{0}' object has no attribute '{1}'".format(type(self).__name__, name))
+
+        parser, default, multiple = spec
+        raw = self._raw
+        if raw and name in raw:
+            args = raw[name]
+            value = [parser(_) for _ in args] if multiple else parser(args)
+        else:
+            value = _fresh(default)
+        object.__setattr__(self, name, value)
+        return value
+
+
+_SLOT_NAMES = {}
+
+
+def _slot_names(cls):
+    names = _SLOT_NAMES.get(cls)
+    if names is None:
+        names = _SLOT_NAMES[cls] = tuple(name for klass in cls.__mro__ for name in klass.__dict__.get('__slots__', ()))
+    return names
+
+
+def load_directives(context, block, directives, blocks):
+    """Collect the arguments of ``context`` directives from the nodes of ``block``.
+
+    Simple directives are looked up in ``directives``, nested blocks listed in ``blocks`` are handed
+    to the named method of ``context`` and any other block is walked as if it were inlined.
+    Values are parsed on first access, see ``DirectiveContext``.
+    """
+    raw = {}
+    _collect(context, block, directives, blocks, raw)
+    context._raw = raw or None
+
+
+def _fresh(default):
+    # defaults are shared by every instance, containers must not be
+    if isinstance(default, dict):
+        return dict(default)
+    if isinstance(default, list):
+        return [_fresh(_) for _ in default]
+    return default
+
+
+def _collect(context, block, directives, blocks, raw):
+    for node in block.children:
+        if node.children is not None:
+            if node.name in blocks:
+                handler = blocks[node.name]
+                if handler is not None:
+                    context.__getattribute__(handler)(node)
+            else:
+                _collect(context, node, directives, blocks, raw)
+            continue
+
+        spec = directives.get(node.name)
+        if spec is None:
+            continue
+        if spec[2]:
+            raw.setdefault(node.name, []).append(node.args)
+        elif node.name not in raw:
+            raw[node.name] = node.args
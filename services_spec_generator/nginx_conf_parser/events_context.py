@@ -1,49 +1,49 @@
 # coding=utf-8
-import re
+from .patterns import EVENTS_ACCEPT_MUTEX_DELAY, EVENTS_ACCEPT_MUTEX, EVENTS_DEBUG_CONNECTION, EVENTS_MULTI_ACCEPT, \
+    EVENTS_USE, EVENTS_WORKER_AIO_REQUESTS, EVENTS_WORKER_CONNECTIONS, EVENTS_ERROR_LOG
 
 
 class EventContext:
     accept_mutex_delay = None
     accept_mutex = None
-    debug_connection = []
+    debug_connection = None
     multi_accept = 'off'
     use = None
     worker_aio_requests = 32
     worker_connections = 512
-    error_log = dict(file='logs/error.log', level='error')
+    error_log = None
 
     def __init__(self, content):
         # accept_mutex_delay
-        delay = re.search(r'accept_mutex_delay\s*([^;]*)', content)
+        delay = EVENTS_ACCEPT_MUTEX_DELAY.search(content)
         self.accept_mutex_delay = delay.group(1) if delay else '500ms'
 
         # accept_mutex
-        mutex = re.search(r'accept_mutex\s*(on|off);', content)
+        mutex = EVENTS_ACCEPT_MUTEX.search(content)
         self.accept_mutex = mutex.group(1) if mutex else 'off'
 
         # debug_connection
-        debug = re.findall(r'debug_connection\s*([^;]*)', content)
+        debug = EVENTS_DEBUG_CONNECTION.findall(content)
         self.debug_connection = debug
 
         # multi_accept
-        accept = re.search(r'multi_accept\s*(on|off);', content)
+        accept = EVENTS_MULTI_ACCEPT.search(content)
         self.multi_accept = accept.group(1) if accept else 'off'
 
         # use
-        use = re.search(r'use\s+(select|poll|kqueue|epoll|/dev/poll|eventport);', content)
+        use = EVENTS_USE.search(content)
         self.use = use.group(1) if use else self.use
 
         # worker_aio_requests
-        aio = re.search(r'worker_aio_requests\s*(\d+);', content)
+        aio = EVENTS_WORKER_AIO_REQUESTS.search(content)
         self.worker_aio_requests = int(aio.group(1)) if aio else 32
 
         # worker_connections
-        conn = re.search(r'worker_connections\s*(\d+);', content)
+        conn = EVENTS_WORKER_CONNECTIONS.search(content)
         self.worker_connections = int(conn.group(1)) if conn else 512
 
         # error_log
-        error_log = re.search(
-            r'error_log\s*([^\s]*)\s*(debug|info|notice|warn|error|crit|alert|emerg)?;', content)
+        error_log = EVENTS_ERROR_LOG.search(content)
         if error_log:
             self.error_log = dict(
                 file=error_log.group(1),
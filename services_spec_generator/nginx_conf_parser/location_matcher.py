@@ -0,0 +1,155 @@
+# coding=utf-8
+"""
+Location matching of a request uri, as nginx selects the location of a server.
+
+Nested locations are matched as if they were locations of the server: ServerContext lists them with the others
+and does not keep their parent, so a nested location is not looked for inside the location which matched
+as nginx does, it competes with all the locations of the server
+"""
+import re
+from urllib.parse import unquote as percent_decode
+
+from .patterns import combine_regexes, python_regex
+from .tokenizer import unquote
+
+_SLASHES = re.compile(r'/{2,}')
+
+
+def split_location_path(path):
+    """Return the (modifier, uri) of a location path, the modifier is one of '=', '^~', '~', '~*', '@' or ''"""
+    words = path.split(None, 1)
+    if len(words) == 2 and words[0] in ('=', '^~', '~', '~*'):
+        return words[0], unquote(words[1])
+    path = unquote(path)
+    # nginx also reads the modifier glued to the uri
+    for modifier in ('^~', '~*', '=', '~', '@'):
+        if path.startswith(modifier):
+            return modifier, path if modifier == '@' else path[len(modifier):]
+    return '', path
+
+
+def normalize_uri(url):
+    """
+    Return the path nginx matches the locations of a request with: the scheme, host and arguments removed,
+    percent-encoding decoded, slashes merged and dot segments resolved
+    """
+    if '://' in url:
+        url = url.split('://', 1)[1]
+        slash = url.find('/')
+        url = url[slash:] if slash >= 0 else '/'
+    url = url.split('?', 1)[0].split('#', 1)[0]
+    if '%' in url:
+        url = percent_decode(url)
+    if '//' in url:
+        url = _SLASHES.sub('/', url)
+    if '/.' in url:
+        parts = url.split('/')[1:]
+        segments = []
+        for segment in parts:
+            if segment == '..':
+                if segments:
+                    segments.pop()
+            elif segment != '.':
+                segments.append(segment)
+        url = '/' + '/'.join(segments)
+        if segments and parts[-1] in ('.', '..'):
+            url += '/'
+    return url or '/'
+
+
+class LocationMatcher:
+    """
+    Finds the location of a server which handles a uri, with the precedence of nginx:
+    an exact '=' location, then the longest prefix if it is '^~', then the first matching regex location
+    in configuration order, then the longest plain prefix.
+
+    Prefixes are kept in a trie of characters and the regexes are tried as one combined alternation.
+    Regexes python can not compile are left out and listed in ``unsupported``.
+    """
+    def __init__(self, locations):
+        self.exact = {}
+        # a trie node is [children by character, location ending here, whether it is a ^~ location]
+        self._trie = [{}, None, False]
+        self.regexes = []
+        self._patterns = []
+        self.unsupported = []
+
+        for location in locations:
+            if location.path is None:
+                continue
+            modifier, uri = split_location_path(location.path)
+            if modifier == '=':
+                self.exact.setdefault(uri, location)
+            elif modifier in ('', '^~'):
+                self._add_prefix(uri, location, modifier == '^~')
+            elif modifier in ('~', '~*'):
+                uri = python_regex(uri)
+                try:
+                    pattern = re.compile(uri, re.IGNORECASE if modifier == '~*' else 0)
+                except re.error:
+                    self.unsupported.append(location)
+                    continue
+                self.regexes.append((modifier, uri, location))
+                self._patterns.append(pattern)
+
+        self._regex = combine_regexes([(uri, modifier == '~*') for modifier, uri, _ in self.regexes])
+
+    @staticmethod
+    def from_server(server):
+        return LocationMatcher(server.location)
+
+    def _add_prefix(self, uri, location, stop_regexes):
+        node = self._trie
+        for char in uri:
+            node = node[0].setdefault(char, [{}, None, False])
+        # the first of the same prefix wins, as nginx refuses duplicates
+        if node[1] is None:
+            node[1] = location
+            node[2] = stop_regexes
+
+    def _longest_prefix(self, uri):
+        node = self._trie
+        found = None
+        for char in uri:
+            node = node[0].get(char)
+            if node is None:
+                break
+            if node[1] is not None:
+                found = node
+        return found
+
+    def _first_regex(self, uri):
+        if self._regex is not None:
+            match = self._regex.match(uri)
+            return self.regexes[int(match.lastgroup[1:])][2] if match else None
+        for pattern, (_, _, location) in zip(self._patterns, self.regexes):
+            if pattern.search(uri):
+                return location
+        return None
+
+    def match(self, uri):
+        """Return the location handling the normalized uri, or None"""
+        location = self.exact.get(uri)
+        if location is not None:
+            return location
+
+        prefix = self._longest_prefix(uri)
+        if prefix is not None and prefix[2]:
+            return prefix[1]
+
+        location = self._first_regex(uri)
+        if location is not None:
+            return location
+
+        return prefix[1] if prefix is not None else None
+
+    def match_many(self, urls):
+        """Return the location of every url, the urls are normalized and each distinct one is matched once"""
+        matched = {}
+        locations = []
+        for url in urls:
+            location = matched.get(url, matched)
+            if location is matched:
+                location = matched[url] = self.match(normalize_uri(url))
+            locations.append(location)
+        return locations
@@ -1,22 +1,25 @@
 # coding=utf-8
-import re
+from .patterns import MAIN_DAEMON, MAIN_DEBUG_POINTS, MAIN_ENV, MAIN_ERROR_LOG, MAIN_LOAD_MODULE, MAIN_LOCK_FILE, \
+    MAIN_MASTER_PROCESS, MAIN_PCRE_JIT, MAIN_PID, MAIN_SSL_ENGINE, MAIN_THREAD_POOL, MAIN_TIMER_RESOLUTION, \
+    MAIN_WORKING_DIRECTORY, MAIN_USER, MAIN_WORKER_CPU_AFFINITY, MAIN_WORKER_PRIORITY, MAIN_WORKER_PROCESSES, \
+    MAIN_WORKER_RLIMIT_CORE, MAIN_WORKER_RLIMIT_NOFILE, MAIN_WORKER_SHUTDOWN_TIMEOUT, MAIN_GOOGLE_PERFTOOLS_PROFILES
 
 
 class MainContext:
     daemon = 'on'
     debug_points = None
-    env = []
-    error_log = dict(file='logs/error.log', level='error')
+    env = None
+    error_log = None
     load_module = None
     lock_file = 'logs/nginx.lock'
     master_process = 'on'
     pcre_jit = 'off'
     pid = 'logs/nginx.pid'
     ssl_engine = None
-    thread_pool = dict(name='default', threads=32, max_queue=65536)
+    thread_pool = None
     timer_resolution = None
     working_directory = None
-    user = dict(user='nobody', group='nobody')
+    user = None
     worker_cpu_affinity = None
     worker_priority = 0
     worker_processes = 1
@@ -25,95 +28,101 @@ class MainContext:
     worker_shutdown_timeout = None
     google_perftools_profiles = None
 
+    def __init__(self):
+        # the containers are updated by load, every context needs its own
+        self.env = []
+        self.error_log = dict(file='logs/error.log', level='error')
+        self.thread_pool = dict(name='default', threads=32, max_queue=65536)
+        self.user = dict(user='nobody', group='nobody')
+
     def load(self, content):
         # daemon
-        daemon = re.search(r'daemon\s+(on|off);', content)
+        daemon = MAIN_DAEMON.search(content)
         self.daemon = daemon.group(1) if daemon else self.daemon
 
         # debug_points
-        dp = re.search(r'debug_points\s+(stop|abort);', content)
+        dp = MAIN_DEBUG_POINTS.search(content)
         self.debug_points = dp.group(1) if dp else self.debug_points
 
         # env
-        env = re.findall(r'env\s+([a-zA-Z0-9=_]+);', content)
+        env = MAIN_ENV.findall(content)
         self.env = env
 
         # error_log
-        error_log = re.search(
-            r'error_log\s+(([a-zA-Z0-9./\\\-]+)(\s+)?(debug|info|notice|warn|error|crit|alert|emerg)?);', content)
+        error_log = MAIN_ERROR_LOG.search(content)
         if error_log:
             self.error_log['file'] = error_log.group(2)
             self.error_log['level'] = error_log.group(4) if error_log.group(4) else 'error'
 
         # load_module
-        load_module = re.search(r'load_module\s+([a-zA-Z0-9\\/.\s]+);', content)
+        load_module = MAIN_LOAD_MODULE.search(content)
         self.load_module = load_module.group(1) if load_module else self.load_module
 
         # lock_file
-        lock_file = re.search(r'lock_file\s+([a-zA-Z0-9\\/.\s\-]+);', content)
+        lock_file = MAIN_LOCK_FILE.search(content)
         self.lock_file = lock_file.group(1) if lock_file else self.lock_file
 
         # master_process
-        master_process = re.search(r'master_process\s+(on|off);', content)
+        master_process = MAIN_MASTER_PROCESS.search(content)
         self.master_process = master_process.group(1) if master_process else self.master_process
 
         # pcre_jit
-        pcre = re.search(r'pcre_jit\s+(on|off);', content)
+        pcre = MAIN_PCRE_JIT.search(content)
         self.pcre_jit = pcre.group(1) if pcre else self.pcre_jit
 
         # pid
-        pid = re.search(r'pid\s+([a-zA-Z0-9\\/.\s\-]+);', content)
+        pid = MAIN_PID.search(content)
         self.pid = pid.group(1) if pid else self.pid
 
         # ssl_engine
-        engine = re.search(r'ssl_engine\s+([a-zA-Z0-9\\/.\s\-]+);', content)
+        engine = MAIN_SSL_ENGINE.search(content)
         self.ssl_engine = engine.group(1) if engine else self.ssl_engine
 
         # thread_pool
-        pool = re.search(r'thread_pool\s+(([a-zA-Z0-9]+)\s+threads=([0-9]+)[\s+]?(max_queue=)?([0-9]+)?);', content)
+        pool = MAIN_THREAD_POOL.search(content)
         if pool:
             self.thread_pool['name'] = pool.group(2)
             self.thread_pool['threads'] = int(pool.group(3))
             self.thread_pool['max_queue'] = int(pool.group(5)) if pool.group(5) else self.thread_pool.get('max_queue')
 
         # timer_resolution
-        timer = re.search(r'timer_resolution\s+([0-9a-zA-Z]+);', content)
+        timer = MAIN_TIMER_RESOLUTION.search(content)
         self.timer_resolution = timer.group(1) if timer else self.timer_resolution
 
         # working_directory
-        directory = re.search(r'working_directory\s+([a-zA-Z0-9/.\\_-]+);', content)
+        directory = MAIN_WORKING_DIRECTORY.search(content)
         self.working_directory = directory.group(1) if directory else self.working_directory
 
         # user
-        user = re.search(r'user\s+([a-zA-Z0-9_\-]+)(\s+)?([a-zA-Z0-9_\-]+)?;', content)
+        user = MAIN_USER.search(content)
         if user:
             self.user['user'] = user.group(1)
             self.user['group'] = user.group(3) if user.group(3) else user.group(1)
 
         # worker_cpu_affinity
-        affinity = re.search(r'worker_cpu_affinity\s+([0-9a-zA-Z\s]+);', content)
+        affinity = MAIN_WORKER_CPU_AFFINITY.search(content)
         self.worker_cpu_affinity = affinity.group(1) if affinity else self.worker_cpu_affinity
 
         # worker_priority
-        priority = re.search(r'worker_priority\s+([0-9]+);', content)
+        priority = MAIN_WORKER_PRIORITY.search(content)
         self.worker_priority = int(priority.group(1)) if priority else self.worker_priority
 
         # worker_processes
-        processes = re.search(r'worker_processes\s+([0-9]+);', content)
+        processes = MAIN_WORKER_PROCESSES.search(content)
         self.worker_processes = int(processes.group(1)) if processes else self.worker_processes
 
         # worker_rlimit_core
-        rlimit_core = re.search(r'worker_rlimit_core\s+([0-9a-zA-Z]+);', content)
+        rlimit_core = MAIN_WORKER_RLIMIT_CORE.search(content)
         self.worker_rlimit_core = rlimit_core.group(1) if rlimit_core else self.worker_rlimit_core
 
         # worker_rlimit_nofile
-        rlimit_nofile = re.search(r'worker_rlimit_nofile\s+([0-9]+);', content)
+        rlimit_nofile = MAIN_WORKER_RLIMIT_NOFILE.search(content)
         self.worker_rlimit_nofile = int(rlimit_nofile.group(1)) if rlimit_nofile else self.worker_rlimit_nofile
 
         # worker_shutdown_timeout
-        timemout = re.search(r'worker_shutdown_timeout\s+([a-zA-Z0-9]+);', content)
+        timemout = MAIN_WORKER_SHUTDOWN_TIMEOUT.search(content)
         self.worker_shutdown_timeout = timemout.group(1) if timemout else self.worker_shutdown_timeout
 
         # google_perftools_profiles
-        pertools = re.search(r'google_perftools_profiles\s+([a-zA-Z0-9_.\-\\/]+);', content)
+        pertools = MAIN_GOOGLE_PERFTOOLS_PROFILES.search(content)
         self.google_perftools_profiles = pertools.group(1) if pertools else self.google_perftools_profiles
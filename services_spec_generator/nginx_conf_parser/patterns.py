@@ -0,0 +1,136 @@
+# coding=utf-8
+"""
+Compiled patterns of the directives parsed by the context classes.
+
+Every context reads its directives with these, so a pattern is compiled once at import instead of being looked up
+in the ``re`` cache on every constructor call.
+"""
+import re
+from functools import lru_cache
+
+
+BRACES = re.compile(r'[{}]')
+
+
+# upstream blocks
+UPSTREAM_BLOCK = re.compile(r'upstream\s+([^\s{]+)\s*{(.*)}', re.DOTALL)
+UPSTREAM_SERVER_PARAMETERS = re.compile(r'(\w*)=*(\w*)')
+UPSTREAM_GIT_PROJECT = re.compile(r'\s*#\s*git[:]?\s*(http[^;]*)')
+UPSTREAM_SERVER = re.compile(r'server\s+([^\s;]*)\s*([^;]*)')
+UPSTREAM_STATE = re.compile(r'state\s+([^;]*)')
+UPSTREAM_HASH = re.compile(r'hash\s+([^\s]*)\s*(consistent)*;')
+UPSTREAM_KEEPALIVE = re.compile(r'keepalive\s+(\d+);')
+UPSTREAM_KEEPALIVE_REQUESTS = re.compile(r'keepalive_requests\s+(\d+);')
+UPSTREAM_KEEPALIVE_TIMEOUT = re.compile(r'keepalive_timeout\s+(\w);')
+UPSTREAM_LEAST_TIME = re.compile(r'least_time\s+([^;]*)')
+UPSTREAM_QUEUE = re.compile(r'queue\s+(\d+)\s*(timeout=(\w+))?;')
+UPSTREAM_RANDOM = re.compile(r'random\s*(two)?\s*([^;]*)')
+UPSTREAM_STICKY = re.compile(r'sticky\s*(cookie|route|learn)\s*([^;]*)')
+STICKY_NAME = re.compile(r'^([^\s]*)')
+STICKY_EXPIRES = re.compile(r'expires=([^\s]*)')
+STICKY_DOMAIN = re.compile(r'domain=([^\s]*)')
+STICKY_PATH = re.compile(r'path=([^\s]*)')
+STICKY_VARIABLES = re.compile(r'(\$\w+)')
+STICKY_ZONE = re.compile(r'zone=([^\s]*)')
+STICKY_CREATE = re.compile(r'create=([^\s]*)')
+STICKY_LOOKUP = re.compile(r'lookup=([^\s]*)')
+STICKY_TIMEOUT = re.compile(r'timeout=([^\s]*)')
+
+# main context
+MAIN_DAEMON = re.compile(r'daemon\s+(on|off);')
+MAIN_DEBUG_POINTS = re.compile(r'debug_points\s+(stop|abort);')
+MAIN_ENV = re.compile(r'env\s+([a-zA-Z0-9=_]+);')
+MAIN_ERROR_LOG = re.compile(r'error_log\s+(([a-zA-Z0-9./\\\-]+)(\s+)?(debug|info|notice|warn|error|crit|alert|emerg)?);')
+MAIN_LOAD_MODULE = re.compile(r'load_module\s+([a-zA-Z0-9\\/.\s]+);')
+MAIN_LOCK_FILE = re.compile(r'lock_file\s+([a-zA-Z0-9\\/.\s\-]+);')
+MAIN_MASTER_PROCESS = re.compile(r'master_process\s+(on|off);')
+MAIN_PCRE_JIT = re.compile(r'pcre_jit\s+(on|off);')
+MAIN_PID = re.compile(r'pid\s+([a-zA-Z0-9\\/.\s\-]+);')
+MAIN_SSL_ENGINE = re.compile(r'ssl_engine\s+([a-zA-Z0-9\\/.\s\-]+);')
+MAIN_THREAD_POOL = re.compile(r'thread_pool\s+(([a-zA-Z0-9]+)\s+threads=([0-9]+)[\s+]?(max_queue=)?([0-9]+)?);')
+MAIN_TIMER_RESOLUTION = re.compile(r'timer_resolution\s+([0-9a-zA-Z]+);')
+MAIN_WORKING_DIRECTORY = re.compile(r'working_directory\s+([a-zA-Z0-9/.\\_-]+);')
+MAIN_USER = re.compile(r'user\s+([a-zA-Z0-9_\-]+)(\s+)?([a-zA-Z0-9_\-]+)?;')
+MAIN_WORKER_CPU_AFFINITY = re.compile(r'worker_cpu_affinity\s+([0-9a-zA-Z\s]+);')
+MAIN_WORKER_PRIORITY = re.compile(r'worker_priority\s+([0-9]+);')
+MAIN_WORKER_PROCESSES = re.compile(r'worker_processes\s+([0-9]+);')
+MAIN_WORKER_RLIMIT_CORE = re.compile(r'worker_rlimit_core\s+([0-9a-zA-Z]+);')
+MAIN_WORKER_RLIMIT_NOFILE = re.compile(r'worker_rlimit_nofile\s+([0-9]+);')
+MAIN_WORKER_SHUTDOWN_TIMEOUT = re.compile(r'worker_shutdown_timeout\s+([a-zA-Z0-9]+);')
+MAIN_GOOGLE_PERFTOOLS_PROFILES = re.compile(r'google_perftools_profiles\s+([a-zA-Z0-9_.\-\\/]+);')
+
+# events context
+EVENTS_ACCEPT_MUTEX_DELAY = re.compile(r'accept_mutex_delay\s*([^;]*)')
+EVENTS_ACCEPT_MUTEX = re.compile(r'accept_mutex\s*(on|off);')
+EVENTS_DEBUG_CONNECTION = re.compile(r'debug_connection\s*([^;]*)')
+EVENTS_MULTI_ACCEPT = re.compile(r'multi_accept\s*(on|off);')
+EVENTS_USE = re.compile(r'use\s+(select|poll|kqueue|epoll|/dev/poll|eventport);')
+EVENTS_WORKER_AIO_REQUESTS = re.compile(r'worker_aio_requests\s*(\d+);')
+EVENTS_WORKER_CONNECTIONS = re.compile(r'worker_connections\s*(\d+);')
+EVENTS_ERROR_LOG = re.compile(r'error_log\s*([^\s]*)\s*(debug|info|notice|warn|error|crit|alert|emerg)?;')
+
+# stream context
+STREAM_UPSTREAM_SERVER = re.compile(r'server\s+([^;]*)')
+STREAM_SERVER_ADDRESS = re.compile(r'^([0-9a-zA-Z.:/]+)')
+STREAM_UPSTREAM_HASH = re.compile(r'hash\s+([^;]*)')
+STREAM_UPSTREAM_KEEP_ALIVE = re.compile(r'keep_alive\s+([^;]*)')
+
+# server parameters and zone of an upstream
+SERVER_WEIGHT = re.compile(r'weight=([0-9]+)')
+SERVER_MAX_CONNS = re.compile(r'max_conns=([0-9]+)')
+SERVER_MAX_FAILS = re.compile(r'max_fails=([0-9]+)')
+SERVER_FAIL_TIMEOUT = re.compile(r'fail_timeout=([0-9a-zA-Z]+)')
+SERVER_ROUTE = re.compile(r'route=([a-zA-Z0-9.-_\\/]+)')
+SERVER_SERVICE = re.compile(r'service=([a-zA-Z0-9.-_\\/]+)')
+SERVER_SLOW_START = re.compile(r'slow_start=([a-zA-Z0-9]+)')
+UPSTREAM_ZONE = re.compile(r'zone\s+([a-zA-Z0-9_\-.]+)\s*?([a-z0-9]+)?;')
+
+# location context
+PROXY_PASS_UPSTREAM = re.compile(r'http[s]?://([^/;]*)')
+
+# an escape, or the opening of a named group as PCRE (?<name> or python (?P<name> write it
+NAMED_GROUP = re.compile(r'\\.|\(\?P?<(?![=!])([A-Za-z_][A-Za-z0-9_]*)>')
+ESCAPE = re.compile(r'\\.')
+
+
+@lru_cache(maxsize=None)
+def context_start(context_name):
+    """Pattern of the opening of a ``context_name`` block"""
+    return re.compile(context_name + r'\s+{')
+
+
+@lru_cache(maxsize=None)
+def context_scanner(context_name):
+    """Pattern matching the opening of a ``context_name`` block and every other brace"""
+    return re.compile(r'(?<![\w$-]){0}(?:\s+[^\s{{}};]+)*\s*{{|[{{}}]'.format(re.escape(context_name)))
+
+
+def python_regex(pattern):
+    """Return the PCRE pattern of a configuration with its named groups written the python way"""
+    return NAMED_GROUP.sub(lambda match: match.group() if match.group(1) is None
+                           else '(?P<{0}>'.format(match.group(1)), pattern)
+
+
+def combine_regexes(regexes):
+    """
+    Return one pattern for the (pattern, ignore_case) regexes whose alternatives are the regexes in order,
+    each as the group r<index>, to be used with ``match``; None if the regexes can only be tried one by one
+    """
+    if not regexes:
+        return None
+    alternatives = []
+    for index, (pattern, ignore_case) in enumerate(regexes):
+        # group numbers of back references change in the alternation
+        if any(_.group()[1:].isdigit() for _ in ESCAPE.finditer(pattern)):
+            return None
+        # names could repeat between the regexes
+        pattern = NAMED_GROUP.sub(lambda match: match.group() if match.group(1) is None else '(', pattern)
+        # the lazy .*? tries every start of the string before the next alternative is tried,
+        # so the first regex in order which matches anywhere wins; ^ still only matches at the start.
+        # The regex is grouped on its own, an alternation in it like ^/a|/b is not anchored as a whole
+        pattern = '(?{0}:{1})'.format('i' if ignore_case else '', pattern)
+        alternatives.append('.*?(?P<r{0}>{1})'.format(index, pattern))
+    try:
+        return re.compile('|'.join(alternatives), re.DOTALL)
+    except re.error:
+        return None
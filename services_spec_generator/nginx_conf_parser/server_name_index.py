@@ -0,0 +1,185 @@
+# coding=utf-8
+import re
+
+from .patterns import combine_regexes, python_regex
+from .tokenizer import unquote
+
+
+def split_listen(value):
+    """Return the (address, port) of a listen value, '*' for any address, None for a unix socket"""
+    # the default listen of a server is '*:80 | *:8000', nginx listens on *:80 when run as root
+    value = value.split(' | ', 1)[0]
+    if value.startswith('unix:'):
+        return None
+    if value.startswith('['):
+        address, _, port = value[1:].partition(']')
+        address = '[{0}]'.format(address)
+        port = port[1:]
+    elif value.isdigit():
+        address, port = '*', value
+    else:
+        address, _, port = value.partition(':')
+    if address in ('*', '0.0.0.0', '[::]'):
+        address = '*'
+    return address, int(port) if port else 80
+
+
+def normalize_host(host):
+    """Return the server name nginx looks up for a Host header: lower case, port and trailing dot removed"""
+    host = host.strip().lower()
+    if host.startswith('['):
+        return host[:host.find(']') + 1]
+    host = host.partition(':')[0]
+    return host[:-1] if host.endswith('.') else host
+
+
+class _ListenServers:
+    """The servers of one address and port, by name tier"""
+    def __init__(self):
+        self.exact = {}
+        # label tries: a node is [children by label, server of the wildcard ending here]
+        self.leading = [{}, None]
+        self.trailing = [{}, None]
+        self.regexes = []
+        self.unsupported = []
+        self.default = None
+        self.first = None
+        self._regex = None
+        self._patterns = []
+
+    def add(self, server, names, default_server):
+        if self.first is None:
+            self.first = server
+        if default_server and self.default is None:
+            self.default = server
+
+        for name in names:
+            name = unquote(name)
+            if name.startswith('~'):
+                pattern = python_regex(name[1:])
+                try:
+                    self._patterns.append(re.compile(pattern, re.IGNORECASE))
+                except re.error:
+                    self.unsupported.append(server)
+                    continue
+                self.regexes.append((pattern, server))
+                continue
+
+            name = name.lower()
+            if name.startswith('*.'):
+                self._add_wildcard(self.leading, reversed(name[2:].split('.')), server)
+            elif name.startswith('.'):
+                # .example.com is example.com and *.example.com
+                self.exact.setdefault(name[1:], server)
+                self._add_wildcard(self.leading, reversed(name[1:].split('.')), server)
+            elif name.endswith('.*'):
+                self._add_wildcard(self.trailing, name[:-2].split('.'), server)
+            else:
+                # the first server of a name wins, nginx warns about the others
+                self.exact.setdefault(name, server)
+
+    @staticmethod
+    def _add_wildcard(trie, labels, server):
+        node = trie
+        for label in labels:
+            node = node[0].setdefault(label, [{}, None])
+        if node[1] is None:
+            node[1] = server
+
+    def build(self):
+        self._regex = combine_regexes([(pattern, True) for pattern, _ in self.regexes])
+
+    @staticmethod
+    def _longest_wildcard(trie, labels):
+        # a wildcard stands for one label at least, the last label is never consumed by the trie
+        node = trie
+        found = None
+        for label in labels[:-1]:
+            node = node[0].get(label)
+            if node is None:
+                break
+            if node[1] is not None:
+                found = node[1]
+        return found
+
+    def resolve(self, host):
+        server = self.exact.get(host)
+        if server is not None:
+            return server
+
+        labels = host.split('.')
+        server = self._longest_wildcard(self.leading, labels[::-1])
+        if server is not None:
+            return server
+        server = self._longest_wildcard(self.trailing, labels)
+        if server is not None:
+            return server
+
+        if self._regex is not None:
+            match = self._regex.match(host)
+            if match:
+                return self.regexes[int(match.lastgroup[1:])][1]
+        elif self.regexes:
+            for pattern, (_, server) in zip(self._patterns, self.regexes):
+                if pattern.search(host):
+                    return server
+
+        return self.default if self.default is not None else self.first
+
+
+class ServerNameIndex:
+    """
+    Finds the server nginx chooses for a request by its Host header.
+
+    The servers are grouped by listen address and port, a request to an address with no server listening on it
+    explicitly goes to the servers of the port on any address. In a group the name is looked up as nginx does:
+    the exact name from a dict, the longest leading wildcard then the longest trailing wildcard from label tries,
+    the first matching regex from one combined alternation, and at last the default_server of the group,
+    or its first server.
+    """
+    def __init__(self, servers):
+        self.listens = {}
+        for server in servers:
+            names = server.server_name if isinstance(server.server_name, list) else [server.server_name]
+            for listen in server.listen:
+                address_port = split_listen(listen['value'])
+                if address_port is None:
+                    continue
+                listen_servers = self.listens.get(address_port)
+                if listen_servers is None:
+                    listen_servers = self.listens[address_port] = _ListenServers()
+                listen_servers.add(server, names, listen['default_server'])
+
+        for listen_servers in self.listens.values():
+            listen_servers.build()
+
+    @staticmethod
+    def from_http(http_context):
+        return ServerNameIndex(http_context.servers)
+
+    def _listen_servers(self, port, address):
+        listen_servers = self.listens.get((address, port)) if address is not None else None
+        return listen_servers if listen_servers is not None else self.listens.get(('*', port))
+
+    def resolve(self, host, port=80, address=None):
+        """Return the server handling a request with the Host header to the address and port, or None"""
+        listen_servers = self._listen_servers(port, address)
+        if listen_servers is None:
+            return None
+        return listen_servers.resolve(normalize_host(host))
+
+    def resolve_many(self, hosts, port=80, address=None):
+        """Return the server of every Host header, each distinct header is looked up once"""
+        hosts = list(hosts)
+        listen_servers = self._listen_servers(port, address)
+        if listen_servers is None:
+            return [None] * len(hosts)
+
+        resolved = {}
+        servers = []
+        for host in hosts:
+            server = resolved.get(host, resolved)
+            if server is resolved:
+                server = resolved[host] = listen_servers.resolve(normalize_host(host))
+            servers.append(server)
+        return servers
@@ -1,33 +1,38 @@
 # coding=utf-8
-import re
-
-from .utils import extract_upstream_zone, extract_upstream_server_parameters, extract_context
+from .patterns import UPSTREAM_BLOCK, UPSTREAM_STATE, STREAM_UPSTREAM_SERVER, STREAM_SERVER_ADDRESS, \
+    STREAM_UPSTREAM_HASH, STREAM_UPSTREAM_KEEP_ALIVE
+from .utils import extract_upstream_zone, extract_upstream_server_parameters, extract_context_spans
 from .upstream_context import UpstreamContext
 
 
 class StreamContext:
-    upstreams = []
-    servers = []
+    upstreams = None
+    servers = None
+
+    def __init__(self):
+        self.upstreams = []
+        self.servers = []
 
     def load(self, content):
         # extracting upstreams
-        upstreams = re.findall(r'upstream\s+([a-zA-Z]+)\s+{([^}]*)', content)
+        upstreams = [UPSTREAM_BLOCK.match(content[start:end]).groups()
+                     for start, end in extract_context_spans(content, 'upstream')]
         for upstream in upstreams:
             self.upstreams.append(UpstreamContext(name=upstream[0], content=upstream[1]))
             to_append = dict(name=upstream[0], servers=[], zone=extract_upstream_zone(upstream[1]))
             # server directives
-            servers = re.findall(r'server\s+([^;]*)', upstream[1])
+            servers = STREAM_UPSTREAM_SERVER.findall(upstream[1])
             for server in servers:
                 to_append.get('servers').append(
-                    dict(address=re.search(r'^([0-9a-zA-Z.:/]+)', server).group(1),
+                    dict(address=STREAM_SERVER_ADDRESS.search(server).group(1),
                          parameters=extract_upstream_server_parameters(server)))
 
             # state directive
-            state = re.search(r'state\s+([^;]*)', upstream[1])
+            state = UPSTREAM_STATE.search(upstream[1])
             to_append['state'] = state.group(1) if state else None
 
             # hash directive
-            hash = re.search(r'hash\s+([^;]*)', upstream[1])
+            hash = STREAM_UPSTREAM_HASH.search(upstream[1])
             if hash:
                 consistent = 'consistent' in hash.group(1)
                 to_append['hash'] = dict(consistent=consistent, key=hash.group(1).split('consistent')[0].strip())
@@ -36,13 +41,13 @@ class StreamContext:
             to_append['ip_hash'] = 'ip_hash' in upstream[1]
 
             # keep_alive connections;
-            keep_alive = re.search(r'keep_alive\s+([^;]*)', upstreams[1])
+            keep_alive = STREAM_UPSTREAM_KEEP_ALIVE.search(upstream[1])
             to_append['keep_alive'] = keep_alive.group(1) if keep_alive else None
 
             self.upstreams.append(to_append)
 
         # extracting servers
-        servers = re.findall(r'server\s+{([^}]*)', content)
+        servers = [content[start:end] for start, end in extract_context_spans(content, 'server')]
 
 
 if __name__ == '__main__':
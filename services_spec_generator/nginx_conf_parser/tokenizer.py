@@ -0,0 +1,178 @@
+# coding=utf-8
+import mmap
+import os
+import re
+
+_TOKEN = re.compile(r'''
+    (?P<space>\s+)
+  | (?P<comment>\#[^\n]*)
+  | (?P<punct>[;{}])
+  | (?P<word>(?:"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'|\$\{[^}]*\}|[^\s;{}"'])+)
+  | (?P<error>.)
+''', re.VERBOSE | re.DOTALL)
+_BYTES_TOKEN = re.compile(_TOKEN.pattern.encode('ascii'), re.VERBOSE | re.DOTALL)
+
+# files from this size on are mapped instead of read, smaller ones are not worth a descriptor each
+MMAP_MIN_SIZE = 1024 * 1024
+
+# the children of a block left unparsed by ``parse(..., lazy=...)``, see ``parse_block``
+UNPARSED = ()
+
+
+class Source:
+    """The bytes of a configuration file, memory mapped when it is large; text is decoded from them on demand"""
+    __slots__ = ('path', 'data')
+
+    def __init__(self, path, data):
+        self.path = path
+        self.data = data
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            if size < MMAP_MIN_SIZE:
+                return Source(path, file.read())
+            return Source(path, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def __getitem__(self, key):
+        return self.data[key].decode('utf-8')
+
+    def __len__(self):
+        return len(self.data)
+
+    def __reduce__(self):
+        # a pickled source keeps its bytes, the file may have changed by the time it is loaded
+        return Source, (self.path, bytes(self.data))
+
+
+class ConfNode:
+    """A directive of a parsed configuration.
+
+    Simple directives have ``children`` set to None, blocks hold the list of their nested nodes.
+    ``start`` and ``end`` are offsets into ``source``: the whole statement for a simple directive,
+    the text between the braces for a block. Comments are kept as nodes named ``#``.
+    """
+    __slots__ = ('name', 'args', 'children', 'source', 'start', 'end')
+
+    def __init__(self, name, args, children, source, start, end):
+        self.name = name
+        self.args = args
+        self.children = children
+        self.source = source
+        self.start = start
+        self.end = end
+
+    @property
+    def text(self):
+        return self.source[self.start:self.end]
+
+    def __repr__(self):
+        return 'ConfNode({0!r}, {1!r})'.format(self.name, self.args)
+
+
+def tokenize(content):
+    """Yield ``(kind, value, offset)`` for every token of the given string in a single pass"""
+    for match in _TOKEN.finditer(content):
+        kind = match.lastgroup
+        if kind == 'space':
+            continue
+        if kind == 'error':
+            raise ValueError('Unterminated quoted string at offset {0}'.format(match.start()))
+        yield kind, match.group(), match.start()
+
+
+def parse(content, lazy=(), start=0, end=None):
+    """
+    Build the directive tree of the given string or ``Source``, returns the root block node.
+    Blocks named in ``lazy`` are only scanned for their closing brace, their children are ``UNPARSED``;
+    ``start`` and ``end`` limit the parse to a span of the content, as ``parse_block`` does
+    """
+    if isinstance(content, Source):
+        data, token, decode, braces = content.data, _BYTES_TOKEN, True, (b'{', b'}')
+    else:
+        data, token, decode, braces = content, _TOKEN, False, ('{', '}')
+    end = len(data) if end is None else end
+    root = ConfNode('', [], [], content, start, end)
+    stack = [root]
+    words = []
+    word_start = 0
+    # the depth of the braces in the lazy block being skipped
+    skipped = 0
+
+    for match in token.finditer(data, start, end):
+        kind = match.lastgroup
+        if kind == 'space':
+            continue
+        if kind == 'error':
+            raise ValueError('Unterminated quoted string at offset {0}'.format(match.start()))
+        offset = match.start()
+        if skipped:
+            if kind == 'punct':
+                value = match.group()
+                if value == braces[0]:
+                    skipped += 1
+                elif value == braces[1]:
+                    skipped -= 1
+                    if not skipped:
+                        stack.pop().end = offset
+            continue
+
+        value = match.group().decode('utf-8') if decode else match.group()
+        if kind == 'word':
+            if not words:
+                word_start = offset
+            words.append(value)
+        elif kind == 'comment':
+            stack[-1].children.append(ConfNode('#', [value[1:].strip()], None, content, offset, match.end()))
+        elif value == ';':
+            if words:
+                stack[-1].children.append(ConfNode(words[0], words[1:], None, content, word_start, offset + 1))
+                words = []
+        elif value == '{':
+            name = words[0] if words else ''
+            block = ConfNode(name, words[1:], UNPARSED if name in lazy else [], content, offset + 1, None)
+            stack[-1].children.append(block)
+            stack.append(block)
+            words = []
+            if name in lazy:
+                skipped = 1
+        else:
+            if len(stack) == 1:
+                raise ValueError('Unexpected "}}" at offset {0}'.format(offset))
+            if words:
+                stack[-1].children.append(ConfNode(words[0], words[1:], None, content, word_start, offset))
+                words = []
+            stack.pop().end = offset
+
+    if len(stack) != 1:
+        raise ValueError('Unexpected end of content, "}" expected')
+    if words:
+        root.children.append(ConfNode(words[0], words[1:], None, content, word_start, end))
+
+    return root
+
+
+def parse_block(node):
+    """Return the children of a block left ``UNPARSED``, parsed from its span of the source"""
+    return parse(node.source, start=node.start, end=node.end).children
+
+
+def unwrap(root, name):
+    """Return the first top-level block called ``name``, or the root itself when there is none"""
+    for node in root.children:
+        if node.name == name and node.children is not None:
+            return node
+    return root
+
+
+_QUOTED = re.compile(r'"((?:[^"\\]|\\.)*)"|\'((?:[^\'\\]|\\.)*)\'')
+_ESCAPE = re.compile(r'\\(["\'\\])')
+
+
+def unquote(word):
+    """Return the value of a word as nginx reads it: quotes removed, escaped quotes and backslashes unescaped"""
+    if '"' not in word and "'" not in word:
+        return word
+    return _QUOTED.sub(lambda match: _ESCAPE.sub(r'\1', match.group(1) if match.group(1) is not None
+                                                 else match.group(2)), word)
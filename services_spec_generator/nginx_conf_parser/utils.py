@@ -1,61 +1,82 @@
 # coding=utf-8
-import re
 from _io import TextIOWrapper
 
+from .patterns import BRACES, SERVER_WEIGHT, SERVER_MAX_CONNS, SERVER_MAX_FAILS, SERVER_FAIL_TIMEOUT, SERVER_ROUTE, \
+    SERVER_SERVICE, SERVER_SLOW_START, UPSTREAM_ZONE, context_scanner, context_start
 
-def extract_context(conffile, context_name):
+
+def _read_content(conffile):
     if not isinstance(conffile, TextIOWrapper) and not isinstance(conffile, str):
         raise TypeError('Invalid configuration file given, must be a file stream or a string')
 
-    if isinstance(conffile, TextIOWrapper):
-        content = conffile.read().replace('\n', ' ')
-    else:
-        content = conffile.replace('\n', ' ')
+    return conffile.read() if isinstance(conffile, TextIOWrapper) else conffile
 
-    try:
-        context_begin_index = re.search(context_name + '\s+{', content).start()
-        context_string = ''
 
-        depth = 0
+def extract_context_spans(conffile, context_name):
+    """Return the (start, end) offsets of every ``context_name`` block in a single pass.
+
+    Blocks nested inside an already matched block are part of its span and are not reported on their own,
+    so for a merged configuration this gives all the server blocks of the http context.
+    """
+    content = _read_content(conffile)
+
+    spans = []
+    depth = 0
+    start = None
+    start_depth = 0
+    for match in context_scanner(context_name).finditer(content):
+        if match.group() == '}':
+            depth -= 1
+            if start is not None and depth == start_depth:
+                spans.append((start, match.end()))
+                start = None
+        else:
+            if start is None and match.group() != '{':
+                start = match.start()
+                start_depth = depth
+            depth += 1
 
-        for c in content[context_begin_index:]:
-            if c == '{':
-                depth += 1
-                context_string += c
-                continue
+    if start is not None:
+        spans.append((start, len(content)))
 
-            if c == '}':
-                depth -= 1
-                context_string += c
-                if depth == 0:
-                    break
-                else:
-                    continue
+    return spans
 
-            context_string += c
 
-        return context_string
+def extract_context(conffile, context_name):
+    content = _read_content(conffile)
+
+    try:
+        context_begin_index = context_start(context_name).search(content).start()
     except AttributeError:
         return ''
 
+    # the block ends with the brace closing the first one found after the context name
+    depth = 0
+    for brace in BRACES.finditer(content, context_begin_index):
+        depth += 1 if brace.group() == '{' else -1
+        if depth == 0:
+            return content[context_begin_index:brace.end()].replace('\n', ' ')
+
+    return content[context_begin_index:].replace('\n', ' ')
+
 
 def extract_upstream_server_parameters(to_parse):
     parameters = {}
 
     # weight=number
-    weight = re.search(r'weight=([0-9]+)', to_parse)
+    weight = SERVER_WEIGHT.search(to_parse)
     parameters['weight'] = int(weight.group(1)) if weight else None
 
     # max_conns=number
-    max_conns = re.search(r'max_conns=([0-9]+)', to_parse)
+    max_conns = SERVER_MAX_CONNS.search(to_parse)
     parameters['max_conns'] = int(max_conns.group(1)) if max_conns else None
 
     # max_fails=number
-    max_fails = re.search(r'max_fails=([0-9]+)', to_parse)
+    max_fails = SERVER_MAX_FAILS.search(to_parse)
     parameters['max_fails'] = int(max_fails.group(1)) if max_conns else None
 
     # fail_timeout=time
-    fail_timeout = re.search(r'fail_timeout=([0-9a-zA-Z]+)', to_parse)
+    fail_timeout = SERVER_FAIL_TIMEOUT.search(to_parse)
     parameters['fail_timeout'] = fail_timeout.group(1) if fail_timeout else None
 
     # backup, down, resolve, drain
@@ -65,21 +86,21 @@ def extract_upstream_server_parameters(to_parse):
     parameters['drain'] = 'drain' in to_parse
 
     # route=string
-    route = re.search(r'route=([a-zA-Z0-9.-_\\/]+)', to_parse)
+    route = SERVER_ROUTE.search(to_parse)
     parameters['route'] = route.group(1) if route else None
 
     # service=string
-    service = re.search(r'service=([a-zA-Z0-9.-_\\/]+)', to_parse)
+    service = SERVER_SERVICE.search(to_parse)
     parameters['service'] = service.group(1) if service else None
 
     # slow_start=time
-    slow_start = re.search(r'slow_start=([a-zA-Z0-9]+)', to_parse)
+    slow_start = SERVER_SLOW_START.search(to_parse)
     parameters['slow_start'] = slow_start.group(1) if slow_start else None
 
     return parameters
 
 
 def extract_upstream_zone(to_parse):
-    zone = re.search(r'zone\s+([a-zA-Z0-9_\-.]+)\s*?([a-z0-9]+)?;', to_parse)
+    zone = UPSTREAM_ZONE.search(to_parse)
     return dict(name=zone.group(1), size=zone.group(2)) if zone and zone.group(2) else \
         dict(name=zone.group(1), size=None) if zone else None
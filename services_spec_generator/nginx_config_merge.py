@@ -1,6 +1,9 @@
 #!/usr/bin/env python
 import sys
 import glob
+import hashlib
+import os
+import pickle
 import string
 
 from pyparsing import (
@@ -8,6 +11,8 @@ from pyparsing import (
     LineEnd, Optional, OneOrMore, ZeroOrMore, pythonStyleComment, printables
 )
 
+from services_spec_generator.nginx_conf_parser.tokenizer import ConfNode, Source, parse
+
 
 class NginxParser:
     """
@@ -71,19 +76,199 @@ class NginxParser:
         return self.parse().asList()
 
 
-def parse_file(path):
-    _file = open(path)
-    return NginxParser(_file.read()).as_list()
+class ParseCache:
+    """
+    A directory of parsed trees keyed by file path and content hash,
+    least recently used entries are evicted once the directory grows over max_size bytes
+    """
+    def __init__(self, directory, max_size=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_size = max_size
+        self._size = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _entry_path(self, path, source, kind):
+        digest = hashlib.sha256(kind.encode('utf-8') + b'\0' + os.path.abspath(path).encode('utf-8') + b'\0' +
+                                source.encode('utf-8'))
+        return os.path.join(self.directory, digest.hexdigest() + '.pickle')
+
+    def get(self, path, source, kind='pyparsing'):
+        entry_path = self._entry_path(path, source, kind)
+        try:
+            with open(entry_path, 'rb') as entry:
+                parsed = pickle.load(entry)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+        try:
+            os.utime(entry_path)  # mark as recently used
+        except FileNotFoundError:
+            pass  # evicted by a concurrent process meanwhile
+        return parsed
+
+    def put(self, path, source, parsed, kind='pyparsing'):
+        entry_path = self._entry_path(path, source, kind)
+        tmp_path = '{0}.{1}.tmp'.format(entry_path, os.getpid())
+        with open(tmp_path, 'wb') as entry:
+            pickle.dump(parsed, entry, pickle.HIGHEST_PROTOCOL)
+        try:
+            # an entry put again replaces the one counted already
+            replaced_size = os.path.getsize(entry_path)
+        except FileNotFoundError:
+            replaced_size = 0
+        os.replace(tmp_path, entry_path)
+
+        if self._size is None:
+            self.evict()
+        else:
+            self._size += os.path.getsize(entry_path) - replaced_size
+            if self._size > self.max_size:
+                self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.pickle'):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass  # several processes may share the directory
+            total_size -= size
+
+        self._size = total_size
+
+
+def parse_file(path, cache=None):
+    with open(path) as _file:
+        source = _file.read()
+
+    if cache is None:
+        return NginxParser(source).as_list()
+
+    parsed = cache.get(path, source)
+    if parsed is None:
+        parsed = NginxParser(source).as_list()
+        cache.put(path, source, parsed)
+    return parsed
+
+
+def parse_tree_file(path, cache=None, lazy=()):
+    """
+    Return the directive tree of the file, see nginx_conf_parser.tokenizer.
+    With lazy blocks the file is mapped and left out of the cache, which would read it into memory
+    """
+    if lazy:
+        return parse(Source.load(path), lazy)
+
+    with open(path) as _file:
+        source = _file.read()
+
+    if cache is None:
+        return parse(source)
+
+    tree = cache.get(path, source, kind='tree')
+    if tree is None:
+        tree = parse(source)
+        cache.put(path, source, tree, kind='tree')
+    return tree
+
+
+def file_stats(paths):
+    """Return the (path, mtime, size) of every file, (path, None, None) of a missing one, to tell when they change"""
+    stats = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stats.append((path, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            stats.append((path, None, None))
+    return stats
+
+
+class IncludeResolver:
+    """
+    Builds one directive tree out of nginx configuration files: the parsed trees of included files
+    take the place of their include directives. Every file is read and parsed once, however many times it is included.
+    Blocks named in lazy are left unparsed, their includes are resolved by ``splice`` once they are parsed
+    """
+    def __init__(self, cache=None, lazy=()):
+        self.cache = cache
+        self.lazy = lazy
+        self.files = []
+        self._resolved = {}
+        self._resolving = []
+
+    def load(self, path):
+        """Return a root node holding the resolved nodes of the file"""
+        return ConfNode('', [], self._file_nodes(path), '', 0, 0)
+
+    def include(self, masks):
+        """Return the resolved nodes of every file matched by the masks, as the include directive does"""
+        nodes = []
+        for mask in masks:
+            for path in sorted(glob.glob(mask.strip('"\''))):
+                nodes.extend(self._file_nodes(path))
+        return nodes
+
+    def _file_nodes(self, path):
+        key = os.path.abspath(path)
+        if key in self._resolved:
+            return self._resolved[key]
+        if key in self._resolving:
+            raise ValueError('Include cycle: {0}'.format(' -> '.join(self._resolving + [key])))
+
+        self.files.append(path)
+        self._resolving.append(key)
+        try:
+            nodes = self.splice(parse_tree_file(path, self.cache, self.lazy).children)
+        finally:
+            self._resolving.pop()
+
+        self._resolved[key] = nodes
+        return nodes
+
+    def splice(self, nodes):
+        """Return the nodes with their include directives resolved, the nodes are left as they are"""
+        spliced = None
+        for index, node in enumerate(nodes):
+            replacement = None
+            if node.children is None:
+                if node.name == 'include':
+                    replacement = self.include(node.args)
+            else:
+                children = self.splice(node.children)
+                if children is not node.children:
+                    replacement = [ConfNode(node.name, node.args, children, node.source, node.start, node.end)]
+
+            # parsed trees may be shared through the cache, nodes are copied instead of edited in place
+            if replacement is not None and spliced is None:
+                spliced = list(nodes[:index])
+            if spliced is not None:
+                spliced.extend([node] if replacement is None else replacement)
+
+        return nodes if spliced is None else spliced
 
 
 class NginxMergedDumper:
     """
     A class that (recursively) merge nginx configuration files into one string
     """
-    def __init__(self, path, indentation=4, spacer=' '):
+    def __init__(self, path, indentation=4, spacer=' ', cache=None):
         self.lines = []
+        self.files = []
         self.indentation = indentation
         self.spacer = spacer
+        self.cache = cache
         self.inline_file(path)
 
     def add_line(self, line):
@@ -121,7 +306,8 @@ class NginxMergedDumper:
             x = 5
 
     def inline_file(self, path, current_indent=0):
-        parsed = parse_file(path)
+        self.files.append(path)
+        parsed = parse_file(path, self.cache)
         self.dump(parsed, current_indent)
 
     def as_string(self):
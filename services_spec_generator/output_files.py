@@ -0,0 +1,19 @@
+# coding=utf-8
+import contextlib
+import os
+
+
+@contextlib.contextmanager
+def atomic_open(file_name, mode='w', **kwargs):
+    """
+    Open a temporary file next to file_name which replaces it once written,
+    a reader of file_name sees the previous content or the new one, never a part of it
+    """
+    tmp_path = '{0}.{1}.tmp'.format(file_name, os.getpid())
+    try:
+        with open(tmp_path, mode, **kwargs) as file:
+            yield file
+        os.replace(tmp_path, file_name)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -1,17 +1,34 @@
 import argparse
+import contextlib
+import glob
+import json
+import logging
 import os
+import pickle
 import re
-from typing import List
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Iterable, List
 
+import numpy as np
 import requests
 import pandas as pd
 from pyhocon import ConfigFactory, ConfigTree
 from tabulate import tabulate
 
+from services_spec_generator.bind_zone import HostIndex
+from services_spec_generator.conf_watcher import make_watcher, wait_for_changes
 from services_spec_generator.nginx_conf_parser.http_context import HttpContext
-from services_spec_generator.nginx_config_merge import NginxMergedDumper
+from services_spec_generator.nginx_conf_parser.tokenizer import ConfNode
+from services_spec_generator.nginx_config_merge import IncludeResolver, ParseCache, file_stats
+from services_spec_generator.output_files import atomic_open
+from services_spec_generator.reports import REPORT_FORMATS, make_reports, write_reports
+from services_spec_generator.snapshot import load_snapshot
 
 
+logger = logging.getLogger(__name__)
+
 dir_path = os.path.dirname(os.path.realpath(__file__))
 
 config = ConfigTree(
@@ -20,27 +37,14 @@ config = ConfigTree(
 
 
 def get_hosts_ips(bind_zones_file_location):
-    map_ips = {}  # {'192.168.0.1': ['example.com', 'work.example.com']}
-    map_hosts = {}  # {'exmaple.com': '192.168.1.1'}
-
-    with open(bind_zones_file_location, 'r', encoding='utf-8') as file:
-        for line in file:
-
-            # for parse such record: d-1cdb1      IN      A      10.69.0.241
-            zone_record = re.search(r'([^\s;]*)\s+IN\s+A\s+([\d\.]+)', line)
-            host = zone_record.group(1) if zone_record else None
-            ip = zone_record.group(2) if zone_record else None
-
-            if host is not None:
-                map_hosts[host] = ip
-                if ip in map_ips:
-                    map_ips[ip].append(host)
-                else:
-                    map_ips[ip] = [host]
-
-    print('map_ips\n', map_ips)
-    print('map_hosts\n', map_hosts)
-    print()
+    """Return the hosts of every ip and the ip of every host of the bind zone file"""
+    index = HostIndex.from_zone_file(bind_zones_file_location)
+    map_ips = index.by_ip  # {'192.168.0.1': ['example.com', 'work.example.com']}
+    map_hosts = index.by_host  # {'exmaple.com': '192.168.1.1'}
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug('map_ips\n %s', dict(map_ips))
+        logger.debug('map_hosts\n %s', dict(map_hosts))
     return map_ips, map_hosts
 
 
@@ -67,40 +71,96 @@ def is_host(content):
     return True if matched else False
 
 
-git_projects_cache = {}
+GITLAB_MAX_WORKERS = 8
+GITLAB_TIMEOUT = 10  # seconds
 
+git_projects_cache = {}  # {'services/suparservice': {'name': 'suparservice', 'web_url': 'https://...'}}
+git_projects_fetched_at = {}  # {'services/suparservice': 1600000000.0}, only these are kept on disk
 
-def get_git_project_details(git_project):
-    base_url = f'{config.gitlab_base_url}/projects/'
 
+def get_git_project_path(git_project):
+    project = git_project.replace("https://", "")
+    project = project.replace("http://", "")
+    project = project.replace("gitlab.yourltd.com/", "")
+    project = project[:-1] if project[-1] == "/" else project  # remove trailing slash
+    return project
+
+
+def make_gitlab_session(max_workers=GITLAB_MAX_WORKERS):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['Private-Token'] = config.gitlab_private_token
+    return session
+
+
+def fetch_git_project_details(session, project, timeout=GITLAB_TIMEOUT):
+    """Return the project details, or None if the lookup failed and should be retried next run"""
+    url = f'{config.gitlab_base_url}/projects/' + requests.utils.quote(project, safe='')
+    try:
+        response = session.get(url, timeout=timeout)
+    except requests.RequestException as e:
+        print(f'WARN: {url} failed [{e}]')
+        return None
+
+    if response.status_code != 200:
+        print(f'WARN: {url} returned [{response.status_code}]')
+        return {'name': '', 'web_url': ''} if response.status_code == 404 else None
+
+    details = response.json()
+    return {'name': details['name'], 'web_url': details['web_url']}
+
+
+def fetch_git_projects_details(git_projects, max_workers=GITLAB_MAX_WORKERS, timeout=GITLAB_TIMEOUT):
+    """Look up every project missing from git_projects_cache concurrently over one pooled session"""
+    projects = sorted({get_git_project_path(_) for _ in git_projects if _ is not None} - git_projects_cache.keys())
+    if not projects:
+        return
+
+    with make_gitlab_session(max_workers) as session, \
+            ThreadPoolExecutor(max_workers=min(max_workers, len(projects))) as executor:
+        details = executor.map(lambda project: fetch_git_project_details(session, project, timeout), projects)
+        for project, project_details in zip(projects, details):
+            if project_details is None:
+                git_projects_cache[project] = {'name': '', 'web_url': ''}
+            else:
+                git_projects_cache[project] = project_details
+                git_projects_fetched_at[project] = time.time()
+
+
+def get_git_project_details(git_project):
     default_result = {'name': '', 'web_url': ''}
     if git_project is None:
         return default_result
 
-    def extract_project():
-        project = git_project.replace("https://", "")
-        project = project.replace("http://", "")
-        project = project.replace("gitlab.yourltd.com/", "")
-        project = project[:-1] if project[-1] == "/" else project  # remove trailing slash
-        return project
+    project = get_git_project_path(git_project)
+    if project not in git_projects_cache:
+        fetch_git_projects_details([git_project])
 
-    project = extract_project()
+    return git_projects_cache[project]
 
-    if project in git_projects_cache:
-        return git_projects_cache[project]
-    else:
-        project_encoded = requests.utils.quote(project, safe='')
-        response = requests.get(base_url + project_encoded,
-                                headers={"Private-Token": config.gitlab_private_token})
 
-        if response.status_code != 200:
-            git_projects_cache[project] = default_result
-            print(f'WARN: {base_url + project_encoded} returned [{response.status_code}]')
-        else:
-            print(response.json())
-            git_projects_cache[project] = response.json()
+def load_git_projects_cache(cache_file_path, ttl):
+    """Fill git_projects_cache with the lookups saved on disk less than ttl seconds ago"""
+    try:
+        with open(cache_file_path, 'r', encoding='utf-8') as cache_file:
+            entries = json.load(cache_file)
+    except (OSError, ValueError):
+        return
+
+    now = time.time()
+    for project, entry in entries.items():
+        if now - entry['fetched_at'] < ttl:
+            git_projects_cache[project] = entry['details']
+            git_projects_fetched_at[project] = entry['fetched_at']
 
-        return git_projects_cache[project]
+
+def save_git_projects_cache(cache_file_path):
+    entries = {project: {'fetched_at': fetched_at, 'details': git_projects_cache[project]}
+               for project, fetched_at in git_projects_fetched_at.items()}
+    with atomic_open(cache_file_path, 'w', encoding='utf-8') as cache_file:
+        json.dump(entries, cache_file)
 
 
 class RowItem:
@@ -125,15 +185,94 @@ class RowItem:
 
 
 class DataTable:
-    def __init__(self):
-        self.rows: List[RowItem] = []
+    """
+    Rows stored by columns: port is an integer array, every other column keeps each distinct value once
+    and an array of the value codes of its rows, None is coded -1
+    """
+    header = RowItem.get_header()
+    string_columns = [_ for _ in header if _ != 'port']
+
+    def __init__(self, rows=()):
+        self.ports = array('i')
+        self.codes = {name: array('i') for name in self.string_columns}
+        self.values = {name: [] for name in self.string_columns}
+        self._value_codes = {name: {} for name in self.string_columns}
+        self.extend(rows)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_value_codes']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._value_codes = {name: {value: code for code, value in enumerate(values)}
+                             for name, values in self.values.items()}
+
+    def __len__(self):
+        return len(self.ports)
+
+    def __iter__(self):
+        for values in self.tuples():
+            yield RowItem(*values)
+
+    def tuples(self):
+        """Yield the values of every row in the header order"""
+        return zip(*[self._column(name) for name in self.header])
+
+    def _column(self, name):
+        if name == 'port':
+            return self.ports
+        # the code -1 of None picks the None put at the end
+        return map((self.values[name] + [None]).__getitem__, self.codes[name])
+
+    def append(self, row: RowItem):
+        self.extend((row,))
+
+    def extend(self, rows: Iterable[RowItem]):
+        columns = [(name, self.codes[name].append, self.values[name].append, self._value_codes[name])
+                   for name in self.string_columns]
+        append_port = self.ports.append
+        for row in rows:
+            for name, append_code, append_value, value_codes in columns:
+                value = getattr(row, name)
+                code = value_codes.get(value)
+                if code is None:
+                    if value is None:
+                        code = -1
+                    else:
+                        code = value_codes[value] = len(value_codes)
+                        append_value(value)
+                append_code(code)
+            append_port(row.port)
+
+    @property
+    def rows(self) -> List[RowItem]:
+        """The rows made again from the columns"""
+        return list(self)
 
     def to_list(self):
-        return [row.to_list() for row in self.rows]
+        return [list(_) for _ in self.tuples()]
+
+    def to_frame(self):
+        """Return the columns as a DataFrame of categorical string columns, categories in sort order"""
+        columns = {}
+        for name in self.header:
+            if name == 'port':
+                columns[name] = np.array(self.ports, dtype=np.int64)
+                continue
+            values = self.values[name]
+            order = sorted(range(len(values)), key=values.__getitem__)
+            # the rank of a code in the sorted values, the code -1 of None picks the extra -1 at the end
+            ranks = np.full(len(values) + 1, -1, dtype=np.intc)
+            ranks[order] = np.arange(len(values))
+            codes = ranks[np.frombuffer(self.codes[name], dtype=np.intc)] if len(self) else []
+            columns[name] = pd.Categorical.from_codes(codes, [values[_] for _ in order])
+        return pd.DataFrame(columns, columns=self.header)
 
     def get_headers(self):
-        if len(self.rows) > 0:
-            return self.rows[0].get_header()
+        if len(self) > 0:
+            return list(self.header)
         return []
 
 
@@ -155,11 +294,14 @@ class ConsolePrint(IPrintResults):
 
     @staticmethod
     def print_table(tbl: DataTable):
-        prepared_table = tbl.to_list()
+        prepared_table = tbl.tuples()
         print(tabulate(prepared_table, headers=tbl.get_headers(), tablefmt='simple'))
 
 
 class FileCSVPrint(IPrintResults):
+    file_name = 'services_table.csv'
+    header = 'domain,service_name,service_git_url,upstream,stand,host,ip,port,location\n'
+
     @staticmethod
     def format_row(row: RowItem):
         return f'{row.domain},{row.service_name},{row.service_git_url},{row.upstream},' + \
@@ -167,115 +309,403 @@ class FileCSVPrint(IPrintResults):
 
     @staticmethod
     def print_table(tbl: DataTable):
-        with open('services_table.csv', 'w', encoding='utf-8') as file:
-            file.write('domain,service_name,service_git_url,upstream,stand,host,ip,port,location\n')
-            for row in tbl.rows:
+        with atomic_open(FileCSVPrint.file_name, 'w', encoding='utf-8') as file:
+            file.write(FileCSVPrint.header)
+            # the same text as format_row, without making the row items
+            for domain, service_name, service_git_url, upstream, stand, host, ip, port, location in tbl.tuples():
+                file.write(f'{domain},{service_name},{service_git_url},{upstream},'
+                           f'{stand},{host},{ip},{port},{location}\n')
+
+    @staticmethod
+    def print_rows(rows: Iterable[RowItem]):
+        with atomic_open(FileCSVPrint.file_name, 'w', encoding='utf-8') as file:
+            file.write(FileCSVPrint.header)
+            for row in rows:
                 file.write(FileCSVPrint.format_row(row) + '\n')
 
 
+class FileJsonLinesPrint(IPrintResults):
+    file_name = 'services_table.jsonl'
+    header = ''
+
+    @staticmethod
+    def format_row(row: RowItem):
+        return json.dumps(dict(zip(RowItem.get_header(), row.to_list())), ensure_ascii=False)
+
+    @staticmethod
+    def print_table(tbl: DataTable):
+        FileJsonLinesPrint.print_rows(tbl)
+
+    @staticmethod
+    def print_rows(rows: Iterable[RowItem]):
+        with atomic_open(FileJsonLinesPrint.file_name, 'w', encoding='utf-8') as file:
+            for row in rows:
+                file.write(FileJsonLinesPrint.format_row(row) + '\n')
+
+
 class HtmlPrint(IPrintResults):
+    file_name = 'services_table.html'
+
     @staticmethod
     def format_row(row: RowItem):
         pass
 
     @staticmethod
     def print_table(tbl: DataTable):
-        df = pd.DataFrame(tbl.to_list(), columns=['domain', 'service_name', 'service_git_url', 'upstream',
-                                                  'stand', 'host', 'ip', 'port', 'location'])
+        df = tbl.to_frame()
 
         sorted_grouped_by_tbl = df \
             .sort_values(['port', 'service_name', 'service_git_url', 'stand', 'domain', 'location'], ascending=True) \
-            .groupby(['port', 'service_name', 'service_git_url', 'stand', 'domain', 'location'], as_index=True) \
+            .groupby(['port', 'service_name', 'service_git_url', 'stand', 'domain', 'location'], as_index=True,
+                     observed=True) \
             .count()
 
         desired_table = sorted_grouped_by_tbl.drop(columns=['upstream', 'host', 'ip'])
 
         # print(desired_table.to_string())
         html = desired_table.to_html(justify='left')
-        with open('services_table.html', 'w') as file:
+        with atomic_open(HtmlPrint.file_name, 'w') as file:
             file.write(html)
 
 
-def make_single_nginx_conf(upstreams_conf_file_path,
-                           sites_available_conf_files_path):
-    nginx_conf_file = './nginx.conf'
-    with open(nginx_conf_file, 'w', encoding='utf-8') as nginx_conf_to_resolve:
-        nginx_conf_to_resolve.write("http { \n")
-        nginx_conf_to_resolve.write(f"\t include {upstreams_conf_file_path};\n")
-        nginx_conf_to_resolve.write(f"\t include {sites_available_conf_files_path};\n")
-        nginx_conf_to_resolve.write("}")
+OUTPUTS = ('console', 'csv', 'json_lines', 'html', 'report')
+
+
+def make_http_tree(upstreams_conf_file_path,
+                   sites_available_conf_files_path,
+                   parse_cache=None):
+    """Return an http block holding the upstreams and sites conf files, includes resolved"""
+    resolver = IncludeResolver(parse_cache)
+    nodes = resolver.include([upstreams_conf_file_path, sites_available_conf_files_path])
+    return ConfNode('http', [], nodes, '', 0, 0)
+
+
+class UpstreamIndex:
+    """
+    Upstreams by name, the backends of an upstream are resolved once on first use:
+    the service, stand, host, ip and port of every host behind every upstream server
+    """
+    def __init__(self, upstreams_map, map_ips, map_host):
+        self.upstreams_map = upstreams_map
+        self.map_ips = map_ips
+        self.map_host = map_host
+        self._backends = {}
 
-    # resolve all includes
-    conf_file = NginxMergedDumper(nginx_conf_file).as_string()
-    return conf_file
+    @staticmethod
+    def from_upstreams(upstreams, map_ips, map_host):
+        return UpstreamIndex({_.name: _ for _ in upstreams}, map_ips, map_host)
+
+    def backends(self, upstream_name):
+        """
+        Return the (service_name, service_git_url, upstream, stand, host, ip, port) of the upstream,
+        a name which is no upstream has no backends
+        """
+        backends = self._backends.get(upstream_name)
+        if backends is None:
+            backends = self._backends[upstream_name] = self._resolve(upstream_name)
+        return backends
+
+    def _resolve(self, upstream_name):
+        upstream = self.upstreams_map.get(upstream_name)
+        if upstream is None:
+            # an address proxied to directly has no service, it is not looked up in the bind zone
+            return []
+        project_details = get_git_project_details(upstream.git_project)
+
+        backends = []
+        for upstream_server in upstream.servers:
+            if ":" in upstream_server['address']:
+                host, port = upstream_server['address'].split(":")
+            else:
+                host = upstream_server['address']
+                port = None
+
+            if is_ip(host):
+                ip = host
+                hosts = self.map_ips[ip]
+            else:
+                host = host.replace('.yourltd.com', '')
+                ip = self.map_host[host]
+                hosts = [host]
+
+            for host in hosts:
+                backends.append((project_details["name"], project_details["web_url"], upstream_name,
+                                 define_stand_by_host(host), host, ip, port))
+
+        return backends
+
+
+def make_server_rows(server, upstream_index):
+    """Yield the rows of every proxied location of the server, joined with the backends of its upstream"""
+    if isinstance(server.server_name, list):
+        domains = server.server_name
+    else:
+        domains = [server.server_name]
+    if not domains:
+        return
+
+    for location in server.location:
+        if location.proxy_pass is None or location.proxy_pass_upstream is None:  # если proxy_pass нет
+            continue
+        backends = upstream_index.backends(location.proxy_pass_upstream)
+
+        location_path = location.path
+        for domain in domains:
+            for backend in backends:
+                yield RowItem(domain, *backend, location_path)
 
 
 def parse_server(upstreams_conf_file_path,
                  sites_available_conf_files_path,
-                 bind_zones_file_location):
-    conf_file = make_single_nginx_conf(upstreams_conf_file_path, sites_available_conf_files_path)
-    parsed_http_context = HttpContext(conf_file)
+                 bind_zones_file_location,
+                 parse_cache=None):
+    return DataTable(parse_server_rows(upstreams_conf_file_path, sites_available_conf_files_path,
+                                       bind_zones_file_location, parse_cache))
+
+
+def parse_server_rows(upstreams_conf_file_path,
+                      sites_available_conf_files_path,
+                      bind_zones_file_location,
+                      parse_cache=None,
+                      bounded_memory=False):
+    """
+    Yield the rows of parse_server one by one, the confs are parsed when the first row is taken.
+    With bounded_memory the conf files are mapped and a server block is parsed only while its rows are made
+    """
+    if bounded_memory:
+        resolver = IncludeResolver(lazy=('server',))
+        nodes = resolver.include([upstreams_conf_file_path, sites_available_conf_files_path])
+        parsed_http_context = HttpContext(ConfNode('http', [], nodes, '', 0, 0), resolver)
+    else:
+        http_tree = make_http_tree(upstreams_conf_file_path, sites_available_conf_files_path, parse_cache)
+        parsed_http_context = HttpContext(http_tree)
     map_ips, map_host = get_hosts_ips(bind_zones_file_location)
 
-    result_table = DataTable()
-    upstreams_map = {}
-    for upstream in parsed_http_context.upstreams:
-        upstreams_map[upstream.name] = upstream
-
-    for server in parsed_http_context.servers:
-        server_listen_port = server.listen[0]['value']
-        for location in server.location:
-            if isinstance(server.server_name, list):
-                domains = server.server_name
-            else:
-                domains = [server.server_name]
-
-            for domain in domains:
-                if location.proxy_pass is None or location.proxy_pass_upstream is None:  # если proxy_pass нет
-                    continue
-                upstream_name = location.proxy_pass_upstream
-
-                if upstream_name in upstreams_map.keys():
-                    upstream_servers = upstreams_map[upstream_name].servers
-                else:
-                    upstream_servers = [{'address': upstream_name}]
-
-                location_path = location.path
-                for upstream_server in upstream_servers:
-                    # print( upstream_server, upstream_name, domain)
-                    if ":" in upstream_server['address']:
-                        host, port = upstream_server['address'].split(":")
-                    else:
-                        host = upstream_server['address']
-                        port = None
+    yield from make_http_rows(parsed_http_context, map_ips, map_host)
+
+
+def make_http_rows(http_context, map_ips, map_host):
+    upstream_index = UpstreamIndex.from_upstreams(http_context.upstreams, map_ips, map_host)
+    fetch_git_projects_details(_.git_project for _ in http_context.upstreams)
+
+    for server in http_context.servers:
+        yield from make_server_rows(server, upstream_index)
+        # a no-op unless the server was left unparsed in the bounded memory mode
+        server.release()
+
+
+def make_http_table(http_context, map_ips, map_host):
+    return DataTable(make_http_rows(http_context, map_ips, map_host))
+
+
+# bind zone maps of a fleet worker process, sent once per process instead of once per host
+_fleet_zone_maps = None
 
-                    if is_ip(host):
-                        ip = host
-                        hosts = map_ips[ip]
-                    else:
-                        host = host.replace('.yourltd.com', '')
-                        ip = map_host[host]
-                        hosts = [host]
-
-                    for host in hosts:
-                        stand = define_stand_by_host(host)
-
-                        if upstream_name in upstreams_map.keys():
-                            project_details = get_git_project_details(upstreams_map[upstream_name].git_project)
-
-                            row = RowItem(domain=domain,
-                                          service_name=project_details["name"],
-                                          service_git_url=project_details["web_url"],
-                                          upstream=upstream_name,
-                                          stand=stand,
-                                          host=host,
-                                          ip=ip, port=port,
-                                          location=location_path)
-                            result_table.rows.append(row)
+
+def _init_fleet_worker(map_ips, map_host, git_projects, git_projects_fetched):
+    global _fleet_zone_maps
+    _fleet_zone_maps = (map_ips, map_host)
+    git_projects_cache.update(git_projects)
+    git_projects_fetched_at.update(git_projects_fetched)
+
+
+def parse_host(host_dir_path, upstreams_conf_file_path, sites_available_conf_files_path, parse_cache=None):
+    """Parse a host directory of the fleet, conf paths are relative to it"""
+    map_ips, map_host = _fleet_zone_maps
+    http_tree = make_http_tree(os.path.join(host_dir_path, upstreams_conf_file_path),
+                               os.path.join(host_dir_path, sites_available_conf_files_path),
+                               parse_cache)
+
+    return make_http_table(HttpContext(http_tree), map_ips, map_host)
+
+
+def _parse_fleet_host(host_dir_path, upstreams_conf_file_path, sites_available_conf_files_path, parse_cache):
+    table = parse_host(host_dir_path, upstreams_conf_file_path, sites_available_conf_files_path, parse_cache)
+    # hand the lookups made by the worker back to the parent to be saved
+    return table, {_: (git_projects_cache[_], git_projects_fetched_at[_]) for _ in git_projects_fetched_at}
+
+
+def parse_fleet(hosts_dirs_path,
+                bind_zones_file_location,
+                upstreams_conf_file_path='conf.d/backends.conf',
+                sites_available_conf_files_path='sites-available/*.conf',
+                max_workers=None,
+                parse_cache=None):
+    """Parse every host directory matched by the hosts_dirs_path glob in a process pool into one table"""
+    host_dirs_paths = sorted(_ for _ in glob.glob(hosts_dirs_path) if os.path.isdir(_))
+    map_ips, map_host = get_hosts_ips(bind_zones_file_location)
+
+    result_table = DataTable()
+    if not host_dirs_paths:
+        return result_table
+
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             initializer=_init_fleet_worker,
+                             initargs=(map_ips, map_host, git_projects_cache, git_projects_fetched_at)) as executor:
+        tables = executor.map(_parse_fleet_host,
+                              host_dirs_paths,
+                              [upstreams_conf_file_path] * len(host_dirs_paths),
+                              [sites_available_conf_files_path] * len(host_dirs_paths),
+                              [parse_cache] * len(host_dirs_paths))
+        for table, git_projects in tables:
+            result_table.extend(table)
+            for project, (details, fetched_at) in git_projects.items():
+                git_projects_cache[project] = details
+                git_projects_fetched_at[project] = fetched_at
 
     return result_table
 
 
+class IncrementalParser:
+    """
+    Keeps the upstreams, servers and rows parsed from every source file,
+    so that a rerun only parses the files changed since the previous one
+    """
+    def __init__(self, upstreams_conf_file_path, sites_available_conf_files_path, bind_zones_file_location,
+                 parse_cache=None):
+        self.upstreams_conf_file_path = upstreams_conf_file_path
+        self.sites_available_conf_files_path = sites_available_conf_files_path
+        self.bind_zones_file_location = bind_zones_file_location
+        self.parse_cache = parse_cache
+
+        # source file path -> dict(stats, upstreams, servers, rows)
+        self.sources = {}
+        self.bind_zones_stats = None
+        self.map_ips, self.map_host = {}, {}
+        self.upstreams_map = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['parse_cache'] = None
+        return state
+
+    def _source_paths(self):
+        paths = [self.upstreams_conf_file_path]
+        # sorted as the include directive does, the rows are in the order of parse_server
+        for path in sorted(glob.glob(self.sites_available_conf_files_path)):
+            if path not in paths:
+                paths.append(path)
+        return paths
+
+    def _parse_source(self, path):
+        resolver = IncludeResolver(self.parse_cache)
+        http_context = HttpContext(resolver.load(path))
+        return dict(stats=file_stats(resolver.files), upstreams=http_context.upstreams,
+                    servers=http_context.servers, rows=DataTable())
+
+    def update(self):
+        """
+        Re-parse the changed source files and return the patched table.
+        The state is only changed once every file is parsed and every row made, a file which fails to parse,
+        e.g. caught half saved, leaves it as it was and is parsed again by the next update
+        """
+        paths = self._source_paths()
+        sources = {}
+        changed = set()
+        upstreams_changed = any(len(self.sources[path]['upstreams']) > 0 for path in set(self.sources) - set(paths))
+
+        for path in paths:
+            source = self.sources.get(path)
+            if source is not None and source['stats'] == file_stats(_[0] for _ in source['stats']):
+                sources[path] = source
+                continue
+
+            sources[path] = self._parse_source(path)
+            changed.add(path)
+            upstreams_changed |= len(sources[path]['upstreams']) > 0 or \
+                (source is not None and len(source['upstreams']) > 0)
+
+        bind_zones_stats = file_stats([self.bind_zones_file_location])
+        bind_zones_changed = bind_zones_stats != self.bind_zones_stats
+        map_ips, map_host = get_hosts_ips(self.bind_zones_file_location) if bind_zones_changed else \
+            (self.map_ips, self.map_host)
+        rebuild_all = upstreams_changed or bind_zones_changed
+
+        upstreams_map = self.upstreams_map
+        if upstreams_changed:
+            upstreams_map = {}
+            for path in paths:
+                for upstream in sources[path]['upstreams']:
+                    upstreams_map[upstream.name] = upstream
+
+        if rebuild_all or changed:
+            fetch_git_projects_details(_.git_project for _ in upstreams_map.values())
+
+        upstream_index = UpstreamIndex(upstreams_map, map_ips, map_host)
+        rows = {path: DataTable(row for server in sources[path]['servers']
+                                for row in make_server_rows(server, upstream_index))
+                for path in paths if rebuild_all or path in changed}
+
+        for path, table in rows.items():
+            sources[path]['rows'] = table
+        self.sources = sources
+        self.bind_zones_stats = bind_zones_stats
+        self.map_ips, self.map_host = map_ips, map_host
+        self.upstreams_map = upstreams_map
+
+        result_table = DataTable()
+        for path in paths:
+            result_table.extend(sources[path]['rows'])
+        return result_table
+
+    def watched_paths(self):
+        """Return the files the table is made of, includes too, and the glob of the sites conf files"""
+        paths = {self.upstreams_conf_file_path, self.bind_zones_file_location}
+        for source in self.sources.values():
+            paths.update(path for path, _, _ in source['stats'])
+        return sorted(paths), [self.sites_available_conf_files_path]
+
+    def save(self, state_file_path):
+        with atomic_open(state_file_path, 'wb') as state_file:
+            pickle.dump(self, state_file, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(state_file_path, upstreams_conf_file_path, sites_available_conf_files_path, bind_zones_file_location,
+             parse_cache=None):
+        """Restore the parser saved by a previous run, or start a new one if the sources differ"""
+        try:
+            with open(state_file_path, 'rb') as state_file:
+                parser = pickle.load(state_file)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError):
+            parser = None
+
+        sources = (upstreams_conf_file_path, sites_available_conf_files_path, bind_zones_file_location)
+        if not isinstance(parser, IncrementalParser) or sources != (parser.upstreams_conf_file_path,
+                                                                    parser.sites_available_conf_files_path,
+                                                                    parser.bind_zones_file_location):
+            parser = IncrementalParser(*sources)
+
+        parser.parse_cache = parse_cache
+        return parser
+
+
+def watch_services_table(parser, watcher, outputs=('console', 'csv', 'html'), report_format='html',
+                         debounce=0.2, after_update=None, updates=None):
+    """
+    Print the table, then print it again every time a burst of changes of its files ends, until interrupted
+    or until updates tables were printed; only the changed files are parsed again.
+    A table which fails to be made or written is logged, the files of the last printed table are kept
+    """
+    printed = 0
+    while True:
+        # files changed while the table is made are seen by the next wait
+        watcher.watch(*parser.watched_paths())
+        try:
+            table = parser.update()
+            watcher.watch(*parser.watched_paths())
+            print_services_table(table, outputs, report_format)
+        except Exception:
+            # a conf caught in the middle of an edit, the next change prints the table again
+            logger.exception('Update failed, the previous services table is kept')
+        else:
+            if after_update is not None:
+                after_update(parser)
+            printed += 1
+            if updates is not None and printed >= updates:
+                return
+        wait_for_changes(watcher, debounce)
+
+
 def parse_args():
     ap = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter)
 
@@ -291,25 +721,229 @@ def parse_args():
                     help='Examples:\n'
                          "  --bind_zones_file_location='./puppet/modules/profile/files/bind9/zones/yourltd.com'"
                     )
+    ap.add_argument('--parse_cache_dir', default=None,
+                    help='Directory to keep parsed nginx conf files between runs, disabled by default; Examples:\n'
+                         "  --parse_cache_dir='~/.cache/generate-services-table'"
+                    )
+    ap.add_argument('--parse_cache_max_size', type=int, default=64 * 1024 * 1024,
+                    help='Size cap of the parse cache directory in bytes, least recently used entries are evicted'
+                    )
+    ap.add_argument('--incremental_state_file', default=None,
+                    help='File to keep parsed servers and rows between runs, only changed conf files are parsed again; '
+                         'Examples:\n'
+                         "  --incremental_state_file='./services_table.state'"
+                    )
+    ap.add_argument('--snapshot_file', default=None,
+                    help='File to keep the parsed confs and bind zone in, loaded instead of parsing them '
+                         'while none of their files changed; Examples:\n'
+                         "  --snapshot_file='./services_table.snapshot'"
+                    )
+    ap.add_argument('--bounded_memory', action='store_true',
+                    help='Map the conf files and parse one server block at a time, for confs too large to hold parsed; '
+                         'the parse cache is not used'
+                    )
+    ap.add_argument('--git_projects_cache_file', default=None,
+                    help='File to keep GitLab project lookups between runs, disabled by default; Examples:\n'
+                         "  --git_projects_cache_file='~/.cache/generate-services-table/git_projects.json'"
+                    )
+    ap.add_argument('--git_projects_cache_ttl', type=int, default=24 * 60 * 60,
+                    help='Seconds a cached GitLab project lookup stays valid; Default: %(default)s'
+                    )
+    ap.add_argument('--outputs', nargs='+', choices=OUTPUTS, default=['console', 'csv', 'html'],
+                    help='Tables to print; csv and json_lines are written as rows are made, '
+                         'console, html and report keep all the rows; Default: %(default)s'
+                    )
+    ap.add_argument('--report_format', choices=REPORT_FORMATS, default='html',
+                    help='Format of the report of hosts per service, ports per stand, locations per domain '
+                         'and upstream fan-out, written to services_report.*; Default: %(default)s'
+                    )
+    ap.add_argument('--watch', action='store_true',
+                    help='Keep running and print the tables again whenever the conf or bind zone files change'
+                    )
+    ap.add_argument('--watch_debounce', type=float, default=0.2,
+                    help='Seconds without changes that end a burst of changes; Default: %(default)s'
+                    )
+    ap.add_argument('--watch_polling', action='store_true',
+                    help='Poll the files instead of using inotify'
+                    )
+    ap.add_argument('--watch_poll_interval', type=float, default=1.0,
+                    help='Seconds between polls of the files; Default: %(default)s'
+                    )
+    ap.add_argument('-v', '--verbose', action='store_true',
+                    help='Print the parsed bind zone maps'
+                    )
 
     args = ap.parse_args()
+    # the incremental state and the snapshot keep the parsed confs, the bounded memory mode does not
+    for option in ('incremental_state_file', 'snapshot_file', 'watch'):
+        if args.bounded_memory and getattr(args, option):
+            ap.error('--bounded_memory can not be combined with --{0}'.format(option))
+    if args.snapshot_file and (args.incremental_state_file or args.watch):
+        ap.error('--snapshot_file can not be combined with --incremental_state_file or --watch')
 
     return args
 
 
 def main():
     args = parse_args()
-    services_table = parse_server(upstreams_conf_file_path=args.upstreams_conf_file_path,
-                                  sites_available_conf_files_path=args.sites_available_conf_files_path,
-                                  bind_zones_file_location=args.bind_zones_file_location)
+    logging.basicConfig(format='%(message)s')
+    logger.setLevel(logging.DEBUG if args.verbose else logging.WARNING)
+    parse_cache = ParseCache(os.path.expanduser(args.parse_cache_dir), args.parse_cache_max_size) \
+        if args.parse_cache_dir else None
+    git_projects_cache_file = os.path.expanduser(args.git_projects_cache_file) \
+        if args.git_projects_cache_file else None
+    if git_projects_cache_file:
+        load_git_projects_cache(git_projects_cache_file, args.git_projects_cache_ttl)
+    if args.watch:
+        parser = IncrementalParser.load(args.incremental_state_file, args.upstreams_conf_file_path,
+                                        args.sites_available_conf_files_path, args.bind_zones_file_location,
+                                        parse_cache) if args.incremental_state_file else \
+            IncrementalParser(args.upstreams_conf_file_path, args.sites_available_conf_files_path,
+                              args.bind_zones_file_location, parse_cache)
+
+        def after_update(updated_parser):
+            if args.incremental_state_file:
+                updated_parser.save(args.incremental_state_file)
+            if git_projects_cache_file:
+                save_git_projects_cache(git_projects_cache_file)
+
+        watcher = make_watcher(args.watch_poll_interval, args.watch_polling)
+        try:
+            watch_services_table(parser, watcher, args.outputs, args.report_format, args.watch_debounce, after_update)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.close()
+        return
+    if args.incremental_state_file:
+        parser = IncrementalParser.load(args.incremental_state_file,
+                                        upstreams_conf_file_path=args.upstreams_conf_file_path,
+                                        sites_available_conf_files_path=args.sites_available_conf_files_path,
+                                        bind_zones_file_location=args.bind_zones_file_location,
+                                        parse_cache=parse_cache)
+        services_rows = parser.update()
+        parser.save(args.incremental_state_file)
+    elif args.snapshot_file:
+        snapshot = load_snapshot(args.snapshot_file, args.upstreams_conf_file_path,
+                                 args.sites_available_conf_files_path, args.bind_zones_file_location, parse_cache)
+        services_rows = make_http_rows(snapshot.http_context, snapshot.map_ips, snapshot.map_host)
+    else:
+        services_rows = parse_server_rows(upstreams_conf_file_path=args.upstreams_conf_file_path,
+                                          sites_available_conf_files_path=args.sites_available_conf_files_path,
+                                          bind_zones_file_location=args.bind_zones_file_location,
+                                          parse_cache=parse_cache,
+                                          bounded_memory=args.bounded_memory)
 
     # upstreams_conf_file_path='/Users/ujlbu4/Work/yourltd/misc/puppet/modules/profile/files/nginx/host_d-ngx1.yourltd.com/conf.d/backends.conf',
     # sites_available_conf_files_path='/Users/ujlbu4/Work/yourltd/misc/puppet/modules/profile/files/nginx/host_d-ngx1.yourltd.com/sites-available/*.conf',
     # bind_zones_file_location='/Users/ujlbu4/Work/yourltd/misc/puppet/modules/profile/files/bind9/zones/yourltd.com'
 
-    ConsolePrint.print_table(services_table)
-    FileCSVPrint.print_table(services_table)
-    HtmlPrint.print_table(services_table)
+    print_services_rows(services_rows, args.outputs, args.report_format)
+    if git_projects_cache_file:
+        save_git_projects_cache(git_projects_cache_file)
+
+
+def print_services_rows(rows, outputs=('console', 'csv', 'html'), report_format='html'):
+    """
+    Write the rows to the csv and json lines files as they are made in one pass,
+    only the console and html tables and the report need all the rows and keep them
+    """
+    table = DataTable() if {'console', 'html', 'report'} & set(outputs) else None
+    with contextlib.ExitStack() as stack:
+        files = []
+        for output, printer in (('csv', FileCSVPrint), ('json_lines', FileJsonLinesPrint)):
+            if output in outputs:
+                file = stack.enter_context(atomic_open(printer.file_name, 'w', encoding='utf-8'))
+                file.write(printer.header)
+                files.append((file, printer.format_row))
+
+        for row in rows:
+            for file, format_row in files:
+                file.write(format_row(row) + '\n')
+            if table is not None:
+                table.append(row)
+
+    if 'console' in outputs:
+        ConsolePrint.print_table(table)
+    if 'html' in outputs:
+        HtmlPrint.print_table(table)
+    if 'report' in outputs:
+        write_reports(make_reports(table), report_format)
+
+
+def print_services_table(services_table, outputs=('console', 'csv', 'html'), report_format='html'):
+    print_services_rows(services_table, outputs, report_format)
+
+
+def parse_fleet_args():
+    ap = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter)
+
+    ap.add_argument('--hosts_dirs_path', required=True,
+                    help='Glob of the nginx host directories; Examples:\n'
+                         "  --hosts_dirs_path='./puppet/modules/profile/files/nginx/host_*'"
+                    )
+    ap.add_argument('--upstreams_conf_file_path', default='conf.d/backends.conf',
+                    help='Upstreams conf file relative to a host directory; Default: %(default)s'
+                    )
+    ap.add_argument('--sites_available_conf_files_path', default='sites-available/*.conf',
+                    help='Sites conf files relative to a host directory; Default: %(default)s'
+                    )
+    ap.add_argument('--bind_zones_file_location', required=True,
+                    help='Examples:\n'
+                         "  --bind_zones_file_location='./puppet/modules/profile/files/bind9/zones/yourltd.com'"
+                    )
+    ap.add_argument('--max_workers', type=int, default=None,
+                    help='Number of worker processes; Default: number of processors'
+                    )
+    ap.add_argument('--parse_cache_dir', default=None,
+                    help='Directory to keep parsed nginx conf files between runs, disabled by default; Examples:\n'
+                         "  --parse_cache_dir='~/.cache/generate-services-table'"
+                    )
+    ap.add_argument('--parse_cache_max_size', type=int, default=64 * 1024 * 1024,
+                    help='Size cap of the parse cache directory in bytes, least recently used entries are evicted'
+                    )
+    ap.add_argument('--git_projects_cache_file', default=None,
+                    help='File to keep GitLab project lookups between runs, disabled by default; Examples:\n'
+                         "  --git_projects_cache_file='~/.cache/generate-services-table/git_projects.json'"
+                    )
+    ap.add_argument('--git_projects_cache_ttl', type=int, default=24 * 60 * 60,
+                    help='Seconds a cached GitLab project lookup stays valid; Default: %(default)s'
+                    )
+    ap.add_argument('-v', '--verbose', action='store_true',
+                    help='Print the parsed bind zone maps'
+                    )
+    ap.add_argument('--outputs', nargs='+', choices=OUTPUTS, default=['console', 'csv', 'html'],
+                    help='Tables to print; Default: %(default)s'
+                    )
+    ap.add_argument('--report_format', choices=REPORT_FORMATS, default='html',
+                    help='Format of the report written to services_report.*; Default: %(default)s'
+                    )
+
+    args = ap.parse_args()
+
+    return args
+
+
+def fleet_main():
+    args = parse_fleet_args()
+    logging.basicConfig(format='%(message)s')
+    logger.setLevel(logging.DEBUG if args.verbose else logging.WARNING)
+    parse_cache = ParseCache(os.path.expanduser(args.parse_cache_dir), args.parse_cache_max_size) \
+        if args.parse_cache_dir else None
+    git_projects_cache_file = os.path.expanduser(args.git_projects_cache_file) \
+        if args.git_projects_cache_file else None
+    if git_projects_cache_file:
+        load_git_projects_cache(git_projects_cache_file, args.git_projects_cache_ttl)
+    services_table = parse_fleet(hosts_dirs_path=args.hosts_dirs_path,
+                                 bind_zones_file_location=args.bind_zones_file_location,
+                                 upstreams_conf_file_path=args.upstreams_conf_file_path,
+                                 sites_available_conf_files_path=args.sites_available_conf_files_path,
+                                 max_workers=args.max_workers,
+                                 parse_cache=parse_cache)
+    if git_projects_cache_file:
+        save_git_projects_cache(git_projects_cache_file)
+
+    print_services_table(services_table, args.outputs, args.report_format)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,336 @@
+# coding=utf-8
+"""
+HTTP service answering JSON queries about the services table, reloaded when the conf or bind zone files change
+
+    serve-services-table --upstreams_conf_file_path=... --sites_available_conf_files_path=... \\
+        --bind_zones_file_location=... --listen_port 8080
+
+    GET /rows?domain=example.com&port=8080      rows matching every given column
+    GET /route?host=example.com&path=/api/v1    the server, location and upstream handling a request
+    GET /health                                 rows, generation and time of the loaded table
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from urllib.parse import parse_qsl, urlsplit
+
+from services_spec_generator.conf_watcher import make_watcher, wait_for_changes
+from services_spec_generator.nginx_conf_parser.location_matcher import LocationMatcher, normalize_uri
+from services_spec_generator.nginx_conf_parser.server_name_index import ServerNameIndex
+from services_spec_generator.nginx_config_merge import ParseCache
+from services_spec_generator.parse_conf import DataTable, IncrementalParser, get_git_project_path, \
+    load_git_projects_cache, save_git_projects_cache
+
+logger = logging.getLogger(__name__)
+
+# answers kept per loaded table, keyed by request target, the cache is emptied when it is full
+RESPONSES_CACHE_SIZE = 4096
+MAX_HEADERS = 100
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+class ServicesIndex:
+    """
+    The rows of a services table by the value of every column they can be queried by,
+    and the servers by name to route a request as nginx does
+    """
+    columns = ('domain', 'upstream', 'host', 'ip', 'port', 'git_project')
+
+    def __init__(self, table: DataTable, servers, generation=1):
+        self.header = table.header
+        self.rows = list(table.tuples())
+        self.generation = generation
+        self.loaded_at = time.time()
+        self.responses = {}
+
+        self._indexes = {name: {} for name in self.columns}
+        self._locations = {}  # (domain, location) -> row numbers
+        for number, (domain, _, service_git_url, upstream, _, host, ip, port, location) in enumerate(self.rows):
+            git_project = get_git_project_path(service_git_url) if service_git_url else None
+            for name, value in zip(self.columns, (domain, upstream, host, ip, port, git_project)):
+                self._indexes[name].setdefault(value, []).append(number)
+            self._locations.setdefault((domain, location), []).append(number)
+
+        self.server_index = ServerNameIndex(servers)
+        self._matchers = {}
+
+    def _row(self, number):
+        return dict(zip(self.header, self.rows[number]))
+
+    def find(self, filters):
+        """Return the rows with every column value of the filters dict, git_project is a project path or url"""
+        unknown = set(filters) - set(self.columns)
+        if unknown:
+            raise ValueError('Unknown columns: {0}'.format(', '.join(sorted(unknown))))
+        if not filters:
+            raise ValueError('Give one of the columns at least: {0}'.format(', '.join(self.columns)))
+        empty = [_ for _ in self.columns if filters.get(_) == '']
+        if empty:
+            raise ValueError('Empty values of: {0}'.format(', '.join(empty)))
+
+        found = None
+        for name, value in filters.items():
+            if name == 'port':
+                try:
+                    value = int(value)
+                except ValueError:
+                    raise ValueError('Not a port: {0}'.format(value))
+            elif name == 'git_project':
+                value = get_git_project_path(value)
+            numbers = self._indexes[name].get(value, ())
+            found = set(numbers) if found is None else found.intersection(numbers)
+            if not found:
+                return []
+        return [self._row(_) for _ in sorted(found)]
+
+    def route(self, host, path, port=80):
+        """Return the server, location and upstream nginx handles the request with and their rows, or None"""
+        server = self.server_index.resolve(host, port)
+        if server is None:
+            return None
+        names = server.server_name if isinstance(server.server_name, list) else [server.server_name]
+
+        matcher = self._matchers.get(server)
+        if matcher is None:
+            matcher = self._matchers[server] = LocationMatcher.from_server(server)
+        location = matcher.match(normalize_uri(path))
+        if location is None:
+            return dict(domain=names[0], server_names=names, location=None, upstream=None, rows=[])
+
+        numbers = sorted(number for name in names for number in self._locations.get((name, location.path), ()))
+        return dict(domain=names[0], server_names=names, location=location.path,
+                    upstream=location.proxy_pass_upstream if location.proxy_pass is not None else None,
+                    rows=[self._row(_) for _ in numbers])
+
+
+def _servers(parser):
+    return [server for source in parser.sources.values() for server in source['servers']]
+
+
+def _encode(method, status, body):
+    """Return the encoded status line, headers and JSON body of an answer"""
+    body = json.dumps(body, ensure_ascii=False).encode('utf-8')
+    head = 'HTTP/1.1 {0} {1}\r\nContent-Type: application/json\r\nContent-Length: {2}\r\n'.format(
+        status, _REASONS[status], len(body)).encode('ascii')
+    return head, b'' if method == 'HEAD' else body
+
+
+class QueryService:
+    """
+    Serves the index of the table made by an incremental parser. A reload builds a new index aside
+    and swaps it in, requests are answered from the previous one meanwhile or if the reload failed
+    """
+    def __init__(self, parser: IncrementalParser, after_reload=None):
+        self.parser = parser
+        self.after_reload = after_reload
+        self.index = None
+        self.reload_error = None
+
+    def reload(self):
+        table = self.parser.update()
+        self.index = ServicesIndex(table, _servers(self.parser), self.index.generation + 1 if self.index else 1)
+        self.reload_error = None
+        if self.after_reload is not None:
+            self.after_reload(self.parser)
+
+    async def watch(self, watcher, debounce=0.2):
+        """Reload the index after every burst of changes of the files of the table"""
+        loop = asyncio.get_running_loop()
+        watcher.watch(*self.parser.watched_paths())
+        while True:
+            # the wait gives the loop back every second so that the task can be cancelled
+            if not await loop.run_in_executor(None, wait_for_changes, watcher, debounce, 1.0, 1.0):
+                continue
+            try:
+                await loop.run_in_executor(None, self.reload)
+            except Exception as e:
+                # a conf caught in the middle of an edit, the next change reloads it again
+                logger.exception('Reload failed, the previous table is served')
+                self.reload_error = str(e)
+            watcher.watch(*self.parser.watched_paths())
+
+    def answer(self, method, target, index=None):
+        """Return the status and JSON body of a request"""
+        if method not in ('GET', 'HEAD'):
+            return 405, {'error': 'Only GET is supported'}
+        url = urlsplit(target)
+        query = dict(parse_qsl(url.query, keep_blank_values=True))
+        index = index or self.index
+
+        if url.path == '/health':
+            return 200, dict(rows=len(index.rows), generation=index.generation, loaded_at=index.loaded_at,
+                             reload_error=self.reload_error)
+        try:
+            if url.path == '/rows':
+                rows = index.find(query)
+                return 200, dict(count=len(rows), rows=rows)
+            if url.path == '/route':
+                if not query.get('host'):
+                    raise ValueError('Give the host')
+                if query.get('path') == '' or query.get('port') == '':
+                    raise ValueError('Empty path or port')
+                route = index.route(query['host'], query.get('path', '/'), int(query.get('port', 80)))
+                if route is None:
+                    return 404, {'error': 'No server listens on the port'}
+                return 200, route
+        except ValueError as e:
+            return 400, {'error': str(e)}
+        return 404, {'error': 'Unknown path: {0}'.format(url.path)}
+
+    def response(self, method, target):
+        """Return the encoded status line, headers and body of a request, cached per index"""
+        index = self.index
+        key = (method, target)
+        cached = index.responses.get(key)
+        if cached is not None:
+            return cached
+
+        response = _encode(method, *self.answer(method, target, index))
+        # the health changes with a failed reload, the index does not
+        if not target.startswith('/health'):
+            if len(index.responses) >= RESPONSES_CACHE_SIZE:
+                index.responses.clear()
+            index.responses[key] = response
+        return response
+
+    async def handle(self, reader, writer):
+        """Answer the requests of a connection, kept alive unless the client asks to close it"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                words = request_line.decode('latin-1').split()
+                keep_alive = len(words) == 3 and words[2] == 'HTTP/1.1'
+                content_length = 0
+                for _ in range(MAX_HEADERS):
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    name, value = name.strip().lower(), value.strip().lower()
+                    if name == 'connection':
+                        keep_alive = value == 'keep-alive' or (keep_alive and value != 'close')
+                    elif name == 'content-length' and value.isdigit():
+                        content_length = int(value)
+                if content_length:
+                    await reader.readexactly(content_length)
+
+                if len(words) != 3:
+                    head, body = b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n', b''
+                    keep_alive = False
+                else:
+                    try:
+                        head, body = self.response(words[0], words[1])
+                    except Exception:
+                        logger.exception('Failed to answer %s', words[1])
+                        head, body = _encode(words[0], 500, {'error': 'Internal error'})
+                writer.write(head + (b'\r\n' if keep_alive else b'Connection: close\r\n\r\n') + body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=8080):
+        """Load the table if it is not yet and start listening, returns the asyncio server"""
+        if self.index is None:
+            await asyncio.get_running_loop().run_in_executor(None, self.reload)
+        return await asyncio.start_server(self.handle, host, port)
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter)
+
+    ap.add_argument('--upstreams_conf_file_path', required=True,
+                    help='Upstreams conf file; Examples:\n'
+                         "  --upstreams_conf_file_path='./puppet/modules/profile/files/nginx/host_d-ngx1.yourltd.com/conf.d/backends.conf'"
+                    )
+    ap.add_argument('--sites_available_conf_files_path', required=True,
+                    help='Examples:\n'
+                         "  --sites_available_conf_files_path='./puppet/modules/profile/files/nginx/host_d-ngx1.yourltd.com/sites-available/*.conf'"
+                    )
+    ap.add_argument('--bind_zones_file_location', required=True,
+                    help='Examples:\n'
+                         "  --bind_zones_file_location='./puppet/modules/profile/files/bind9/zones/yourltd.com'"
+                    )
+    ap.add_argument('--listen_host', default='127.0.0.1',
+                    help='Default: %(default)s'
+                    )
+    ap.add_argument('--listen_port', type=int, default=8080,
+                    help='Default: %(default)s'
+                    )
+    ap.add_argument('--parse_cache_dir', default=None,
+                    help='Directory to keep parsed nginx conf files between runs, disabled by default; Examples:\n'
+                         "  --parse_cache_dir='~/.cache/generate-services-table'"
+                    )
+    ap.add_argument('--parse_cache_max_size', type=int, default=64 * 1024 * 1024,
+                    help='Size cap of the parse cache directory in bytes, least recently used entries are evicted'
+                    )
+    ap.add_argument('--git_projects_cache_file', default=None,
+                    help='File to keep GitLab project lookups between runs, disabled by default; Examples:\n'
+                         "  --git_projects_cache_file='~/.cache/generate-services-table/git_projects.json'"
+                    )
+    ap.add_argument('--git_projects_cache_ttl', type=int, default=24 * 60 * 60,
+                    help='Seconds a cached GitLab project lookup stays valid; Default: %(default)s'
+                    )
+    ap.add_argument('--watch_debounce', type=float, default=0.2,
+                    help='Seconds without changes that end a burst of changes; Default: %(default)s'
+                    )
+    ap.add_argument('--watch_polling', action='store_true',
+                    help='Poll the files instead of using inotify'
+                    )
+    ap.add_argument('--watch_poll_interval', type=float, default=1.0,
+                    help='Seconds between polls of the files; Default: %(default)s'
+                    )
+
+    args = ap.parse_args()
+
+    return args
+
+
+async def serve(service, watcher, host, port, debounce=0.2):
+    server = await service.start(host, port)
+    watch = asyncio.ensure_future(service.watch(watcher, debounce))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        watch.cancel()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(format='%(message)s')
+    parse_cache = ParseCache(os.path.expanduser(args.parse_cache_dir), args.parse_cache_max_size) \
+        if args.parse_cache_dir else None
+    git_projects_cache_file = os.path.expanduser(args.git_projects_cache_file) \
+        if args.git_projects_cache_file else None
+    if git_projects_cache_file:
+        load_git_projects_cache(git_projects_cache_file, args.git_projects_cache_ttl)
+
+    parser = IncrementalParser(args.upstreams_conf_file_path, args.sites_available_conf_files_path,
+                               args.bind_zones_file_location, parse_cache)
+
+    def after_reload(_):
+        if git_projects_cache_file:
+            save_git_projects_cache(git_projects_cache_file)
+
+    service = QueryService(parser, after_reload)
+    watcher = make_watcher(args.watch_poll_interval, args.watch_polling)
+    try:
+        asyncio.run(serve(service, watcher, args.listen_host, args.listen_port, args.watch_debounce))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+# coding=utf-8
+import csv
+import json
+
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+
+from services_spec_generator.output_files import atomic_open
+
+# report name -> (column grouped by, columns counted in every group)
+REPORTS = {
+    'hosts_per_service': ('service_name', ('host',)),
+    'ports_per_stand': ('stand', ('port',)),
+    'locations_per_domain': ('domain', ('location',)),
+    'upstream_fan_out': ('upstream', ('host', 'port')),
+}
+
+REPORT_FORMATS = ('html', 'csv', 'json_lines', 'console')
+
+
+class _Columns:
+    """Value codes of the columns of a services table, shifted so that None is 0, built once for all reports"""
+    def __init__(self, table):
+        self.table = table
+        self._columns = {}
+
+    def __getitem__(self, name):
+        column = self._columns.get(name)
+        if column is None:
+            if name == 'port':
+                ports, codes = np.unique(np.frombuffer(self.table.ports, dtype=np.intc), return_inverse=True)
+                column = codes.astype(np.int64) + 1, [None] + ports.tolist()
+            else:
+                codes = np.frombuffer(self.table.codes[name], dtype=np.intc).astype(np.int64) + 1
+                column = codes, [None] + self.table.values[name]
+            self._columns[name] = column
+        return column
+
+    def combined(self, names):
+        """Return the codes and values of the tuples of the columns, only the tuples which occur are coded"""
+        if len(names) == 1:
+            return self[names[0]]
+        codes = np.zeros(len(self.table), dtype=np.int64)
+        sizes = []
+        for name in names:
+            column_codes, column_values = self[name]
+            codes = codes * len(column_values) + column_codes
+            sizes.append(len(column_values))
+        keys, codes = np.unique(codes, return_inverse=True)
+        values = [None] * len(keys)
+        for index, key in enumerate(keys.tolist()):
+            value = []
+            for name, size in zip(reversed(names), reversed(sizes)):
+                key, code = divmod(key, size)
+                value.append(self[name][1][code])
+            values[index] = ':'.join(str(_) for _ in reversed(value))
+        return codes.astype(np.int64), values
+
+
+def distinct_counts(columns, group_name, value_names):
+    """
+    Return a frame of every value of the group column with the number of distinct value tuples,
+    the number of rows and the distinct value tuples themselves
+    """
+    group_codes, group_values = columns[group_name]
+    value_codes, value_values = columns.combined(value_names)
+
+    pairs = np.unique(group_codes * len(value_values) + value_codes)
+    pair_groups, pair_values = np.divmod(pairs, len(value_values))
+    distinct = np.bincount(pair_groups, minlength=len(group_values))
+    rows = np.bincount(group_codes, minlength=len(group_values))
+
+    # the pairs are sorted by group, split them where the group changes
+    boundaries = np.flatnonzero(np.diff(pair_groups)) + 1
+    groups = pair_groups[np.r_[0, boundaries]] if len(pairs) else pair_groups
+    value_name = ':'.join(value_names)
+    records = []
+    for group, codes in zip(groups.tolist(), np.split(pair_values, boundaries)):
+        values = sorted(str(value_values[_]) for _ in codes.tolist())
+        records.append((group_values[group], int(distinct[group]), int(rows[group]), ', '.join(values)))
+    records.sort(key=lambda _: (_[0] is None, str(_[0])))
+    groups, distinct, rows, values = zip(*records) if records else ((), (), (), ())
+    # object columns keep the None group as it is
+    return pd.DataFrame({group_name: pd.Series(groups, dtype=object),
+                         value_name: pd.Series(distinct, dtype=np.int64),
+                         'rows': pd.Series(rows, dtype=np.int64),
+                         value_name + '_values': pd.Series(values, dtype=object)})
+
+
+def make_reports(table, reports=None):
+    """Return the frame of every report, keyed by report name, the columns of the table are coded once"""
+    columns = _Columns(table)
+    return {name: distinct_counts(columns, group_name, value_names)
+            for name, (group_name, value_names) in (reports or REPORTS).items()}
+
+
+def write_reports(reports, report_format, file_name='services_report'):
+    """Write the reports to file_name with the extension of report_format, console prints them"""
+    if report_format == 'console':
+        for name, frame in reports.items():
+            print(name)
+            print(tabulate(frame.itertuples(index=False), headers=list(frame.columns), tablefmt='simple'))
+            print()
+        return
+    if report_format not in REPORT_FORMATS:
+        raise ValueError('Unknown report format: {0}'.format(report_format))
+
+    extension = dict(html='html', csv='csv', json_lines='jsonl')[report_format]
+    with atomic_open('{0}.{1}'.format(file_name, extension), 'w', encoding='utf-8', newline='') as file:
+        if report_format == 'csv':
+            writer = csv.writer(file, lineterminator='\n')
+            writer.writerow(['report', 'group', 'distinct', 'rows', 'values'])
+        for name, frame in reports.items():
+            if report_format == 'html':
+                file.write('<h2>{0}</h2>\n'.format(name))
+                file.write(frame.to_html(index=False, justify='left'))
+                file.write('\n')
+                continue
+            for group, distinct, rows, values in frame.itertuples(index=False):
+                if report_format == 'csv':
+                    writer.writerow([name, group, distinct, rows, values])
+                else:
+                    file.write(json.dumps(dict(report=name, group=group, distinct=int(distinct), rows=int(rows),
+                                               values=values.split(', ')), ensure_ascii=False) + '\n')
@@ -0,0 +1,181 @@
+# coding=utf-8
+"""
+Snapshots of the parsed model of a host: the http context with its servers, locations and upstreams,
+and the bind zone index, written once and loaded by other processes instead of parsing the confs again.
+
+A snapshot file is a header, the pickle of the model and its out of band buffers, each aligned on 8 bytes:
+
+    magic, version, size of a C long, byte order, number of buffers, pickle length   struct SNAPSHOT_HEADER
+    length of every buffer                                                          8 bytes each
+    pickle, buffers
+
+The file is mapped when loaded, the buffers of the zone index are used in place.
+Python 3.7 has no pickle protocol 5, its snapshots have no buffers: the arrays are pickled in band and copied.
+A snapshot of another version or of a platform with other longs is refused with a ValueError
+"""
+import gc
+import glob
+import mmap
+import os
+import pickle
+import struct
+import sys
+
+from services_spec_generator.bind_zone import HostIndex
+from services_spec_generator.nginx_conf_parser.http_context import HttpContext
+from services_spec_generator.nginx_conf_parser.tokenizer import ConfNode
+from services_spec_generator.nginx_config_merge import IncludeResolver, file_stats
+from services_spec_generator.output_files import atomic_open
+
+SNAPSHOT_MAGIC = b'NGXSNAP\0'
+# bumped whenever the pickled classes change their state
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct('<8sHBBIQ')
+_LENGTH = struct.Struct('<Q')
+_PLATFORM = (struct.calcsize('l'), sys.byteorder == 'little')
+# protocol 5 hands the zone index arrays out of band
+_PROTOCOL = min(pickle.HIGHEST_PROTOCOL, 5)
+
+
+def _intern_raw(context):
+    raw = context._raw
+    if raw:
+        for name, args in raw.items():
+            raw[name] = [[sys.intern(_) for _ in __] for __ in args] if args and isinstance(args[0], list) else \
+                [sys.intern(_) for _ in args]
+
+
+def intern_contexts(http_context):
+    """
+    Intern the raw arguments of the contexts in place: the same values repeat in every location,
+    interned they are pickled once and loaded as one object
+    """
+    _intern_raw(http_context)
+    for server in http_context.servers:
+        _intern_raw(server)
+        for location in server.location:
+            _intern_raw(location)
+            for limit_except in (location.limit_except or {}).values():
+                _intern_raw(limit_except)
+
+
+def _padding(length):
+    return -length % 8
+
+
+class Snapshot:
+    """
+    The parsed model of the conf and bind zone files, with the stats of every file it was made of,
+    includes too, to tell whether it is still fresh
+    """
+    def __init__(self, sources, http_context, host_index, stats):
+        self.sources = sources
+        self.http_context = http_context
+        self.host_index = host_index
+        self.stats = stats
+
+    @staticmethod
+    def make(upstreams_conf_file_path, sites_available_conf_files_path, bind_zones_file_location, parse_cache=None):
+        resolver = IncludeResolver(parse_cache)
+        nodes = resolver.include([upstreams_conf_file_path, sites_available_conf_files_path])
+        http_context = HttpContext(ConfNode('http', [], nodes, '', 0, 0))
+        host_index = HostIndex.from_zone_file(bind_zones_file_location)
+        return Snapshot((upstreams_conf_file_path, sites_available_conf_files_path, bind_zones_file_location),
+                        http_context, host_index, file_stats(resolver.files + [bind_zones_file_location]))
+
+    @property
+    def map_ips(self):
+        return self.host_index.by_ip
+
+    @property
+    def map_host(self):
+        return self.host_index.by_host
+
+    def is_fresh(self):
+        """Return whether none of the files changed and no sites conf file was added since the snapshot"""
+        if self.stats != file_stats(_[0] for _ in self.stats):
+            return False
+        paths = {_[0] for _ in self.stats}
+        return all(_ in paths for _ in glob.glob(self.sources[1]))
+
+
+def write_snapshot(snapshot, file_name):
+    intern_contexts(snapshot.http_context)
+    buffers = []
+    if _PROTOCOL >= 5:
+        data = pickle.dumps(snapshot, protocol=_PROTOCOL, buffer_callback=buffers.append)
+        buffers = [_.raw() for _ in buffers]
+    else:
+        data = pickle.dumps(snapshot, protocol=_PROTOCOL)
+
+    with atomic_open(file_name, 'wb') as file:
+        file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, _PLATFORM[0], _PLATFORM[1],
+                                        len(buffers), len(data)))
+        for buffer in buffers:
+            file.write(_LENGTH.pack(buffer.nbytes))
+        for chunk in [data] + buffers:
+            file.write(chunk)
+            file.write(b'\0' * _padding(len(chunk) if isinstance(chunk, bytes) else chunk.nbytes))
+
+
+def read_snapshot(file_name):
+    """Load a snapshot, raises ValueError if the file is no snapshot of this version and platform"""
+    with open(file_name, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if size < SNAPSHOT_HEADER.size:
+            raise ValueError('Not a snapshot: {0}'.format(file_name))
+        # the mapping stays open as long as the buffers of the loaded snapshot use it
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, long_size, little_endian, count, length = SNAPSHOT_HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError('Not a snapshot: {0}'.format(file_name))
+    if version != SNAPSHOT_VERSION or (long_size, bool(little_endian)) != _PLATFORM:
+        raise ValueError('Snapshot version {0} of a {1} bytes long {2} endian platform can not be loaded'.format(
+            version, long_size, 'little' if little_endian else 'big'))
+
+    offset = SNAPSHOT_HEADER.size
+    lengths = [_LENGTH.unpack_from(data, offset + _ * _LENGTH.size)[0] for _ in range(count)]
+    offset += count * _LENGTH.size
+    if offset + length + sum(lengths) > size:
+        raise ValueError('Truncated snapshot: {0}'.format(file_name))
+    if count and _PROTOCOL < 5:
+        raise ValueError('Snapshot with out of band buffers can not be loaded by pickle protocol {0}'.format(
+            _PROTOCOL))
+
+    view = memoryview(data)
+    pickled = view[offset:offset + length]
+    offset += length + _padding(length)
+    buffers = []
+    for buffer_length in lengths:
+        buffers.append(view[offset:offset + buffer_length])
+        offset += buffer_length + _padding(buffer_length)
+
+    # loading makes no garbage, the collections set off by allocating every context would only walk the new objects
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        snapshot = pickle.loads(pickled, buffers=buffers) if buffers else pickle.loads(pickled)
+    finally:
+        if gc_enabled:
+            gc.enable()
+        pickled.release()
+    return snapshot
+
+
+def load_snapshot(file_name, upstreams_conf_file_path, sites_available_conf_files_path, bind_zones_file_location,
+                  parse_cache=None):
+    """
+    Return the snapshot of the file if it is fresh and of the same sources,
+    otherwise parse the sources and write their snapshot to the file
+    """
+    sources = (upstreams_conf_file_path, sites_available_conf_files_path, bind_zones_file_location)
+    try:
+        snapshot = read_snapshot(file_name)
+    except (OSError, ValueError, EOFError, pickle.UnpicklingError, AttributeError):
+        snapshot = None
+
+    if not isinstance(snapshot, Snapshot) or snapshot.sources != sources or not snapshot.is_fresh():
+        snapshot = Snapshot.make(*sources, parse_cache=parse_cache)
+        write_snapshot(snapshot, file_name)
+    return snapshot
@@ -37,7 +37,7 @@ setup(
     install_requires=get_requirements(),
     license="MIT",
     zip_safe=False,
-    packages=find_packages(exclude=["*tests*"]),
+    packages=find_packages(exclude=["*tests*", "benchmarks"]),
     package_data={
         # If any package contains *.txt or *.rst files, include them:
         "services_spec_generator": ["*.conf",
@@ -45,7 +45,11 @@ setup(
     },
     # include_package_data=True,
     entry_points={
-        'console_scripts': ['generate-services-table=services_spec_generator.parse_conf:main'],
+        'console_scripts': ['generate-services-table=services_spec_generator.parse_conf:main',
+                            'generate-services-table-fleet=services_spec_generator.parse_conf:fleet_main',
+                            'correlate-access-logs=services_spec_generator.access_logs:main',
+                            'serve-services-table=services_spec_generator.query_service:main',
+                            'diff-services-table=services_spec_generator.conf_diff:main'],
     },
     # scripts=['generage-services-table'],
     classifiers=[
@@ -0,0 +1,109 @@
+# coding=utf-8
+import gzip
+import os
+import unittest
+from unittest import mock
+
+from services_spec_generator import access_logs, parse_conf
+from services_spec_generator.access_logs import AccessLogCorrelator, correlate_access_logs, split_chunks, \
+    write_traffic
+from services_spec_generator.nginx_conf_parser.http_context import HttpContext
+from tests.helpers import TempDirMixin
+
+LOG_LINES = [
+    '10.1.0.1 - - [10/Oct/2020:13:55:36 +0300] "GET /api/v1/users?id=1 HTTP/1.1" 200 100 "-" "curl/7.68.0" "a.example.com"',
+    '10.1.0.1 - - [10/Oct/2020:13:55:37 +0300] "GET /api/v1/users?id=2 HTTP/1.1" 200 50 "-" "curl/7.68.0" "a.example.com"',
+    '10.1.0.2 - bob [10/Oct/2020:13:55:38 +0300] "POST /static/app.js HTTP/1.1" 304 - "http://a.example.com/" "Mozilla/5.0 \\x22x\\x22"',
+    '10.1.0.3 - - [10/Oct/2020:13:55:39 +0300] "GET http://www.a.example.com/api/ HTTP/1.1" 200 7 "-" "-" "ignored"',
+    '10.1.0.4 - - [10/Oct/2020:13:55:40 +0300] "GET /health HTTP/1.1" 200 2 "-" "-" "b.example.com"',
+    '10.1.0.5 - - [10/Oct/2020:13:55:41 +0300] "-" 400 0 "-" "-"',
+    'not a log line',
+]
+
+
+class AccessLogsTest(TempDirMixin, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        http = HttpContext("""
+        http {
+            upstream api {
+                # git: https://gitlab.yourltd.com/services/api
+                server 10.0.0.1:8000;
+                server 10.0.0.2:8000;
+            }
+            server {
+                listen 80;
+                server_name a.example.com www.a.example.com;
+                location /api/ { proxy_pass http://api; }
+                location ~* \\.js$ { proxy_pass http://api; }
+                location /local/ { proxy_pass http://127.0.0.1:9000; }
+                location / { root /var/www; }
+            }
+            server {
+                listen 80;
+                server_name b.example.com;
+                location = /health { return 200; }
+            }
+        }
+        """)
+        parse_conf.git_projects_cache['services/api'] = {'name': 'api', 'web_url': 'https://gitlab/api'}
+        map_ips = {'10.0.0.1': ['d-app1'], '10.0.0.2': ['d-app2']}
+        self.correlator = AccessLogCorrelator.from_http(http, map_ips, {}, default_host='a.example.com')
+        self.addCleanup(parse_conf.git_projects_cache.pop, 'services/api')
+
+    def _write_log(self, name, lines, opener=open):
+        return self._write(name, ''.join(_ + '\n' for _ in lines), opener)
+
+    def test_correlate(self):
+        traffic, lines, skipped = correlate_access_logs(self.correlator, [self._write_log('access.log', LOG_LINES)], 1)
+        self.assertEqual((7, 2), (lines, skipped))
+        api = ('a.example.com', 'api', 'https://gitlab/api', 'api', '/api/')
+        self.assertEqual({api: [3, 157],
+                          ('a.example.com', 'api', 'https://gitlab/api', 'api', '~* \\.js$'): [1, 0],
+                          ('b.example.com', None, None, None, '= /health'): [1, 2]}, traffic)
+
+    def test_unmatched(self):
+        self.assertEqual((None,) * 5, AccessLogCorrelator.from_http(HttpContext('http { }'), {}, {}).key('a', '/'))
+        self.assertEqual(('b.example.com', None, None, None, None), self.correlator.key('b.example.com', '/'))
+        self.assertEqual(('a.example.com', None, None, None, '/'), self.correlator.key('', '/index.html'))
+
+    def test_direct_address(self):
+        with mock.patch.object(parse_conf.UpstreamIndex, 'backends') as backends:
+            self.assertEqual(('a.example.com', None, None, '127.0.0.1:9000', '/local/'),
+                             self.correlator.key('a.example.com', '/local/x'))
+        backends.assert_not_called()
+
+    def test_chunks_workers_and_gzip(self):
+        plain = self._write_log('access.log', LOG_LINES * 50)
+        zipped = self._write_log('access.log.1.gz', LOG_LINES * 30, gzip.open)
+        empty = self._write_log('access.log.2', [])
+
+        chunks = list(split_chunks([plain, zipped, empty], 1000))
+        self.assertGreater(len(chunks), 10)
+        self.assertEqual((zipped, 0, None), chunks[-1])
+        with open(plain, 'rb') as log_file:
+            data = log_file.read()
+        self.assertEqual(data, b''.join(data[start:end] for _, start, end in chunks[:-1]))
+        self.assertTrue(all(data[end - 1:end] == b'\n' for _, start, end in chunks[:-1]))
+
+        single, lines, skipped = correlate_access_logs(self.correlator, [plain, zipped, empty], 1, 1000)
+        self.assertEqual((560, 160), (lines, skipped))
+        self.assertEqual([80 * 3, 80 * 157], single['a.example.com', 'api', 'https://gitlab/api', 'api', '/api/'])
+        parallel = correlate_access_logs(self.correlator, [plain, zipped, empty], 2, 1000)
+        self.assertEqual((single, 560, 160), parallel)
+        with mock.patch.object(access_logs, 'COUNT_WINDOW', 300):
+            self.assertEqual((single, 560, 160), correlate_access_logs(self.correlator, [plain, zipped], 1))
+
+    def test_write_traffic(self):
+        traffic, _, _ = correlate_access_logs(self.correlator, [self._write_log('access.log', LOG_LINES)])
+        file_name = os.path.join(self.tmp_dir.name, 'traffic.csv')
+        write_traffic(traffic, file_name)
+        with open(file_name) as traffic_file:
+            self.assertEqual(['domain,service_name,service_git_url,upstream,location,requests,bytes',
+                              'a.example.com,api,https://gitlab/api,api,/api/,3,157',
+                              'a.example.com,api,https://gitlab/api,api,~* \\.js$,1,0',
+                              'b.example.com,,,,= /health,1,2'], traffic_file.read().splitlines())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+# coding=utf-8
+import tempfile
+import unittest
+
+from benchmarks.constructors import run_constructors
+from benchmarks.query_service import run_query_service
+from benchmarks.stages import run_stages
+
+
+class StagesTest(unittest.TestCase):
+    def test_every_stage_is_timed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            stages = run_stages(directory, repeat=1, upstreams=5, servers=4, locations=2, servers_per_file=3,
+                                zone_hosts=50)
+
+        self.assertEqual(['nginx_merged_dumper', 'include_resolver', 'http_context', 'server_context',
+                          'location_context', 'get_hosts_ips', 'parse_server', 'console_print', 'csv_print',
+                          'html_print', 'reports', 'stream_print'], list(stages))
+        self.assertTrue(all(_['best'] >= 0 and _['runs'] == 1 for _ in stages.values()))
+        # every location proxies to an upstream of three servers
+        self.assertEqual(4 * 2 * 2 * 3, stages['parse_server']['rows'])
+
+
+class ConstructorsTest(unittest.TestCase):
+    def test_every_context_is_timed(self):
+        constructors = run_constructors(contexts=2, repeat=1)
+
+        self.assertEqual(['upstream_context', 'main_context', 'events_context', 'stream_context'], list(constructors))
+        self.assertTrue(all(_['best'] >= 0 and _['contexts'] == 2 for _ in constructors.values()))
+
+
+class QueryServiceTest(unittest.TestCase):
+    def test_requests_are_answered(self):
+        with tempfile.TemporaryDirectory() as directory:
+            load = run_query_service(directory, clients=3, requests=4, upstreams=5, servers=4, locations=2,
+                                     servers_per_file=3, zone_hosts=50)
+
+        self.assertEqual(12, load['requests'])
+        self.assertTrue(0 < load['p50'] <= load['p99'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+# coding=utf-8
+import pickle
+import unittest
+
+from services_spec_generator.bind_zone import HostIndex, read_zone_records
+from tests.helpers import TempDirMixin
+
+
+class BindZoneTest(TempDirMixin, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.zone_path = self._write('yourltd.com', """\
+$TTL 86400
+@       IN      SOA     ns1.yourltd.com. admin.yourltd.com. (
+                        2020010101  ; serial
+                        3600 )
+        IN      NS      ns1
+d-1cdb1         IN      A       10.69.0.241
+d-app1          IN      A       10.0.0.1
+work-app1       3600 IN A       10.0.0.1
+                IN      A       10.0.0.3
+txt             IN      TXT     "v=spf1; include ( )"
+api             IN      CNAME   app-alias
+app-alias       IN      CNAME   d-app1.yourltd.com.
+loop1           IN      CNAME   loop2
+loop2           IN      CNAME   loop1
+$INCLUDE stage.zone stage.yourltd.com.
+$ORIGIN prod.yourltd.com.
+app1            IN      A       10.0.1.1
+""")
+        self._write('stage.zone', """\
+app1            IN      A       10.0.2.1
+""")
+
+    def test_records(self):
+        records = list(read_zone_records(self.zone_path, 'yourltd.com.'))
+
+        self.assertEqual(('yourltd.com.', 'SOA'), records[0][:2])
+        self.assertEqual(['ns1.yourltd.com.', 'admin.yourltd.com.', '2020010101', '3600'], records[0][2])
+        self.assertEqual(('yourltd.com.', 'NS', ['ns1']), records[1])
+        self.assertIn(('work-app1.yourltd.com.', 'A', ['10.0.0.3']), records)
+        self.assertIn(('txt.yourltd.com.', 'TXT', ['"v=spf1; include ( )"']), records)
+        self.assertIn(('api.yourltd.com.', 'CNAME', ['app-alias.yourltd.com.']), records)
+        self.assertIn(('app1.stage.yourltd.com.', 'A', ['10.0.2.1']), records)
+        self.assertEqual(('app1.prod.yourltd.com.', 'A', ['10.0.1.1']), records[-1])
+
+    def test_index(self):
+        index = HostIndex.from_zone_file(self.zone_path)
+
+        self.assertEqual('10.69.0.241', index.ip('d-1cdb1'))
+        self.assertEqual('10.0.0.3', index.ip('work-app1'))
+        self.assertEqual(['d-app1', 'work-app1'], index.hosts('10.0.0.1'))
+        self.assertEqual(['work-app1'], index.hosts('10.0.0.3'))
+        self.assertEqual('10.0.2.1', index.ip('app1.stage'))
+        self.assertEqual('10.0.1.1', index.ip('app1.prod'))
+
+    def test_aliases(self):
+        index = HostIndex.from_zone_file(self.zone_path)
+
+        self.assertEqual('10.0.0.1', index.ip('api'))
+        self.assertNotIn('api', index.hosts('10.0.0.1'))
+        self.assertRaises(KeyError, index.ip, 'loop1')
+        self.assertRaises(KeyError, index.ip, 'missing')
+        self.assertRaises(KeyError, index.hosts, '10.9.9.9')
+
+    def test_mappings(self):
+        index = HostIndex.from_zone_file(self.zone_path)
+        by_ip, by_host = pickle.loads(pickle.dumps((index.by_ip, index.by_host)))
+
+        self.assertEqual(['d-app1', 'work-app1'], by_ip['10.0.0.1'])
+        self.assertEqual('10.0.0.1', by_host['api'])
+        self.assertNotIn('loop1', by_host)
+        self.assertEqual(5, len(by_ip))
+        self.assertEqual({'d-1cdb1', 'd-app1', 'work-app1', 'api', 'app-alias', 'app1.stage', 'app1.prod'},
+                         set(by_host))
+
+    def test_pickle_in_band(self):
+        index = HostIndex.from_zone_file(self.zone_path)
+        loaded = pickle.loads(pickle.dumps(index, protocol=4))
+        self.assertEqual(['d-app1', 'work-app1'], loaded.hosts('10.0.0.1'))
+        self.assertEqual(dict(index.by_host), dict(loaded.by_host))
+
+    @unittest.skipUnless(pickle.HIGHEST_PROTOCOL >= 5, 'out of band buffers need pickle protocol 5')
+    def test_pickle_buffers_out_of_band(self):
+        index = HostIndex.from_zone_file(self.zone_path)
+        buffers = []
+        data = pickle.dumps(index, protocol=5, buffer_callback=buffers.append)
+        self.assertEqual(3, len(buffers))
+
+        loaded = pickle.loads(data, buffers=[bytes(_.raw()) for _ in buffers])
+        self.assertEqual(['d-app1', 'work-app1'], loaded.hosts('10.0.0.1'))
+        self.assertEqual('10.0.0.1', loaded.ip('api'))
+        self.assertEqual(dict(index.by_host), dict(pickle.loads(pickle.dumps(loaded, protocol=4)).by_host))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+# coding=utf-8
+import unittest
+from unittest import mock
+
+from services_spec_generator.conf_diff import ConfDiff
+from services_spec_generator.nginx_conf_parser.http_context import HttpContext
+
+
+class ConfDiffTest(unittest.TestCase):
+    def setUp(self):
+        self.content_string = """
+        http {
+            upstream backend {
+                server d-app1.yourltd.com:8080;
+            }
+            upstream legacy {
+                server d-app2.yourltd.com:8080;
+            }
+            upstream unused {
+                server d-app2.yourltd.com:8080;
+            }
+            server {
+                listen 80;
+                server_name example.com;
+                location / {
+                    proxy_pass http://backend;
+                    limit_except GET {
+                        deny all;
+                    }
+                }
+                location = /status {
+                    return 200;
+                }
+            }
+            server {
+                listen 80;
+                server_name api.example.com;
+                location /v1 {
+                    proxy_pass http://legacy;
+                }
+            }
+        }
+        """
+        self.map_ips = {'10.0.0.1': ['d-app1'], '10.0.0.2': ['d-app2'], '10.0.0.3': ['stage-app3']}
+        self.map_host = {'d-app1': '10.0.0.1', 'd-app2': '10.0.0.2', 'stage-app3': '10.0.0.3'}
+
+    def _diff(self, *replacements):
+        new_content = self.content_string
+        for old, new in replacements:
+            self.assertIn(old, new_content)
+            new_content = new_content.replace(old, new)
+        return ConfDiff(HttpContext(self.content_string), HttpContext(new_content))
+
+    def test_same_confs(self):
+        old = HttpContext(self.content_string)
+        # accessed directives are compared as written
+        self.assertEqual('http://backend', old.servers[0].location[0].proxy_pass)
+        conf_diff = ConfDiff(old, HttpContext(self.content_string.replace('    ', '  ')))
+
+        self.assertEqual(dict(servers=dict(added=[], removed=[], changed=[]),
+                              upstreams=dict(added=[], removed=[], changed=[])), conf_diff.to_dict())
+        self.assertEqual(dict(added=[], removed=[]), conf_diff.services_delta(self.map_ips, self.map_host))
+
+    def test_location_changes(self):
+        conf_diff = self._diff(('return 200;', 'return 200; internal;'), ('deny all;', 'deny 10.0.0.0/8;'),
+                               ('location /v1 {', 'location ~ ^/v2 {\n proxy_pass http://legacy;\n }\n location /v1 {'))
+
+        example, api = conf_diff.servers['changed']
+        self.assertEqual(dict(listen=['80'], server_name=['example.com']),
+                         dict(listen=example['listen'], server_name=example['server_name']))
+        self.assertEqual({}, example['directives'])
+        self.assertEqual([dict(modifier='', path='/', limit_except=dict(GET=dict(deny=[['all'], ['10.0.0.0/8']]))),
+                          dict(modifier='=', path='/status', directives=dict(internal=[False, True]))],
+                         example['locations']['changed'])
+        self.assertEqual([dict(modifier='~', path='^/v2')], api['locations']['added'])
+
+    def test_digests_do_not_collide(self):
+        # equal hash() values of different subtrees still tell the change
+        with mock.patch('builtins.hash', return_value=0):
+            legacy = 'server d-app2.yourltd.com:8080;\n            }\n            upstream unused'
+            conf_diff = self._diff(('return 200;', 'return 200; internal;'), (legacy, legacy.replace('app2', 'app3')))
+        self.assertEqual([dict(modifier='=', path='/status', directives=dict(internal=[False, True]))],
+                         conf_diff.servers['changed'][0]['locations']['changed'])
+        self.assertEqual(['legacy'], [_['name'] for _ in conf_diff.upstreams['changed']])
+
+    def test_servers_are_matched_by_listen_and_names(self):
+        conf_diff = self._diff(('server_name api.example.com;', 'server_name api.example.com www.example.com;'))
+
+        self.assertEqual([dict(listen=['80'], server_name=['api.example.com', 'www.example.com'])],
+                         conf_diff.servers['added'])
+        self.assertEqual([dict(listen=['80'], server_name=['api.example.com'])], conf_diff.servers['removed'])
+        self.assertEqual(dict(added=[['www.example.com', '', '', 'legacy', 'int', 'd-app2', '10.0.0.2', 8080, '/v1']],
+                              removed=[]),
+                         conf_diff.services_delta(self.map_ips, self.map_host))
+
+    def test_upstream_changes(self):
+        conf_diff = self._diff(('server d-app1.yourltd.com:8080;', 'server d-app1.yourltd.com:8080 weight=2;\n'
+                                                                   'server stage-app3.yourltd.com:8081;'),
+                               ('upstream unused {\n                server d-app2.yourltd.com:8080;\n            }', ''))
+
+        changed, = conf_diff.upstreams['changed']
+        self.assertEqual('backend', changed['name'])
+        self.assertEqual([dict(address='stage-app3.yourltd.com:8081', parameters={})], changed['members']['added'])
+        self.assertEqual([dict(address='d-app1.yourltd.com:8080', parameters=[{}, dict(weight='2')])],
+                         changed['members']['changed'])
+        self.assertEqual([dict(name='unused', members=['d-app2.yourltd.com:8080'])], conf_diff.upstreams['removed'])
+        # the servers did not change, their rows did
+        self.assertEqual([], conf_diff.servers['changed'])
+        self.assertEqual(dict(added=[['example.com', '', '', 'backend', 'stage', 'stage-app3', '10.0.0.3', 8081, '/']],
+                              removed=[]),
+                         conf_diff.services_delta(self.map_ips, self.map_host))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+# coding=utf-8
+import os
+import sys
+import threading
+import time
+import unittest
+
+from services_spec_generator.conf_watcher import InotifyWatcher, PollingWatcher, wait_for_changes
+from tests.helpers import TempDirMixin
+
+
+class WatcherTestMixin(TempDirMixin):
+    def setUp(self):
+        super().setUp()
+        self.upstreams_path = self._write('backends.conf', 'upstream a {}')
+        self.site_path = self._write('sites-available/site.conf', 'server {}')
+        self.watcher = self.make_watcher()
+        self.watcher.watch([self.upstreams_path], [os.path.join(self.tmp_dir.name, 'sites-available', '*.conf')])
+
+    def tearDown(self):
+        self.watcher.close()
+
+    def test_changes(self):
+        self.assertFalse(self.watcher.wait(0.05))
+
+        self._write('backends.conf', 'upstream b {}')
+        self.assertTrue(self.watcher.wait(1))
+        self.assertFalse(self.watcher.wait(0.05))
+
+        self._write('sites-available/new.conf', 'server {}')
+        self.assertTrue(self.watcher.wait(1))
+
+        # a file replaced by a rename
+        replacement = self._write('sites-available/site.conf.tmp', 'server { listen 81; }')
+        os.replace(replacement, self.site_path)
+        self.assertTrue(self.watcher.wait(1))
+
+        os.remove(self.site_path)
+        self.assertTrue(self.watcher.wait(1))
+
+    def test_other_files_are_ignored(self):
+        self._write('sites-available/site.conf.swp', 'x')
+        self._write('services_table.csv', 'x')
+        self.assertFalse(self.watcher.wait(0.1))
+
+    def test_bursts_are_debounced(self):
+        def write():
+            for index in range(5):
+                self._write('backends.conf', 'upstream a{0} {{}}'.format(index))
+                time.sleep(0.02)
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        wait_for_changes(self.watcher, debounce=0.1, max_delay=2)
+        writer.join()
+        self.assertFalse(self.watcher.wait(0.05))
+
+
+class PollingWatcherTest(WatcherTestMixin, unittest.TestCase):
+    @staticmethod
+    def make_watcher():
+        return PollingWatcher(0.01)
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), 'inotify is linux only')
+class InotifyWatcherTest(WatcherTestMixin, unittest.TestCase):
+    @staticmethod
+    def make_watcher():
+        return InotifyWatcher(0.01)
+
+    def test_missing_directory_is_polled(self):
+        with self.assertLogs('services_spec_generator.conf_watcher', 'WARNING'):
+            self.watcher.watch([os.path.join(self.tmp_dir.name, 'conf.d', 'backends.conf')])
+        self.assertFalse(self.watcher.wait(0.05))
+
+        self._write('conf.d/backends.conf', 'upstream a {}')
+        self.assertTrue(self.watcher.wait(1))
+        self.assertFalse(self.watcher.wait(0.05))
+        self._write('backends.conf', 'upstream b {}')
+        self.assertTrue(self.watcher.wait(1))
+
+
+if __name__ == '__main__':
+    unittest.main()
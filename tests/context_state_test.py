@@ -0,0 +1,69 @@
+# coding=utf-8
+import gc
+import os
+import unittest
+
+from services_spec_generator.nginx_conf_parser.events_context import EventContext
+from services_spec_generator.nginx_conf_parser.http_context import HttpContext
+from services_spec_generator.nginx_conf_parser.main_context import MainContext
+from services_spec_generator.nginx_conf_parser.stream_context import StreamContext
+from services_spec_generator.nginx_conf_parser.upstream_context import UpstreamContext
+from services_spec_generator.nginx_conf_parser.utils import extract_context
+
+FEATURES = os.path.join(os.path.dirname(__file__), 'features')
+
+
+class ContextStateTest(unittest.TestCase):
+    def setUp(self):
+        with open(os.path.join(FEATURES, 'nginx_full.conf')) as conf_file:
+            self.conf = conf_file.read()
+        with open(os.path.join(FEATURES, 'nginx_stream_sample.conf')) as conf_file:
+            self.stream = extract_context(conf_file.read(), 'stream')
+        self.events = extract_context(self.conf, 'events')
+
+    def _parse(self):
+        main = MainContext()
+        main.load(self.conf)
+        http = HttpContext(self.conf)
+        # the directives of a server are parsed on first access
+        for server in http.servers:
+            server.listen, server.server_name
+        stream = StreamContext()
+        stream.load(self.stream)
+        return main, EventContext(self.events), http, stream
+
+    def test_contexts_do_not_share_state(self):
+        first, second = MainContext(), MainContext()
+        first.load('user www www; error_log logs/e.log warn; thread_pool one threads=4; env A;')
+        self.assertEqual(dict(user='nobody', group='nobody'), second.user)
+        self.assertEqual(dict(file='logs/error.log', level='error'), second.error_log)
+        self.assertEqual(dict(name='default', threads=32, max_queue=65536), second.thread_pool)
+        self.assertEqual([], second.env)
+
+        first, second = StreamContext(), StreamContext()
+        first.load(self.stream)
+        self.assertEqual(([], []), (second.upstreams, second.servers))
+
+        self.assertIsNot(EventContext('').debug_connection, EventContext('').debug_connection)
+        self.assertIsNot(UpstreamContext('a', '').servers, UpstreamContext('b', '').servers)
+
+    def test_repeated_parsing_keeps_memory_flat(self):
+        first = self._parse()
+        for _ in range(100):
+            self._parse()
+        gc.collect()
+        objects = len(gc.get_objects())
+
+        for _ in range(10000):
+            self._parse()
+        gc.collect()
+        # a context left on a class would keep every parse alive
+        self.assertLess(len(gc.get_objects()) - objects, 100)
+
+        last = self._parse()
+        self.assertEqual(len(first[3].upstreams), len(last[3].upstreams))
+        self.assertEqual(len(first[2].servers), len(last[2].servers))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+# coding=utf-8
+import pickle
+import unittest
+from unittest import mock
+
+from services_spec_generator.nginx_conf_parser.server_context import ServerContext
+
+
+class DirectiveContextTest(unittest.TestCase):
+    def setUp(self):
+        self.content_string = """
+        server {
+            listen 443 ssl;
+            server_name example.com;
+            location / {
+                proxy_pass http://backend;
+            }
+        }
+        """
+
+    @staticmethod
+    def _stored(context, name):
+        try:
+            type(context).__dict__[name].__get__(context)
+        except AttributeError:
+            return False
+        return True
+
+    def test_directives_are_stored_on_access(self):
+        server = ServerContext(self.content_string)
+        self.assertFalse(hasattr(server, '__dict__'))
+        self.assertFalse(self._stored(server, 'listen'))
+        self.assertFalse(self._stored(server, 'keepalive_timeout'))
+
+        self.assertEqual('443', server.listen[0]['value'])
+        self.assertEqual('75s', server.keepalive_timeout['timeout'])
+        self.assertTrue(self._stored(server, 'listen'))
+        self.assertTrue(self._stored(server, 'keepalive_timeout'))
+
+    def test_directives_are_parsed_once(self):
+        parser = mock.Mock(return_value='parsed')
+        with mock.patch.dict(ServerContext._directives, server_name=(parser, '', False)):
+            server = ServerContext(self.content_string)
+            parser.assert_not_called()
+
+            self.assertEqual('parsed', server.server_name)
+            self.assertEqual('parsed', server.server_name)
+        parser.assert_called_once_with(['example.com'])
+
+    def test_defaults(self):
+        location = ServerContext(self.content_string).location[0]
+        self.assertEqual('http://backend', location.proxy_pass)
+        self.assertEqual('1m', location.client_max_body_size)
+        self.assertFalse(location.internal)
+        self.assertIsNone(location.alias)
+        self.assertRaises(AttributeError, getattr, location, 'unknown_directive')
+
+    def test_mutable_defaults_are_not_shared(self):
+        first, second = ServerContext('server {}'), ServerContext('server {}')
+        self.assertEqual('*:80 | *:8000', first.listen[0]['value'])
+        self.assertIs(first.listen, first.listen)
+
+        first.listen[0]['value'] = '8080'
+        first.keepalive_timeout['timeout'] = '5s'
+        self.assertEqual('*:80 | *:8000', second.listen[0]['value'])
+        self.assertEqual('75s', second.keepalive_timeout['timeout'])
+
+    def test_pickle(self):
+        server = pickle.loads(pickle.dumps(ServerContext(self.content_string)))
+        self.assertEqual('443', server.listen[0]['value'])
+        self.assertEqual('backend', server.location[0].proxy_pass_upstream)
+        self.assertEqual('off', server.aio)
+
+    def test_pickle_keeps_directives_raw(self):
+        server = ServerContext(self.content_string)
+        server = pickle.loads(pickle.dumps(server))
+        self.assertFalse(self._stored(server, 'listen'))
+        self.assertFalse(self._stored(server, 'keepalive_timeout'))
+        self.assertEqual('443', server.listen[0]['value'])
+
+
+if __name__ == '__main__':
+    unittest.main()
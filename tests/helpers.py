@@ -0,0 +1,30 @@
+# coding=utf-8
+import os
+import tempfile
+
+# the bind zone of the conf fixtures: d-app1 is proxied to by name, stage-api by address
+ZONE = "d-app1      IN      A      10.0.0.1\n" \
+       "stage-api   IN      A      10.0.0.2\n"
+
+
+class TempDirMixin:
+    """
+    A temporary directory per test for the files it writes, removed after the test.
+    With chdir the test runs in it, for the code writing its files to the working directory
+    """
+    chdir = False
+
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        if self.chdir:
+            self.addCleanup(os.chdir, os.getcwd())
+            os.chdir(self.tmp_dir.name)
+
+    def _write(self, name, content, opener=open):
+        path = os.path.join(self.tmp_dir.name, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with opener(path, 'wt') as f:
+            f.write(content)
+        return path
@@ -0,0 +1,152 @@
+# coding=utf-8
+import unittest
+
+from services_spec_generator.nginx_conf_parser.location_matcher import LocationMatcher, normalize_uri, \
+    split_location_path
+from services_spec_generator.nginx_conf_parser.server_context import ServerContext
+from services_spec_generator.nginx_conf_parser.tokenizer import unquote
+
+
+class LocationMatcherTest(unittest.TestCase):
+    def setUp(self):
+        # the example of the nginx location documentation
+        self.server = ServerContext(r"""
+        server {
+            location = / {
+                proxy_pass http://a;
+            }
+            location / {
+                proxy_pass http://b;
+            }
+            location /documents/ {
+                proxy_pass http://c;
+            }
+            location ^~ /images/ {
+                proxy_pass http://d;
+            }
+            location ~* "\.(gif|jpg|jpeg)$" {
+                proxy_pass http://e;
+            }
+            location ~ ^/api/(?<version>v\d+)/ {
+                proxy_pass http://f;
+            }
+            location ~ /api/ {
+                proxy_pass http://g;
+            }
+            location @fallback {
+                proxy_pass http://h;
+            }
+        }
+        """)
+        self.matcher = LocationMatcher.from_server(self.server)
+
+    def _match(self, uri):
+        location = self.matcher.match(uri)
+        return location.proxy_pass_upstream if location is not None else None
+
+    def test_precedence(self):
+        self.assertEqual('a', self._match('/'))
+        self.assertEqual('b', self._match('/index.html'))
+        self.assertEqual('c', self._match('/documents/document.html'))
+        self.assertEqual('d', self._match('/images/1.gif'))
+        self.assertEqual('e', self._match('/documents/1.jpg'))
+        self.assertEqual('e', self._match('/DOCUMENTS/1.JPG'))
+
+    def test_regexes_in_order(self):
+        self.assertEqual('f', self._match('/api/v1/users'))
+        self.assertEqual('g', self._match('/api/users'))
+        self.assertEqual('g', self._match('/v2/api/'))
+        self.assertEqual([], self.matcher.unsupported)
+        self.assertIsNotNone(self.matcher._regex)
+
+    def test_anchored_alternation(self):
+        matcher = LocationMatcher(ServerContext(r"""
+        server {
+            location / {
+                proxy_pass http://root;
+            }
+            location ~ ^/a|/b {
+                proxy_pass http://alt;
+            }
+        }
+        """).location)
+        self.assertEqual('alt', matcher.match('/x/b').proxy_pass_upstream)
+        self.assertEqual('alt', matcher.match('/a').proxy_pass_upstream)
+        self.assertEqual('root', matcher.match('/xa').proxy_pass_upstream)
+
+    def test_combined_regex_matches_one_by_one(self):
+        matcher = LocationMatcher(ServerContext(r"""
+        server {
+            location ~ ^/a$|/b {
+                proxy_pass http://alt;
+            }
+            location ~* ^/(img|css)/|\.PNG$ {
+                proxy_pass http://static;
+            }
+            location ~ ^/api$|^/api/ {
+                proxy_pass http://api;
+            }
+            location ~ (?<name>x)y|z$ {
+                proxy_pass http://named;
+            }
+            location ~ /c {
+                proxy_pass http://c;
+            }
+        }
+        """).location)
+        self.assertIsNotNone(matcher._regex)
+        uris = ['/a', '/xa', '/x/b', '/IMG/1', '/x/img/1', '/p.png', '/api', '/apix', '/x/api/', '/api/v1', '/xy',
+                '/z', '/zz/', '/b/c', '/x/c', '/', '']
+        combined = [matcher.match(_) for _ in uris]
+        matcher._regex = None
+        self.assertEqual([matcher.match(_) for _ in uris], combined)
+        self.assertEqual(['alt', None, 'alt', 'static', None, 'static', 'api', None, None, 'api', 'named',
+                          'named', None, 'alt', 'c', None, None],
+                         [_.proxy_pass_upstream if _ is not None else None for _ in combined])
+
+    def test_back_references_are_matched_one_by_one(self):
+        matcher = LocationMatcher(ServerContext(r"""
+        server {
+            location ~ ^/(\w+)/\1$ {
+                proxy_pass http://twice;
+            }
+            location ~ ^/(\w+)/ {
+                proxy_pass http://once;
+            }
+            location ~ (?<!x)yz {
+                proxy_pass http://lookbehind;
+            }
+        }
+        """).location)
+        self.assertIsNone(matcher._regex)
+        self.assertEqual('twice', matcher.match('/a/a').proxy_pass_upstream)
+        self.assertEqual('once', matcher.match('/a/b').proxy_pass_upstream)
+        self.assertEqual('lookbehind', matcher.match('/yz').proxy_pass_upstream)
+
+    def test_no_location(self):
+        matcher = LocationMatcher(ServerContext('server { location /api { proxy_pass http://api; } }').location)
+        self.assertIsNone(matcher.match('/'))
+        self.assertEqual('api', matcher.match('/api2').proxy_pass_upstream)
+
+    def test_match_many(self):
+        upstreams = [_.proxy_pass_upstream for _ in self.matcher.match_many(
+            ['https://example.com/images/a.png?size=1', '/images/a.png', '/b//../documents/%31.html', '/'])]
+        self.assertEqual(['d', 'd', 'c', 'a'], upstreams)
+
+    def test_normalize_uri(self):
+        self.assertEqual('/', normalize_uri('http://example.com'))
+        self.assertEqual('/a/c/', normalize_uri('/a/./b/../c/.'))
+        self.assertEqual('/a b', normalize_uri('/a%20b?x=/y'))
+        self.assertEqual('/', normalize_uri('/..'))
+
+    def test_split_location_path(self):
+        self.assertEqual(('=', '/'), split_location_path('= /'))
+        self.assertEqual(('=', '/x'), split_location_path('=/x'))
+        self.assertEqual(('~*', r'\.php$'), split_location_path(r'~* "\.php$"'))
+        self.assertEqual(('@', '@named'), split_location_path('@named'))
+        self.assertEqual(('', '/a b'), split_location_path("'/a b'"))
+        self.assertEqual('a"b', unquote(r'"a\"b"'))
+
+
+if __name__ == '__main__':
+    unittest.main()
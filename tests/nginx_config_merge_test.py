@@ -0,0 +1,139 @@
+# coding=utf-8
+import os
+import time
+import unittest
+from unittest import mock
+
+from services_spec_generator.nginx_conf_parser.http_context import HttpContext
+from services_spec_generator.nginx_conf_parser.tokenizer import parse
+from services_spec_generator.nginx_config_merge import IncludeResolver, NginxMergedDumper, NginxParser, ParseCache, \
+    parse_file, parse_tree_file
+from tests.helpers import TempDirMixin
+
+
+class ParseCacheTest(TempDirMixin, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = ParseCache(os.path.join(self.tmp_dir.name, 'cache'))
+
+        self.include_path = self._write('backends.conf', 'upstream backend {\n    server 10.0.0.1:8080;\n}\n')
+        self.conf_path = self._write('nginx.conf', 'http {\n    include %s;\n}\n' % self.include_path)
+
+    def test_parsed_tree_is_reused(self):
+        expected = parse_file(self.include_path)
+        self.assertEqual(expected, parse_file(self.include_path, self.cache))
+
+        with mock.patch.object(NginxParser, 'parse', side_effect=AssertionError('parsed again')):
+            self.assertEqual(expected, parse_file(self.include_path, self.cache))
+
+    def test_changed_file_is_parsed_again(self):
+        first = NginxMergedDumper(self.conf_path, cache=self.cache).as_string()
+        self.assertIn('server 10.0.0.1:8080;', first)
+
+        self._write('backends.conf', 'upstream backend {\n    server 10.0.0.2:8080;\n}\n')
+        second = NginxMergedDumper(self.conf_path, cache=self.cache).as_string()
+        self.assertIn('server 10.0.0.2:8080;', second)
+        self.assertEqual(NginxMergedDumper(self.conf_path).as_string(), second)
+
+    def test_entry_put_again_is_counted_once(self):
+        tree = parse_file(self.include_path, self.cache)
+        for _ in range(3):
+            self.cache.put(self.include_path, open(self.include_path).read(), tree)
+        self.assertEqual(sum(os.path.getsize(os.path.join(self.cache.directory, _))
+                             for _ in os.listdir(self.cache.directory)), self.cache._size)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        parse_file(self.include_path, self.cache)
+        time.sleep(0.01)
+        parse_file(self.conf_path, self.cache)
+        self.assertEqual(2, len(os.listdir(self.cache.directory)))
+
+        self.cache.max_size = max(os.path.getsize(os.path.join(self.cache.directory, _))
+                                  for _ in os.listdir(self.cache.directory))
+        self.cache.evict()
+
+        self.assertEqual(1, len(os.listdir(self.cache.directory)))
+        self.assertIsNotNone(self.cache.get(self.conf_path, open(self.conf_path).read()))
+        self.assertIsNone(self.cache.get(self.include_path, open(self.include_path).read()))
+
+
+class IncludeResolverTest(TempDirMixin, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.conf_path = self._write('nginx.conf', """
+        http {
+            include %(dir)s/backends.conf;
+            include "%(dir)s/sites/*.conf";
+        }
+        """ % dict(dir=self.tmp_dir.name))
+        self._write('backends.conf', """
+        upstream backend {
+            # git: https://gitlab.yourltd.com/services/backend
+            server 10.0.0.1:8080;
+        }
+        """)
+        for name in ('b', 'a'):
+            self._write('sites/%s.conf' % name, """
+            server {
+                server_name %s.example.com;
+                location / {
+                    include %s/proxy.conf;
+                }
+            }
+            """ % (name, self.tmp_dir.name))
+        self._write('proxy.conf', 'proxy_pass http://backend;')
+
+    def test_included_trees_are_spliced(self):
+        resolver = IncludeResolver()
+        http = resolver.load(self.conf_path).children[0]
+
+        self.assertEqual(['upstream', 'server', 'server'], [_.name for _ in http.children])
+        self.assertEqual(['a.example.com'], http.children[1].children[0].args)
+        self.assertEqual('proxy_pass', http.children[1].children[1].children[0].name)
+        self.assertEqual('server 10.0.0.1:8080;', http.children[0].children[1].text)
+
+    def test_every_file_is_parsed_once(self):
+        resolver = IncludeResolver()
+        with mock.patch('services_spec_generator.nginx_config_merge.parse', side_effect=parse) as parse_mock:
+            resolver.load(self.conf_path)
+        self.assertEqual(5, parse_mock.call_count)
+        self.assertEqual(5, len(resolver.files))
+
+    def test_cached_trees_are_not_modified(self):
+        cache = ParseCache(os.path.join(self.tmp_dir.name, 'cache'))
+        IncludeResolver(cache).load(self.conf_path)
+        IncludeResolver(cache).load(self.conf_path)
+
+        cached = parse_tree_file(self.conf_path, cache)
+        self.assertEqual('include', cached.children[0].children[0].name)
+
+    def test_context(self):
+        http_context = HttpContext(IncludeResolver().load(self.conf_path).children[0])
+
+        self.assertEqual('https://gitlab.yourltd.com/services/backend', http_context.upstreams[0].git_project)
+        self.assertEqual('10.0.0.1:8080', http_context.upstreams[0].servers[0]['address'])
+        self.assertEqual(['backend', 'backend'], [_.location[0].proxy_pass_upstream for _ in http_context.servers])
+
+    def test_lazy_servers(self):
+        resolver = IncludeResolver(lazy=('server',))
+        with mock.patch('services_spec_generator.nginx_config_merge.parse', side_effect=parse) as parse_mock:
+            http_context = HttpContext(resolver.load(self.conf_path).children[0], resolver)
+        # the included proxy.conf is only parsed with the servers
+        self.assertEqual(4, parse_mock.call_count)
+
+        server = http_context.servers[0]
+        self.assertEqual('a.example.com', server.server_name)
+        self.assertEqual('backend', server.location[0].proxy_pass_upstream)
+        self.assertEqual(5, len(resolver.files))
+
+        server.release()
+        self.assertEqual('a.example.com', server.server_name)
+        self.assertEqual(['backend', 'backend'], [_.location[0].proxy_pass_upstream for _ in http_context.servers])
+
+    def test_include_cycle(self):
+        self._write('proxy.conf', 'include %s/sites/a.conf;' % self.tmp_dir.name)
+        self.assertRaises(ValueError, IncludeResolver().load, self.conf_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,445 @@
+# coding=utf-8
+import gc
+import json
+import os
+import pickle
+import threading
+import time
+import unittest
+import weakref
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
+
+from services_spec_generator import parse_conf
+from services_spec_generator.parse_conf import DataTable, IncrementalParser, RowItem, fetch_git_projects_details, \
+    get_git_project_details, load_git_projects_cache, parse_fleet, parse_server, parse_server_rows, \
+    print_services_rows, save_git_projects_cache, watch_services_table
+from services_spec_generator.conf_watcher import PollingWatcher
+from tests.helpers import ZONE, TempDirMixin
+
+
+class IncrementalParserTest(TempDirMixin, unittest.TestCase):
+    # the printers write the services table output files to the working directory
+    chdir = True
+
+    def setUp(self):
+        super().setUp()
+        self.upstreams_path = self._write('backends.conf', """
+        upstream backend {
+            server d-app1.yourltd.com:8080;
+        }
+        upstream api {
+            server 10.0.0.2:9000;
+        }
+        """)
+        self.site_path = self._write('sites-available/site.conf', """
+        server {
+            listen 80;
+            server_name example.com;
+            location / {
+                proxy_pass http://backend;
+            }
+        }
+        """)
+        self._write('sites-available/api.conf', """
+        server {
+            listen 80;
+            server_name api.example.com;
+            location /v1 {
+                proxy_pass http://api;
+            }
+        }
+        """)
+        self.zone_path = self._write('zone', ZONE)
+        self.sources = (self.upstreams_path, os.path.join(self.tmp_dir.name, 'sites-available/*.conf'), self.zone_path)
+        self.state_path = os.path.join(self.tmp_dir.name, 'state')
+
+    def _update(self):
+        parser = IncrementalParser.load(self.state_path, *self.sources)
+        with mock.patch.object(IncrementalParser, '_parse_source', autospec=True,
+                               side_effect=IncrementalParser._parse_source) as parse_source:
+            table = parser.update()
+        parser.save(self.state_path)
+        return table, [_[0][1] for _ in parse_source.call_args_list]
+
+    @staticmethod
+    def _rows(table):
+        return sorted(tuple(_) for _ in table.to_list())
+
+    def test_first_run_matches_full_parse(self):
+        table, parsed = self._update()
+        self.assertEqual(3, len(parsed))
+        self.assertEqual(self._rows(parse_server(*self.sources)), self._rows(table))
+
+    def test_only_changed_files_are_parsed_again(self):
+        self._update()
+        table, parsed = self._update()
+        self.assertEqual([], parsed)
+        self.assertEqual(2, len(table.rows))
+
+        time.sleep(0.01)
+        self._write('sites-available/site.conf', open(self.site_path).read().replace('location /', 'location /new'))
+        table, parsed = self._update()
+        self.assertEqual([self.site_path], parsed)
+        self.assertIn('/new', [_.location for _ in table.rows])
+        self.assertEqual(self._rows(parse_server(*self.sources)), self._rows(table))
+
+    def test_changed_upstreams_rebuild_rows(self):
+        self._update()
+
+        time.sleep(0.01)
+        self._write('backends.conf', open(self.upstreams_path).read().replace('10.0.0.2:9000', '10.0.0.2:9001'))
+        table, parsed = self._update()
+        self.assertEqual([self.upstreams_path], parsed)
+        self.assertEqual([8080, 9001], sorted(_.port for _ in table.rows))
+
+    def test_failed_update_leaves_the_state_as_it_was(self):
+        parser = IncrementalParser(*self.sources)
+        parser.update()
+
+        time.sleep(0.01)
+        self._write('backends.conf', open(self.upstreams_path).read().replace('10.0.0.2:9000', '10.0.0.2:9001'))
+        site = open(self.site_path).read()
+        self._write('sites-available/site.conf', site + '\nserver {\n')
+        with self.assertRaises(ValueError):
+            parser.update()
+        self.assertEqual('10.0.0.2:9000', parser.upstreams_map['api'].servers[0]['address'])
+
+        self._write('sites-available/site.conf', site)
+        table = parser.update()
+        self.assertEqual([8080, 9001], sorted(_.port for _ in table.rows))
+        self.assertEqual(self._rows(parse_server(*self.sources)), self._rows(table))
+
+    def test_watch_prints_the_table_again_on_changes(self):
+        parser = IncrementalParser(*self.sources)
+        updated = []
+        watcher = threading.Thread(target=watch_services_table,
+                                   args=(parser, PollingWatcher(0.01), ('csv', 'html'), 'html', 0.05,
+                                         lambda _: updated.append(time.monotonic()), 2))
+        watcher.start()
+        while not updated:
+            time.sleep(0.01)
+        with open('services_table.csv') as csv_file:
+            self.assertNotIn('/new', csv_file.read())
+
+        self._write('sites-available/site.conf', open(self.site_path).read().replace('location /', 'location /new'))
+        changed = time.monotonic()
+        watcher.join(5)
+        self.assertFalse(watcher.is_alive())
+        self.assertLess(updated[1] - changed, 1)
+        with open('services_table.csv') as csv_file:
+            self.assertIn('/new', csv_file.read())
+        self.assertEqual({'backends.conf', 'sites-available', 'zone', 'services_table.csv', 'services_table.html'},
+                         set(os.listdir('.')))
+
+    def test_watch_keeps_the_last_table_on_errors(self):
+        parser = IncrementalParser(*self.sources)
+        updated = []
+        watcher = threading.Thread(target=watch_services_table,
+                                   args=(parser, PollingWatcher(0.01), ('csv',), 'html', 0.05,
+                                         lambda _: updated.append(time.monotonic()), 2))
+        watcher.start()
+        while not updated:
+            time.sleep(0.01)
+
+        site = open(self.site_path).read()
+        with self.assertLogs(parse_conf.logger, 'ERROR'):
+            self._write('sites-available/site.conf', site + '\nserver {\n')
+            time.sleep(0.5)
+        self.assertTrue(watcher.is_alive())
+        with open('services_table.csv') as csv_file:
+            self.assertIn('example.com', csv_file.read())
+
+        self._write('sites-available/site.conf', site.replace('location /', 'location /new'))
+        watcher.join(5)
+        self.assertFalse(watcher.is_alive())
+        self.assertEqual(2, len(updated))
+        with open('services_table.csv') as csv_file:
+            self.assertIn('/new', csv_file.read())
+
+
+class ParseFleetTest(TempDirMixin, unittest.TestCase):
+    chdir = True
+
+    def setUp(self):
+        super().setUp()
+        for host, port in (('host_d-ngx1', 8080), ('host_d-ngx2', 9090)):
+            self._write(host + '/conf.d/backends.conf', """
+            upstream backend {
+                server d-app1.yourltd.com:%d;
+            }
+            """ % port)
+            self._write(host + '/sites-available/site.conf', """
+            server {
+                listen 80;
+                server_name %s.example.com;
+                location / {
+                    proxy_pass http://backend;
+                }
+            }
+            """ % host)
+        self._write('host_readme', '')
+        self.zone_path = self._write('zone', "d-app1      IN      A      10.0.0.1\n")
+
+    def test_hosts_are_merged(self):
+        table = parse_fleet(os.path.join(self.tmp_dir.name, 'host_*'), self.zone_path, max_workers=2)
+
+        expected = []
+        for host in ('host_d-ngx1', 'host_d-ngx2'):
+            expected += parse_server(os.path.join(self.tmp_dir.name, host, 'conf.d/backends.conf'),
+                                     os.path.join(self.tmp_dir.name, host, 'sites-available/*.conf'),
+                                     self.zone_path).to_list()
+        self.assertEqual(sorted(tuple(_) for _ in expected), sorted(tuple(_) for _ in table.to_list()))
+        self.assertEqual([8080, 9090], sorted(_.port for _ in table.rows))
+
+    def test_no_hosts(self):
+        table = parse_fleet(os.path.join(self.tmp_dir.name, 'missing_*'), self.zone_path)
+        self.assertEqual([], table.rows)
+
+
+class DataTableTest(unittest.TestCase):
+    def setUp(self):
+        self.rows = [
+            ['b.example.com', 'first', None, 'backend', 'int', 'd-app1', '10.0.0.1', 8080, '/'],
+            ['a.example.com', 'first', None, 'backend', 'int', 'd-app2', '10.0.0.2', 8080, '/'],
+            ['a.example.com', 'second', 'https://gitlab.yourltd.com/services/second', 'api', 'prod', 'prod-app1',
+             '10.0.1.1', 9000, '/v1'],
+        ]
+        self.table = DataTable(RowItem(*_) for _ in self.rows)
+
+    def test_rows(self):
+        self.assertEqual(3, len(self.table))
+        self.assertEqual(self.rows, self.table.to_list())
+        self.assertEqual(self.rows, [_.to_list() for _ in self.table.rows])
+
+    def test_values_are_stored_once(self):
+        self.assertEqual(['first', 'second'], self.table.values['service_name'])
+        self.assertEqual([0, 0, 1], list(self.table.codes['service_name']))
+        self.assertEqual(['https://gitlab.yourltd.com/services/second'], self.table.values['service_git_url'])
+        self.assertEqual([-1, -1, 0], list(self.table.codes['service_git_url']))
+
+    def test_frame(self):
+        frame = self.table.to_frame()
+        self.assertEqual(DataTable.header, list(frame.columns))
+        self.assertEqual(['a.example.com', 'b.example.com'], list(frame['domain'].cat.categories))
+        self.assertEqual(['b.example.com', 'a.example.com', 'a.example.com'], list(frame['domain']))
+        self.assertEqual([8080, 8080, 9000], list(frame['port']))
+        self.assertEqual([True, True, False], frame['service_git_url'].isna().tolist())
+        self.assertEqual(0, len(DataTable().to_frame()))
+
+    def test_pickle(self):
+        table = pickle.loads(pickle.dumps(self.table))
+        table.append(RowItem('b.example.com', 'second', None, 'api', 'prod', 'prod-app2', '10.0.1.2', 9000, '/v1'))
+        self.assertEqual(self.rows + [['b.example.com', 'second', None, 'api', 'prod', 'prod-app2', '10.0.1.2',
+                                       9000, '/v1']], table.to_list())
+        self.assertEqual(['b.example.com', 'a.example.com'], table.values['domain'])
+
+
+class ServicesRowsTest(TempDirMixin, unittest.TestCase):
+    # the printers write to the working directory
+    chdir = True
+
+    def setUp(self):
+        super().setUp()
+        self.sources = (self._write('backends.conf', """
+            upstream backend {
+                server d-app1.yourltd.com:8080;
+                server 10.0.0.2:8081;
+            }
+            """), self._write('site.conf', """
+            server {
+                listen 80;
+                server_name example.com www.example.com;
+                location / {
+                    proxy_pass http://backend;
+                }
+            }
+            """), self._write('zone', ZONE))
+
+    def test_upstreams_are_resolved_once(self):
+        self._write('site.conf', """
+            server {
+                listen 80;
+                server_name example.com www.example.com;
+                location / {
+                    proxy_pass http://backend;
+                }
+                location /api {
+                    proxy_pass http://backend/api;
+                }
+                location /static {
+                    proxy_pass http://10.0.0.1:8000;
+                }
+                location /local {
+                    proxy_pass http://127.0.0.1:9000;
+                }
+            }
+            """)
+        with mock.patch.object(parse_conf, 'get_git_project_details', wraps=parse_conf.get_git_project_details) \
+                as git_project_details, \
+                mock.patch.object(parse_conf, 'define_stand_by_host', wraps=parse_conf.define_stand_by_host) \
+                as stand_by_host:
+            rows = parse_server(*self.sources).to_list()
+        git_project_details.assert_called_once()
+        self.assertEqual(2, stand_by_host.call_count)
+
+        # locations x domains x upstream servers, the addresses which are no upstream make no rows
+        # and are not looked up in the zone, 127.0.0.1 is not in it
+        self.assertEqual(2 * 2 * 2, len(rows))
+        self.assertEqual([('example.com', '/', 'd-app1', 8080), ('example.com', '/', 'stage-api', 8081),
+                          ('www.example.com', '/', 'd-app1', 8080), ('www.example.com', '/', 'stage-api', 8081)],
+                         [(_[0], _[8], _[5], _[7]) for _ in rows[:4]])
+
+    def test_rows_are_made_lazily(self):
+        with mock.patch.object(parse_conf, 'HttpContext', wraps=parse_conf.HttpContext) as http_context:
+            rows = parse_server_rows(*self.sources)
+            http_context.assert_not_called()
+            first = next(rows)
+        http_context.assert_called_once()
+
+        self.assertEqual(parse_server(*self.sources).to_list(), [first.to_list()] + [_.to_list() for _ in rows])
+
+    def test_bounded_memory_rows(self):
+        self.assertEqual([_.to_list() for _ in parse_server_rows(*self.sources)],
+                         [_.to_list() for _ in parse_server_rows(*self.sources, bounded_memory=True)])
+
+    def test_bounded_memory_is_not_combined_with_kept_confs(self):
+        sources = ['--upstreams_conf_file_path', self.sources[0], '--sites_available_conf_files_path',
+                   self.sources[1], '--bind_zones_file_location', self.sources[2]]
+        for options in (['--bounded_memory', '--snapshot_file', 'snapshot'],
+                        ['--bounded_memory', '--incremental_state_file', 'state'],
+                        ['--snapshot_file', 'snapshot', '--incremental_state_file', 'state']):
+            with mock.patch('sys.argv', ['generate-services-table'] + sources + options), \
+                    mock.patch('sys.stderr'):
+                self.assertRaises(SystemExit, parse_conf.parse_args)
+        with mock.patch('sys.argv', ['generate-services-table'] + sources + ['--bounded_memory']):
+            self.assertTrue(parse_conf.parse_args().bounded_memory)
+
+    def test_files_are_written_as_rows_are_made(self):
+        made = []
+
+        def rows():
+            for row in parse_server_rows(*self.sources):
+                # the writers still hold the previous row at most, the ones before it are gone
+                gc.collect()
+                self.assertEqual([None] * len(made[:-1]), [_() for _ in made[:-1]])
+                made.append(weakref.ref(row))
+                yield row
+
+        with mock.patch.object(parse_conf.HtmlPrint, 'print_table') as html_print, \
+                mock.patch.object(parse_conf.ConsolePrint, 'print_table') as console_print:
+            print_services_rows(rows(), ('csv', 'json_lines'))
+        html_print.assert_not_called()
+        console_print.assert_not_called()
+
+        self.assertEqual(4, len(made))
+        with open('services_table.csv') as csv_file:
+            self.assertEqual(['domain', 'service_name', 'service_git_url', 'upstream', 'stand', 'host', 'ip', 'port',
+                              'location'], csv_file.readline().strip().split(','))
+            self.assertEqual(4, len(csv_file.readlines()))
+        with open('services_table.jsonl') as json_lines_file:
+            rows = [json.loads(_) for _ in json_lines_file]
+        self.assertEqual(dict(domain='example.com', upstream='backend', stand='int', host='d-app1', ip='10.0.0.1',
+                              port=8080, location='/'),
+                         {_: rows[0][_] for _ in ('domain', 'upstream', 'stand', 'host', 'ip', 'port', 'location')})
+        self.assertEqual(['example.com', 'example.com', 'www.example.com', 'www.example.com'],
+                         [_['domain'] for _ in rows])
+
+    def test_console_and_html_get_all_rows(self):
+        with mock.patch.object(parse_conf.HtmlPrint, 'print_table') as html_print, \
+                mock.patch.object(parse_conf.ConsolePrint, 'print_table') as console_print:
+            print_services_rows(parse_server_rows(*self.sources))
+        self.assertEqual(4, len(html_print.call_args[0][0].rows))
+        self.assertIs(html_print.call_args[0][0], console_print.call_args[0][0])
+        self.assertTrue(os.path.exists('services_table.csv'))
+        self.assertFalse(os.path.exists('services_table.jsonl'))
+
+
+class GitLabStubHandler(BaseHTTPRequestHandler):
+    projects = {
+        '/projects/services%2Ffirst': {'name': 'first', 'web_url': 'https://gitlab.yourltd.com/services/first'},
+        '/projects/services%2Fsecond': {'name': 'second', 'web_url': 'https://gitlab.yourltd.com/services/second'},
+    }
+
+    def do_GET(self):
+        self.server.paths.append(self.path)
+        if self.path == '/projects/services%2Fbroken':
+            self.send_response(500)
+            self.end_headers()
+            return
+
+        project = self.projects.get(self.path)
+        self.send_response(200 if project else 404)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(project or {'message': '404 Project Not Found'}).encode('utf-8'))
+
+    def log_message(self, *args):
+        pass
+
+
+class GitProjectsTest(TempDirMixin, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = HTTPServer(('127.0.0.1', 0), GitLabStubHandler)
+        self.server.paths = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        base_url = 'http://127.0.0.1:{0}'.format(self.server.server_port)
+        for patcher in (mock.patch.dict(parse_conf.config, {'gitlab_base_url': base_url}),
+                        mock.patch.dict(parse_conf.git_projects_cache, clear=True),
+                        mock.patch.dict(parse_conf.git_projects_fetched_at, clear=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.cache_path = os.path.join(self.tmp_dir.name, 'git_projects.json')
+        self.git_projects = ['https://gitlab.yourltd.com/services/first/',
+                             'https://gitlab.yourltd.com/services/second',
+                             'https://gitlab.yourltd.com/services/missing',
+                             'https://gitlab.yourltd.com/services/first',
+                             None]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_projects_are_looked_up_once(self):
+        fetch_git_projects_details(self.git_projects, max_workers=3)
+        self.assertEqual(3, len(self.server.paths))
+
+        self.assertEqual('first', get_git_project_details('https://gitlab.yourltd.com/services/first')['name'])
+        self.assertEqual({'name': '', 'web_url': ''},
+                         get_git_project_details('https://gitlab.yourltd.com/services/missing'))
+        self.assertEqual({'name': '', 'web_url': ''}, get_git_project_details(None))
+        self.assertEqual(3, len(self.server.paths))
+
+    def test_cache_file(self):
+        fetch_git_projects_details(self.git_projects + ['https://gitlab.yourltd.com/services/broken'])
+        save_git_projects_cache(self.cache_path)
+        parse_conf.git_projects_cache.clear()
+        parse_conf.git_projects_fetched_at.clear()
+        self.server.paths = []
+
+        load_git_projects_cache(self.cache_path, ttl=60)
+        fetch_git_projects_details(self.git_projects)
+        self.assertEqual([], self.server.paths)
+        self.assertEqual('second', get_git_project_details('https://gitlab.yourltd.com/services/second')['name'])
+
+        # failed lookups are retried on the next run
+        fetch_git_projects_details(['https://gitlab.yourltd.com/services/broken'])
+        self.assertEqual(['/projects/services%2Fbroken'], self.server.paths)
+
+    def test_expired_cache_file(self):
+        fetch_git_projects_details(self.git_projects)
+        save_git_projects_cache(self.cache_path)
+        parse_conf.git_projects_cache.clear()
+        parse_conf.git_projects_fetched_at.clear()
+        self.server.paths = []
+
+        load_git_projects_cache(self.cache_path, ttl=0)
+        fetch_git_projects_details(self.git_projects)
+        self.assertEqual(3, len(self.server.paths))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,22 @@
+# coding=utf-8
+import re
+import unittest
+
+from services_spec_generator.nginx_conf_parser import patterns
+
+
+class PatternsTest(unittest.TestCase):
+    def test_patterns_are_compiled(self):
+        names = [_ for _ in vars(patterns) if _.isupper()]
+        self.assertIn('UPSTREAM_SERVER', names)
+        for name in names:
+            self.assertIsInstance(getattr(patterns, name), re.Pattern, name)
+
+    def test_context_patterns_are_compiled_once(self):
+        self.assertIs(patterns.context_scanner('upstream'), patterns.context_scanner('upstream'))
+        self.assertIs(patterns.context_start('events'), patterns.context_start('events'))
+        self.assertIsNot(patterns.context_scanner('upstream'), patterns.context_scanner('server'))
+
+
+if __name__ == '__main__':
+    unittest.main()
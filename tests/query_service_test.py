@@ -0,0 +1,152 @@
+# coding=utf-8
+import asyncio
+import json
+import os
+import time
+import unittest
+from unittest import mock
+
+from services_spec_generator.conf_watcher import PollingWatcher
+from services_spec_generator.parse_conf import IncrementalParser
+from services_spec_generator.query_service import QueryService
+from tests.helpers import ZONE, TempDirMixin
+
+
+class QueryServiceTest(TempDirMixin, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.upstreams_path = self._write('backends.conf', """
+        upstream backend {
+            server d-app1.yourltd.com:8080;
+            server 10.0.0.3:8080;
+        }
+        upstream api {
+            server 10.0.0.2:9000;
+        }
+        """)
+        self.site_path = self._write('sites-available/site.conf', """
+        server {
+            listen 80;
+            server_name example.com www.example.com;
+            location / {
+                proxy_pass http://backend;
+            }
+            location ~ ^/api/ {
+                proxy_pass http://api;
+            }
+        }
+        """)
+        self.zone_path = self._write('zone', ZONE + "d-app3      IN      A      10.0.0.3\n")
+        parser = IncrementalParser(self.upstreams_path, os.path.join(self.tmp_dir.name, 'sites-available/*.conf'),
+                                   self.zone_path)
+        self.service = QueryService(parser)
+        self.service.reload()
+
+    def test_find(self):
+        index = self.service.index
+        self.assertEqual(6, len(index.rows))
+        self.assertEqual(['d-app1', 'd-app3'], sorted({_['host'] for _ in index.find(dict(upstream='backend'))}))
+        self.assertEqual(['/', '/'], [_['location'] for _ in index.find(dict(ip='10.0.0.1'))])
+        self.assertEqual(1, len(index.find(dict(domain='www.example.com', port='9000'))))
+        self.assertEqual([], index.find(dict(domain='example.com', host='stage-api', port='8080')))
+        self.assertRaises(ValueError, index.find, {})
+        self.assertRaises(ValueError, index.find, dict(name='x'))
+        self.assertRaises(ValueError, index.find, dict(port='x'))
+        self.assertRaises(ValueError, index.find, dict(git_project=''))
+
+    def test_route(self):
+        route = self.service.index.route('WWW.example.com:80', '/api/v1?x=1')
+        self.assertEqual(('example.com', '~ ^/api/', 'api'), (route['domain'], route['location'], route['upstream']))
+        self.assertEqual(['example.com', 'www.example.com'], sorted(_['domain'] for _ in route['rows']))
+        self.assertEqual('/', self.service.index.route('other.host', '/index.html')['location'])
+        self.assertIsNone(self.service.index.route('example.com', '/', 443))
+
+    def test_answers(self):
+        status, body = self.service.answer('GET', '/rows?upstream=api')
+        self.assertEqual((200, 2), (status, body['count']))
+        self.assertEqual(400, self.service.answer('GET', '/rows?port=x')[0])
+        self.assertEqual(400, self.service.answer('GET', '/rows?self=x')[0])
+        self.assertEqual(400, self.service.answer('GET', '/rows?git_project=')[0])
+        self.assertEqual(400, self.service.answer('GET', '/route')[0])
+        self.assertEqual(400, self.service.answer('GET', '/route?host=example.com&path=')[0])
+        self.assertEqual(404, self.service.answer('GET', '/route?host=example.com&port=443')[0])
+        self.assertEqual(404, self.service.answer('GET', '/tables')[0])
+        self.assertEqual(405, self.service.answer('POST', '/rows')[0])
+        self.assertEqual(dict(rows=6, generation=1), {_: self.service.answer('GET', '/health')[1][_]
+                                                      for _ in ('rows', 'generation')})
+
+    async def _requests(self, port, targets, keep_alive=True):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        responses = []
+        for target in targets:
+            writer.write('GET {0} HTTP/1.1\r\nHost: localhost\r\n{1}\r\n'.format(
+                target, '' if keep_alive else 'Connection: close\r\n').encode())
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode().strip()
+                if not line:
+                    break
+                name, _, value = line.partition(':')
+                headers[name.lower()] = value.strip()
+            body = await reader.readexactly(int(headers['content-length']))
+            responses.append((status, json.loads(body)))
+        writer.close()
+        return responses
+
+    def test_server_and_reload(self):
+        async def run():
+            server = await self.service.start('127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            watch = asyncio.ensure_future(self.service.watch(PollingWatcher(0.01), debounce=0.05))
+            try:
+                responses = await self._requests(port, ['/rows?domain=example.com', '/rows?upstream=api'] * 2)
+                self.assertEqual([200] * 4, [_[0] for _ in responses])
+                self.assertEqual([3, 2, 3, 2], [_[1]['count'] for _ in responses])
+
+                await asyncio.sleep(0.05)
+                self._write('backends.conf', open(self.upstreams_path).read().replace('9000', '9001'))
+                deadline = time.monotonic() + 5
+                while self.service.index.generation == 1 and time.monotonic() < deadline:
+                    # the previous table is served until the new one is swapped in
+                    (status, body), = await self._requests(port, ['/rows?upstream=api'], keep_alive=False)
+                    self.assertEqual(200, status)
+                    await asyncio.sleep(0.02)
+                (_, body), = await self._requests(port, ['/rows?upstream=api'])
+                self.assertEqual([9001, 9001], [_['port'] for _ in body['rows']])
+
+                self._write('sites-available/site.conf', 'server { listen 80; location / {')
+                while self.service.reload_error is None and time.monotonic() < deadline:
+                    await asyncio.sleep(0.02)
+                (_, health), (_, body) = await self._requests(port, ['/health', '/rows?upstream=api'])
+                self.assertEqual(2, health['generation'])
+                self.assertIsNotNone(health['reload_error'])
+                self.assertEqual(2, body['count'])
+            finally:
+                watch.cancel()
+                server.close()
+                await server.wait_closed()
+
+        asyncio.run(run())
+
+    def test_server_errors(self):
+        async def run():
+            server = await self.service.start('127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                with mock.patch.object(self.service, 'answer', side_effect=RuntimeError), \
+                        self.assertLogs('services_spec_generator.query_service', 'ERROR'):
+                    (status, body), = await self._requests(port, ['/rows?upstream=api'])
+                self.assertEqual((500, 'Internal error'), (status, body['error']))
+                (status, body), = await self._requests(port, ['/rows?upstream=api'])
+                self.assertEqual((200, 2), (status, body['count']))
+            finally:
+                server.close()
+                await server.wait_closed()
+
+        asyncio.run(run())
+
+
+if __name__ == '__main__':
+    unittest.main()
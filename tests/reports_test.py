@@ -0,0 +1,64 @@
+# coding=utf-8
+import json
+import os
+import tempfile
+import unittest
+
+from services_spec_generator.parse_conf import DataTable, RowItem
+from services_spec_generator.reports import make_reports, write_reports
+
+
+class ReportsTest(unittest.TestCase):
+    def setUp(self):
+        self.table = DataTable(RowItem(*_) for _ in [
+            ['a.example.com', 'first', None, 'backend', 'int', 'd-app1', '10.0.0.1', 8080, '/'],
+            ['a.example.com', 'first', None, 'backend', 'int', 'd-app2', '10.0.0.2', 8080, '/'],
+            ['b.example.com', 'first', None, 'backend', 'int', 'd-app1', '10.0.0.1', 8080, '/'],
+            ['a.example.com', 'second', None, 'api', 'prod', 'prod-app1', '10.0.1.1', 9000, '/v1'],
+            ['a.example.com', 'second', None, 'api', 'prod', 'prod-app1', '10.0.1.1', 9001, '/v1'],
+            ['a.example.com', 'second', None, 'api', None, 'prod-app1', '10.0.1.1', 9001, '/v2'],
+        ])
+
+    def test_reports(self):
+        reports = make_reports(self.table)
+        self.assertEqual(['hosts_per_service', 'ports_per_stand', 'locations_per_domain', 'upstream_fan_out'],
+                         list(reports))
+
+        self.assertEqual([('first', 2, 3, 'd-app1, d-app2'), ('second', 1, 3, 'prod-app1')],
+                         [tuple(_) for _ in reports['hosts_per_service'].itertuples(index=False)])
+        self.assertEqual([('int', 1, 3, '8080'), ('prod', 2, 2, '9000, 9001'), (None, 1, 1, '9001')],
+                         [tuple(_) for _ in reports['ports_per_stand'].itertuples(index=False)])
+        self.assertEqual([('a.example.com', 3, 5, '/, /v1, /v2'), ('b.example.com', 1, 1, '/')],
+                         [tuple(_) for _ in reports['locations_per_domain'].itertuples(index=False)])
+        self.assertEqual([('api', 2, 3, 'prod-app1:9000, prod-app1:9001'),
+                          ('backend', 2, 3, 'd-app1:8080, d-app2:8080')],
+                         [tuple(_) for _ in reports['upstream_fan_out'].itertuples(index=False)])
+        self.assertEqual(['upstream', 'host:port', 'rows', 'host:port_values'],
+                         list(reports['upstream_fan_out'].columns))
+
+    def test_empty_table(self):
+        reports = make_reports(DataTable())
+        self.assertTrue(all(len(_) == 0 for _ in reports.values()))
+
+    def test_formats(self):
+        reports = make_reports(self.table)
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'report')
+            for report_format in ('html', 'csv', 'json_lines'):
+                write_reports(reports, report_format, file_name)
+
+            with open(file_name + '.jsonl') as json_lines_file:
+                lines = [json.loads(_) for _ in json_lines_file]
+            self.assertEqual(dict(report='ports_per_stand', group='prod', distinct=2, rows=2, values=['9000', '9001']),
+                             lines[3])
+            with open(file_name + '.csv') as csv_file:
+                self.assertEqual(['report,group,distinct,rows,values',
+                                  'hosts_per_service,first,2,3,"d-app1, d-app2"'], csv_file.read().splitlines()[:2])
+            with open(file_name + '.html') as html_file:
+                self.assertEqual(4, html_file.read().count('<table'))
+
+        self.assertRaises(ValueError, write_reports, reports, 'xml')
+
+
+if __name__ == '__main__':
+    unittest.main()
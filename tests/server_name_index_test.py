@@ -0,0 +1,129 @@
+# coding=utf-8
+import unittest
+
+from services_spec_generator.nginx_conf_parser.http_context import HttpContext
+from services_spec_generator.nginx_conf_parser.server_name_index import ServerNameIndex, normalize_host, \
+    split_listen
+
+
+class ServerNameIndexTest(unittest.TestCase):
+    def setUp(self):
+        http = HttpContext(r"""
+        http {
+            server {
+                listen 80;
+                server_name first.example.com;
+                location / { proxy_pass http://first; }
+            }
+            server {
+                listen 80;
+                listen 443 ssl;
+                server_name example.com www.example.com;
+                location / { proxy_pass http://exact; }
+            }
+            server {
+                listen 80;
+                server_name *.example.com;
+                location / { proxy_pass http://leading; }
+            }
+            server {
+                listen 80;
+                server_name *.api.example.com;
+                location / { proxy_pass http://longer_leading; }
+            }
+            server {
+                listen 80;
+                server_name mail.*;
+                location / { proxy_pass http://trailing; }
+            }
+            server {
+                listen 80 default_server;
+                server_name .example.org "~^(?<user>\w+)\.example\.net$";
+                location / { proxy_pass http://default; }
+            }
+            server {
+                listen 80;
+                server_name ~^(www|api)-\d+\.example\.net$ ~^\w+\.example\.net$;
+                location / { proxy_pass http://second_regex; }
+            }
+            server {
+                listen 127.0.0.1:8080;
+                server_name local.example.com;
+                location / { proxy_pass http://local; }
+            }
+        }
+        """)
+        self.index = ServerNameIndex.from_http(http)
+
+    def _resolve(self, host, port=80, address=None):
+        server = self.index.resolve(host, port, address)
+        return server.location[0].proxy_pass_upstream if server is not None else None
+
+    def test_tiers(self):
+        self.assertEqual('exact', self._resolve('www.example.com'))
+        self.assertEqual('exact', self._resolve('Example.COM.'))
+        self.assertEqual('leading', self._resolve('shop.example.com'))
+        self.assertEqual('longer_leading', self._resolve('v1.api.example.com'))
+        # a leading wildcard is tried before a trailing one
+        self.assertEqual('leading', self._resolve('mail.example.com'))
+        self.assertEqual('trailing', self._resolve('mail.test'))
+        self.assertEqual('trailing', self._resolve('mail.example.io'))
+        self.assertEqual('default', self._resolve('example.org'))
+        self.assertEqual('default', self._resolve('a.example.org'))
+
+    def test_regexes_in_order(self):
+        self.assertEqual('default', self._resolve('www1.example.net'))
+        self.assertEqual('default', self._resolve('www1.example.net:80'))
+        # the first matching regex in configuration order wins
+        self.assertEqual('second_regex', self._resolve('API-2.example.net'))
+        self.assertEqual('default', self._resolve('a.b.example.net'))
+
+    def test_anchored_alternation(self):
+        index = ServerNameIndex.from_http(HttpContext(r"""
+        http {
+            server {
+                listen 80;
+                server_name "~^a\.example\.net|\.b\.example\.net$";
+                location / { proxy_pass http://alt; }
+            }
+            server {
+                listen 80;
+                server_name ~\.example\.net$;
+                location / { proxy_pass http://other; }
+            }
+        }
+        """))
+        self.assertEqual('alt', index.resolve('x.b.example.net', 80).location[0].proxy_pass_upstream)
+        self.assertEqual('alt', index.resolve('a.example.net', 80).location[0].proxy_pass_upstream)
+        self.assertEqual('other', index.resolve('xa.example.net', 80).location[0].proxy_pass_upstream)
+
+    def test_default_server(self):
+        self.assertEqual('default', self._resolve('unknown.host'))
+        self.assertEqual('default', self._resolve(''))
+        # the first server of a port without default_server
+        self.assertEqual('exact', self._resolve('unknown.host', 443))
+        self.assertIsNone(self._resolve('example.com', 8000))
+
+    def test_listen_address(self):
+        self.assertEqual('local', self._resolve('unknown.host', 8080, '127.0.0.1'))
+        self.assertIsNone(self._resolve('local.example.com', 8080, '10.0.0.1'))
+        self.assertEqual('exact', self._resolve('example.com', 80, '10.0.0.1'))
+
+    def test_resolve_many(self):
+        servers = self.index.resolve_many(_ for _ in ['example.com', 'shop.example.com', 'example.com'])
+        self.assertEqual(['exact', 'leading', 'exact'], [_.location[0].proxy_pass_upstream for _ in servers])
+        self.assertEqual([None, None], self.index.resolve_many(['a', 'b'], 9999))
+
+    def test_split_listen(self):
+        self.assertEqual(('*', 80), split_listen('*:80 | *:8000'))
+        self.assertEqual(('*', 443), split_listen('443'))
+        self.assertEqual(('*', 80), split_listen('0.0.0.0'))
+        self.assertEqual(('127.0.0.1', 8080), split_listen('127.0.0.1:8080'))
+        self.assertEqual(('[::1]', 80), split_listen('[::1]'))
+        self.assertEqual(('*', 443), split_listen('[::]:443'))
+        self.assertIsNone(split_listen('unix:/var/run/nginx.sock'))
+        self.assertEqual('[::1]', normalize_host('[::1]:8080'))
+
+
+if __name__ == '__main__':
+    unittest.main()
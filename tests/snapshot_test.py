@@ -0,0 +1,99 @@
+# coding=utf-8
+import os
+import struct
+import unittest
+from unittest import mock
+
+from services_spec_generator import snapshot as snapshot_module
+from services_spec_generator.parse_conf import make_http_rows, parse_server_rows
+from services_spec_generator.snapshot import SNAPSHOT_HEADER, Snapshot, load_snapshot, read_snapshot, \
+    write_snapshot
+from tests.helpers import ZONE, TempDirMixin
+
+
+class SnapshotTest(TempDirMixin, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.sources = (self._write('backends.conf', """
+            upstream backend {
+                # git: https://gitlab.yourltd.com/services/backend
+                server d-app1.yourltd.com:8080;
+                server 10.0.0.2:8081;
+            }
+            """), os.path.join(self.tmp_dir.name, 'sites', '*.conf'), self._write('zone', ZONE))
+        self._write('sites/a.conf', """
+            server {
+                listen 80;
+                server_name example.com www.example.com;
+                location / {
+                    include %s/proxy.conf;
+                    limit_except GET {
+                        deny all;
+                    }
+                }
+            }
+            """ % self.tmp_dir.name)
+        self._write('proxy.conf', 'proxy_pass http://backend;')
+        self.snapshot_path = os.path.join(self.tmp_dir.name, 'services_table.snapshot')
+
+    def test_round_trip(self):
+        write_snapshot(Snapshot.make(*self.sources), self.snapshot_path)
+        snapshot = read_snapshot(self.snapshot_path)
+
+        self.assertEqual(self.sources, snapshot.sources)
+        location = snapshot.http_context.servers[0].location[0]
+        self.assertEqual('backend', location.proxy_pass_upstream)
+        self.assertEqual(['all'], location.limit_except['GET'].deny)
+        self.assertEqual('https://gitlab.yourltd.com/services/backend', snapshot.http_context.upstreams[0].git_project)
+        self.assertEqual('10.0.0.2', snapshot.map_host['stage-api'])
+        # the zone index arrays are used from the mapped file
+        self.assertIsInstance(snapshot.host_index._host_ip, memoryview)
+
+        self.assertEqual([_.to_list() for _ in parse_server_rows(*self.sources)],
+                         [_.to_list() for _ in make_http_rows(snapshot.http_context, snapshot.map_ips,
+                                                              snapshot.map_host)])
+
+    def test_round_trip_without_out_of_band_buffers(self):
+        with mock.patch.object(snapshot_module, '_PROTOCOL', 4):
+            write_snapshot(Snapshot.make(*self.sources), self.snapshot_path)
+            snapshot = read_snapshot(self.snapshot_path)
+        self.assertEqual('10.0.0.2', snapshot.map_host['stage-api'])
+        self.assertEqual(['stage-api'], snapshot.map_ips['10.0.0.2'])
+
+        write_snapshot(Snapshot.make(*self.sources), self.snapshot_path)
+        with mock.patch.object(snapshot_module, '_PROTOCOL', 4):
+            self.assertRaises(ValueError, read_snapshot, self.snapshot_path)
+
+    def test_other_versions_are_refused(self):
+        write_snapshot(Snapshot.make(*self.sources), self.snapshot_path)
+        with open(self.snapshot_path, 'r+b') as f:
+            f.seek(struct.calcsize('<8s'))
+            f.write(struct.pack('<H', 0))
+        self.assertRaises(ValueError, read_snapshot, self.snapshot_path)
+
+        self._write('services_table.snapshot', 'not a snapshot' * 10)
+        self.assertRaises(ValueError, read_snapshot, self.snapshot_path)
+        with open(self.snapshot_path, 'wb') as f:
+            f.write(b'\0' * (SNAPSHOT_HEADER.size - 1))
+        self.assertRaises(ValueError, read_snapshot, self.snapshot_path)
+
+    def test_fresh_snapshot_is_loaded(self):
+        load_snapshot(self.snapshot_path, *self.sources)
+        with mock.patch.object(Snapshot, 'make', wraps=Snapshot.make) as make:
+            snapshot = load_snapshot(self.snapshot_path, *self.sources)
+            make.assert_not_called()
+
+            self.assertEqual(1, len(snapshot.http_context.servers))
+            self._write('sites/b.conf', 'server { server_name b.example.com; }')
+            snapshot = load_snapshot(self.snapshot_path, *self.sources)
+            self.assertEqual(2, len(snapshot.http_context.servers))
+
+            # an included file changed
+            self._write('proxy.conf', 'proxy_pass http://other;')
+            snapshot = load_snapshot(self.snapshot_path, *self.sources)
+            self.assertEqual('other', snapshot.http_context.servers[0].location[0].proxy_pass_upstream)
+        self.assertEqual(2, make.call_count)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+# coding=utf-8
+import unittest
+
+from services_spec_generator.nginx_conf_parser.tokenizer import UNPARSED, Source, parse, parse_block, tokenize, unwrap
+
+
+class TokenizerTest(unittest.TestCase):
+    def setUp(self):
+        self.content_string = """
+        http {
+            upstream backend {
+                # git: https://gitlab.example.com/group/project
+                server 10.0.0.1:8080 weight=5;
+            }
+            server {
+                server_name "example.com" www.example.com;
+                location ~ \\.php$ {
+                    proxy_pass http://backend;
+                }
+            }
+        }
+        """
+        self.root = parse(self.content_string)
+
+    def test_tokenize(self):
+        tokens = [(kind, value) for kind, value, _ in tokenize('auth_jwt "closed; site" token=$a;')]
+        self.assertEqual([('word', 'auth_jwt'), ('word', '"closed; site"'), ('word', 'token=$a'), ('punct', ';')],
+                         tokens)
+
+    def test_tokenize_variable_braces(self):
+        tokens = [value for _, value, _ in tokenize('set $a ${b}c;')]
+        self.assertEqual(['set', '$a', '${b}c', ';'], tokens)
+
+    def test_blocks(self):
+        http = unwrap(self.root, 'http')
+        self.assertEqual('http', http.name)
+        self.assertEqual(['upstream', 'server'], [_.name for _ in http.children])
+
+        upstream, server = http.children
+        self.assertEqual(['backend'], upstream.args)
+        self.assertEqual('#', upstream.children[0].name)
+        self.assertEqual(['git: https://gitlab.example.com/group/project'], upstream.children[0].args)
+        self.assertEqual(['10.0.0.1:8080', 'weight=5'], upstream.children[1].args)
+
+        self.assertEqual(['"example.com"', 'www.example.com'], server.children[0].args)
+        self.assertEqual(['~', '\\.php$'], server.children[1].args)
+        self.assertIsNone(server.children[1].children[0].children)
+
+    def test_spans(self):
+        upstream = unwrap(self.root, 'http').children[0]
+        self.assertIn('server 10.0.0.1:8080 weight=5;', upstream.text)
+        self.assertNotIn('{', upstream.text)
+        self.assertEqual('server 10.0.0.1:8080 weight=5;', upstream.children[1].text)
+
+    def test_unwrap_missing_block(self):
+        root = parse('listen 80;')
+        self.assertIs(root, unwrap(root, 'server'))
+
+    def test_unbalanced_braces(self):
+        self.assertRaises(ValueError, parse, 'server { listen 80;')
+        self.assertRaises(ValueError, parse, 'listen 80; }')
+        self.assertRaises(ValueError, parse, 'server_name "example.com;')
+
+    def test_source(self):
+        content = self.content_string.replace('www.example.com', 'www.пример.рф') + '# комментарий\nuser nginx;\n'
+        root = parse(Source(None, content.encode('utf-8')))
+        expected = parse(content)
+
+        def nodes(node):
+            return [(node.name, node.args, node.text)] + [_ for child in node.children or [] for _ in nodes(child)]
+        self.assertEqual(nodes(expected), nodes(root))
+        self.assertIsInstance(root.children[0].children[0].children[1].args[0], str)
+
+    def test_lazy_blocks(self):
+        http = unwrap(parse(self.content_string, lazy=('server',)), 'http')
+        upstream, server = http.children
+        self.assertEqual(2, len(upstream.children))
+        self.assertIs(UNPARSED, server.children)
+        self.assertIn('location ~ \\.php$', server.text)
+
+        children = parse_block(server)
+        self.assertEqual(['server_name', 'location'], [_.name for _ in children])
+        self.assertEqual('proxy_pass', children[1].children[0].name)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+# coding=utf-8
+import unittest
+
+from services_spec_generator.nginx_conf_parser.utils import extract_context, extract_context_spans
+
+
+class UtilsTest(unittest.TestCase):
+    def setUp(self):
+        self.content_string = """
+        http {
+            upstream backend {
+                server 10.0.0.1:8080;
+            }
+            server {
+                server_name example.com;
+                location / {
+                    proxy_pass http://backend;
+                }
+            }
+            server {
+                listen 8080;
+            }
+        }
+        """
+
+    def test_extract_context(self):
+        extracted = extract_context(self.content_string, 'http')
+        self.assertTrue(extracted.startswith('http {'))
+        self.assertTrue(extracted.endswith('}'))
+        self.assertNotIn('\n', extracted)
+
+        self.assertEqual('', extract_context(self.content_string, 'events'))
+        self.assertRaises(TypeError, extract_context, None, 'http')
+
+    def test_extract_context_spans(self):
+        spans = extract_context_spans(self.content_string, 'server')
+        self.assertEqual(2, len(spans))
+
+        first, second = [self.content_string[start:end] for start, end in spans]
+        self.assertTrue(first.startswith('server {'))
+        self.assertIn('location / {', first)
+        self.assertTrue(first.endswith('}'))
+        self.assertEqual('server {\n                listen 8080;\n            }', second)
+
+    def test_extract_context_spans_with_arguments(self):
+        spans = extract_context_spans(self.content_string, 'location')
+        self.assertEqual(1, len(spans))
+        self.assertTrue(self.content_string[spans[0][0]:].startswith('location / {'))
+
+        self.assertEqual([], extract_context_spans('server_name example.com;', 'server'))
+
+
+if __name__ == '__main__':
+    unittest.main()